@@ -0,0 +1,201 @@
+# backend/app/config.py
+import os
+from typing import List, Optional, Tuple, Union
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _int_env(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _float_env(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def parse_endpoints(value: Optional[Union[str, List[str]]]) -> List[str]:
+    """Split a comma-separated RPC URL list (as used in .env) into endpoints."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [endpoint.strip() for endpoint in value if endpoint.strip()]
+
+
+def parse_scales(value: str) -> List[float]:
+    """Comma-separated positive resize factors, e.g. "0.5,0.75,2"."""
+    scales = [float(part) for part in value.split(",") if part.strip()]
+    if any(scale <= 0 for scale in scales):
+        raise ValueError("Scales must be positive")
+    return scales
+
+
+def parse_offsets(value: str) -> List[Tuple[int, int]]:
+    """Comma-separated dy:dx crop offsets, e.g. "0:0,16:0"."""
+    offsets = []
+    for part in value.split(","):
+        if part.strip():
+            dy, dx = part.split(":")
+            offsets.append((int(dy), int(dx)))
+    if any(dy < 0 or dx < 0 for dy, dx in offsets):
+        raise ValueError("Offsets must not be negative")
+    return offsets
+
+
+def parse_chains(value: str) -> List[str]:
+    """One chain or several comma-separated ones, e.g. "ETH,SOL": upper-cased, in order, without repeats."""
+    chains = []
+    for part in value.split(","):
+        chain = part.strip().upper()
+        if chain and chain not in chains:
+            chains.append(chain)
+    if not chains:
+        raise ValueError("No chain given")
+    return chains
+
+
+def _chains_env(name: str, default: str) -> List[str]:
+    value = os.getenv(name, default)
+    return parse_chains(value) if value.replace(",", "").strip() else []
+
+
+# Image processing pool (embed / extract run in worker processes, never on the event loop)
+IMAGE_POOL_WORKERS = _int_env("IMAGE_POOL_WORKERS", os.cpu_count() or 1)
+# Jobs allowed to wait for a free worker before new requests get a 429
+IMAGE_POOL_QUEUE = _int_env("IMAGE_POOL_QUEUE", 2 * IMAGE_POOL_WORKERS)
+# Seconds a single embed/extract job may take before the request gets a 504
+IMAGE_JOB_TIMEOUT = _float_env("IMAGE_JOB_TIMEOUT", 60.0)
+
+# Check of the returned image after embedding: "none", "sampled" (read back a random subset of the
+# watermark bits and report their error rate) or "full" (extract the whole watermark again)
+WATERMARK_VERIFY = os.getenv("WATERMARK_VERIFY", "sampled")
+# Watermark bits (of 128x128) read back in "sampled" mode
+WATERMARK_VERIFY_BITS = _int_env("WATERMARK_VERIFY_BITS", 1024)
+
+# Tiled watermarking for very large images: images of at least TILE_MIN_PIXELS pixels (0: never) are
+# embedded / extracted in stripes of about TILE_STRIPE_PIXELS pixels, TILE_THREADS at a time, with the
+# decoded and watermarked images in memory-mapped temporary files (under UPLOAD_SPOOL_DIR). The output
+# is identical; peak memory no longer grows with the float working arrays of the whole image.
+TILE_MIN_PIXELS = _int_env("TILE_MIN_PIXELS", 16_000_000)
+TILE_STRIPE_PIXELS = _int_env("TILE_STRIPE_PIXELS", 1024 * 1024)
+TILE_THREADS = _int_env("TILE_THREADS", os.cpu_count() or 1)
+
+# Codec of the watermarked image returned by /upload: "jpeg", "png" or "webp"
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "jpeg")
+# JPEG / WebP quality (OpenCV's JPEG default; above 100 makes WebP lossless)
+OUTPUT_QUALITY = _int_env("OUTPUT_QUALITY", 95)
+
+# Robust extraction (/workspace/decode with robust=true) for resized / cropped copies
+# Factors an image may have been resized by since embedding, tried when it does not decode as-is
+EXTRACT_SCALES = os.getenv("EXTRACT_SCALES", "0.5,0.75,0.8,1.25,1.5,2")
+# dy:dx crop offsets (pixels of the received image) tried with every scale
+EXTRACT_OFFSETS = os.getenv("EXTRACT_OFFSETS", "0:0")
+# Seconds the hypothesis search may take before giving up
+EXTRACT_BUDGET = _float_env("EXTRACT_BUDGET", 20.0)
+# Hypotheses tried at once inside a worker
+EXTRACT_THREADS = _int_env("EXTRACT_THREADS", min(4, os.cpu_count() or 1))
+
+# Blockchain clients (SEPOLIA_RPC / SOLANA_DEVNET_RPC may list several comma-separated endpoints)
+# Chains this instance registers on, e.g. "ETH,SOL". A chain's SDK (web3 / solana) is only imported
+# when it is listed; leave empty for instances that only serve decode requests. Other names stop start-up
+CHAINS = _chains_env("CHAINS", "ETH,SOL")
+# Seconds between background RPC health checks; failover happens there instead of per request
+CHAIN_HEALTH_INTERVAL = _float_env("CHAIN_HEALTH_INTERVAL", 30.0)
+# Keep-alive HTTP connections kept per Ethereum RPC endpoint
+RPC_POOL_SIZE = _int_env("RPC_POOL_SIZE", 10)
+
+# Chain ID signed into Ethereum transactions: Sepolia, or 31337 for a local Hardhat node
+ETH_CHAIN_ID = _int_env("ETH_CHAIN_ID", 11155111)
+
+# Ethereum registration batching through ImageRegistry.batchRegister
+# Milliseconds to collect hashes before sending a batch; 0 sends one registerImage per upload
+ETH_BATCH_WINDOW_MS = _int_env("ETH_BATCH_WINDOW_MS", 2000)
+# Hashes per batchRegister transaction
+ETH_BATCH_MAX_SIZE = _int_env("ETH_BATCH_MAX_SIZE", 64)
+# Seconds to wait for a batch receipt before reporting hashes as pending
+ETH_RECEIPT_TIMEOUT = _float_env("ETH_RECEIPT_TIMEOUT", 120.0)
+# batchRegister transactions that may be pending at once (nonces are allocated locally)
+ETH_MAX_IN_FLIGHT = _int_env("ETH_MAX_IN_FLIGHT", 4)
+# Seconds a cached gas estimate is reused for registerImage calls (batchRegister is estimated per batch)
+ETH_GAS_CACHE_TTL = _float_env("ETH_GAS_CACHE_TTL", 600.0)
+
+# Solana registration
+# Milliseconds to collect hashes before packing them into as few transactions as possible; 0 disables
+SOL_BATCH_WINDOW_MS = _int_env("SOL_BATCH_WINDOW_MS", 2000)
+# Hashes collected per batch (split across transactions by size / compute limits)
+SOL_BATCH_MAX_SIZE = _int_env("SOL_BATCH_MAX_SIZE", 64)
+# "async": return once sent and track confirmation in the background; "wait": block until confirmed
+SOL_CONFIRM_MODE = os.getenv("SOL_CONFIRM_MODE", "async")
+SOL_SKIP_PREFLIGHT = os.getenv("SOL_SKIP_PREFLIGHT", "false").lower() == "true"
+# Compute units budgeted per register_image instruction when packing a transaction
+SOL_CU_PER_REGISTER = _int_env("SOL_CU_PER_REGISTER", 50000)
+
+# Upload ingestion limits, checked while streaming and from the image header before decoding
+UPLOAD_MIN_BYTES = _int_env("UPLOAD_MIN_BYTES", 1024 * 1024)
+UPLOAD_MAX_BYTES = _int_env("UPLOAD_MAX_BYTES", 50 * 1024 * 1024)
+UPLOAD_MAX_PIXELS = _int_env("UPLOAD_MAX_PIXELS", 50_000_000)
+# Uploads larger than this are spooled to disk and handed to workers by path
+UPLOAD_SPOOL_BYTES = _int_env("UPLOAD_SPOOL_BYTES", 8 * 1024 * 1024)
+UPLOAD_CHUNK_BYTES = _int_env("UPLOAD_CHUNK_BYTES", 1024 * 1024)
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+
+# Upload jobs (POST /upload queues a job, GET /jobs/{id} reports it)
+# Directory for the job database, queued uploads and job results
+DATA_DIR = os.getenv("DATA_DIR", "data")
+# Jobs processed at once; most of a job is waiting on RPC, so this can exceed the image workers
+JOB_WORKERS = _int_env("JOB_WORKERS", 32)
+JOB_POLL_INTERVAL = _float_env("JOB_POLL_INTERVAL", 1.0)
+
+# Local index of on-chain registrations (GET /registry/...), followed in the background
+# Seconds between syncs; 0 disables the indexer
+REGISTRY_SYNC_INTERVAL = _float_env("REGISTRY_SYNC_INTERVAL", 15.0)
+# Block the ImageRegistry contract was deployed in; the ETH backfill starts there
+ETH_INDEX_START_BLOCK = _int_env("ETH_INDEX_START_BLOCK", 0)
+# Blocks per eth_getLogs call
+ETH_INDEX_BATCH_BLOCKS = _int_env("ETH_INDEX_BATCH_BLOCKS", 2000)
+# Deepest ETH reorg that can be rolled back, in index batches
+ETH_INDEX_REORG_DEPTH = _int_env("ETH_INDEX_REORG_DEPTH", 64)
+
+# In-memory Bloom filter of registered hashes (the duplicate pre-check of uploads)
+REGISTRY_BLOOM_CAPACITY = _int_env("REGISTRY_BLOOM_CAPACITY", 1_000_000)
+REGISTRY_BLOOM_ERROR_RATE = _float_env("REGISTRY_BLOOM_ERROR_RATE", 0.001)
+
+# Near-duplicate search (POST /registry/similar): default and largest pHash distance, in bits of 64
+PHASH_MAX_DISTANCE = _int_env("PHASH_MAX_DISTANCE", 10)
+PHASH_MAX_DISTANCE_LIMIT = _int_env("PHASH_MAX_DISTANCE_LIMIT", 12)
+
+# Result images, stored by SHA-256 and served from /blobs/{sha256}
+BLOB_DIR = os.getenv("BLOB_DIR", os.path.join(DATA_DIR, "blobs"))
+
+# Batch uploads (/upload/batch): many images or one zip / tar archive per request
+BATCH_MAX_FILES = _int_env("BATCH_MAX_FILES", 500)
+BATCH_MAX_BYTES = _int_env("BATCH_MAX_BYTES", 2 * 1024 * 1024 * 1024)
+# Images of one batch being registered / embedded at once (each holds its upload until done)
+BATCH_CONCURRENCY = _int_env("BATCH_CONCURRENCY", 16)
+
+# Registration on several chains at once (chain=ETH,SOL): each chain has its own deadline and retries
+# Watermark link for multi-chain uploads: <PROOF_BASE_URL>?ETH=<tx>&SOL=<tx>, e.g.
+# https://pixelproof.example/api/v1/proof. It is embedded in the images for good, so there is no default:
+# multi-chain uploads are rejected until it is set
+PROOF_BASE_URL = os.getenv("PROOF_BASE_URL") or None
+# Seconds a chain's registration may take before it is reported as a 504 for that chain (queued jobs
+# report it as pending and keep waiting: the transaction may already be out)
+REGISTER_TIMEOUTS = {
+    "ETH": _float_env("ETH_REGISTER_TIMEOUT", ETH_RECEIPT_TIMEOUT + 30),
+    "SOL": _float_env("SOL_REGISTER_TIMEOUT", 60.0),
+}
+# Retries of a registration whose chain is unavailable (503), with jittered exponential backoff
+REGISTER_RETRIES = _int_env("REGISTER_RETRIES", 3)
+REGISTER_BACKOFF = _float_env("REGISTER_BACKOFF", 0.5)
+
+# Observability: GET /metrics is always served. Slow-request profiling is opt-in:
+# requests taking at least PROFILE_SLOW_REQUESTS seconds get their sampled stacks written to
+# PROFILE_DIR (0 disables). PROFILE_SAMPLE_RATE is the fraction of requests sampled at all.
+PROFILE_SLOW_REQUESTS = _float_env("PROFILE_SLOW_REQUESTS", 0.0)
+PROFILE_SAMPLE_RATE = _float_env("PROFILE_SAMPLE_RATE", 0.1)
+# Seconds between stack samples of a profiled request
+PROFILE_INTERVAL = _float_env("PROFILE_INTERVAL", 0.01)
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
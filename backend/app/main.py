@@ -1,11 +1,130 @@
 # backend/app/main.py
-from fastapi import FastAPI
+import asyncio
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from routers import images  # 根据实际结构调整导入路径
+from fastapi.responses import JSONResponse
+import config
+from functools import partial
+from routers import blobs, images, jobs, monitoring, registry  # 根据实际结构调整导入路径
+from services.ImagePool import ImagePool
+from services.ChainServices import ChainServices
+from services.RegistrationBatcher import RegistrationBatcher
+from services.JobQueue import JobQueue
+from services.BlobStore import BlobStore
+from services.RegistryIndex import RegistryIndex
+from utils import metrics
+from utils.profiler import SamplingProfiler
+
+
+# 链 SDK（web3 / solana）很重，只在创建该链的客户端时才导入
+def create_eth_service():
+    from services.EthService import EthService
+    return EthService(pool_size=config.RPC_POOL_SIZE, receipt_timeout=config.ETH_RECEIPT_TIMEOUT,
+                      gas_cache_ttl=config.ETH_GAS_CACHE_TTL, chain_id=config.ETH_CHAIN_ID)
+
+
+def create_sol_service():
+    from services.SolService import SolService
+    return SolService(confirm_mode=config.SOL_CONFIRM_MODE, skip_preflight=config.SOL_SKIP_PREFLIGHT,
+                      cu_per_register=config.SOL_CU_PER_REGISTER)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动时预热图片处理进程池（每个 worker 先跑一遍小图），关闭时等待正在运行的任务结束
+    image_pool = ImagePool(workers=config.IMAGE_POOL_WORKERS,
+                           max_queue=config.IMAGE_POOL_QUEUE,
+                           timeout=config.IMAGE_JOB_TIMEOUT)
+    app.state.image_pool = image_pool
+
+    # 区块链客户端只创建一次，由所有请求共享；后台定时做健康检查和故障切换
+    # 只创建 CHAINS 中启用的链；只做解码的实例可以不加载任何链 SDK
+    factories = {"ETH": create_eth_service, "SOL": create_sol_service}
+    # 配置错误的链直接拒绝启动，而不是启动后对该链的上传返回误导性的错误
+    unknown = [chain for chain in config.CHAINS if chain not in factories]
+    if unknown:
+        raise ValueError(f"Unknown chain in CHAINS: {', '.join(unknown)} (supported: {', '.join(factories)})")
+    if len(config.CHAINS) > 1 and not config.PROOF_BASE_URL:
+        print("Warning: PROOF_BASE_URL is not set; multi-chain uploads will be rejected")
+    chain_services = ChainServices({chain: factories[chain] for chain in config.CHAINS},
+                                   health_interval=config.CHAIN_HEALTH_INTERVAL)
+    # 进程池预热和链客户端连接同时进行
+    await asyncio.gather(image_pool.start(), asyncio.to_thread(chain_services.start))
+    app.state.chain_services = chain_services
+    health_task = asyncio.create_task(chain_services.run_health_checks())
+
+    # 注册按时间窗口攒批：ETH 一笔 batchRegister 交易，SOL 一笔交易打包多条指令
+    app.state.batchers = {}
+    if config.ETH_BATCH_WINDOW_MS > 0 and "ETH" in chain_services.factories:
+        app.state.batchers["ETH"] = RegistrationBatcher(
+            lambda hashes: chain_services.get("ETH").register_batch(hashes),
+            window=config.ETH_BATCH_WINDOW_MS / 1000,
+            max_size=config.ETH_BATCH_MAX_SIZE,
+            max_in_flight=config.ETH_MAX_IN_FLIGHT)
+    if config.SOL_BATCH_WINDOW_MS > 0 and "SOL" in chain_services.factories:
+        app.state.batchers["SOL"] = RegistrationBatcher(
+            lambda hashes: chain_services.get("SOL").register_batch(hashes),
+            window=config.SOL_BATCH_WINDOW_MS / 1000,
+            max_size=config.SOL_BATCH_MAX_SIZE)
+
+    # 链上登记记录的本地索引：先回填历史事件，再增量同步（处理 ETH 重组）
+    registry_index = RegistryIndex(os.path.join(config.DATA_DIR, "registry.db"),
+                                   eth_start_block=config.ETH_INDEX_START_BLOCK,
+                                   eth_batch_blocks=config.ETH_INDEX_BATCH_BLOCKS,
+                                   eth_reorg_depth=config.ETH_INDEX_REORG_DEPTH,
+                                   bloom_capacity=config.REGISTRY_BLOOM_CAPACITY,
+                                   bloom_error_rate=config.REGISTRY_BLOOM_ERROR_RATE)
+    await registry_index.start()
+    app.state.registry_index = registry_index
+    index_task = None
+    if config.REGISTRY_SYNC_INTERVAL > 0:
+        index_task = asyncio.create_task(registry_index.run(chain_services, config.REGISTRY_SYNC_INTERVAL))
+
+    # 结果图片按 SHA-256 存放，worker 进程直接写入
+    app.state.blob_store = BlobStore(config.BLOB_DIR)
+
+    # 上传任务持久化在 SQLite 中，后台 worker 处理；重启后继续未完成的任务
+    job_queue = JobQueue(config.DATA_DIR, handler=partial(jobs.process_upload_job, app.state),
+                         workers=config.JOB_WORKERS, poll_interval=config.JOB_POLL_INTERVAL)
+    await job_queue.start()
+    app.state.job_queue = job_queue
+
+    # /metrics 抓取时读取的队列深度和在途任务数
+    metrics.IMAGE_POOL_JOBS.set_function(lambda: {
+        ("running",): image_pool.in_flight - image_pool.queued,
+        ("queued",): image_pool.queued,
+    })
+    metrics.UPLOAD_JOBS.set_function(lambda: {(status,): count for status, count in job_queue.counts().items()})
+    metrics.REGISTRATIONS_PENDING.set_function(
+        lambda: {(chain,): batcher.pending for chain, batcher in app.state.batchers.items()})
+
+    # 慢请求采样分析（默认关闭）
+    app.state.profiler = None
+    if config.PROFILE_SLOW_REQUESTS > 0:
+        app.state.profiler = SamplingProfiler(config.PROFILE_INTERVAL, config.PROFILE_SLOW_REQUESTS,
+                                              config.PROFILE_DIR)
+    try:
+        yield
+    finally:
+        for gauge in (metrics.IMAGE_POOL_JOBS, metrics.UPLOAD_JOBS, metrics.REGISTRATIONS_PENDING):
+            gauge.set_function(None)
+        await job_queue.close()
+        if index_task is not None:
+            index_task.cancel()
+        registry_index.close()
+        for batcher in app.state.batchers.values():
+            await batcher.close()
+        health_task.cancel()
+        chain_services.close()
+        await image_pool.shutdown()
 
 
 # 只创建一个 FastAPI 实例
-app = FastAPI(title="PixelProof")
+app = FastAPI(title="PixelProof", lifespan=lifespan)
 
 # 先添加 CORS 中间件
 app.add_middleware(
@@ -16,11 +135,64 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 各上传接口允许的最大请求体：在解析 multipart 之前按 Content-Length 拒绝过大的请求
+UPLOAD_BODY_LIMITS = {
+    "/api/v1/upload": config.UPLOAD_MAX_BYTES,
+    "/api/v1/workspace/decode": config.UPLOAD_MAX_BYTES,
+    "/api/v1/upload/batch": config.BATCH_MAX_BYTES,
+    "/api/v1/registry/similar": config.UPLOAD_MAX_BYTES,
+}
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    length = request.headers.get("content-length")
+    limit = UPLOAD_BODY_LIMITS.get(request.url.path)
+    if limit is not None and length and length.isdigit() and int(length) > limit + MULTIPART_OVERHEAD:
+        return JSONResponse(status_code=413, content={"detail": "Request body too large"})
+    return await call_next(request)
+
+
+# 请求耗时、在途请求数；抽样的慢请求写出调用栈
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    stages = []
+    token = metrics.request_stages.set(stages)
+    profiler = getattr(request.app.state, "profiler", None)
+    session = profiler.start() if profiler is not None and random.random() < config.PROFILE_SAMPLE_RATE else None
+    metrics.REQUESTS_IN_FLIGHT.inc()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Streaming responses (/upload/batch) are timed up to their first byte
+        duration = time.perf_counter() - started
+        metrics.REQUESTS_IN_FLIGHT.dec()
+        route = request.scope.get("route")
+        metrics.REQUEST_SECONDS.observe(duration, method=request.method,
+                                        route=route.path if route is not None else "unmatched", status=str(status))
+        metrics.request_stages.reset(token)
+        if session is not None:
+            samples = profiler.stop(session)
+            if duration >= profiler.threshold:
+                label = f"{request.method} {request.url.path}"
+                path = await asyncio.to_thread(profiler.write, label, duration, samples, stages)
+                print(f"Slow request: {label} took {duration:.2f}s "
+                      f"({', '.join(f'{name} {seconds:.2f}s' for name, seconds in stages)}); profile: {path}")
+
 # 注册路由
 app.include_router(images.router, prefix="/api/v1")
-# app.include_router(detect.router, prefix="/api/v1")  
+app.include_router(jobs.router, prefix="/api/v1")
+app.include_router(blobs.router, prefix="/api/v1")
+app.include_router(registry.router, prefix="/api/v1")
+app.include_router(monitoring.router)
+# app.include_router(detect.router, prefix="/api/v1")
 
 if __name__ == "__main__":
 
     import uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="127.0.0.1", port=8000)
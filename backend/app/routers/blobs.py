@@ -0,0 +1,41 @@
+import asyncio
+import os
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import FileResponse
+from services.BlobStore import DIGEST_PATTERN
+
+router = APIRouter()
+
+# A blob's content never changes, so clients and proxies may keep it for good
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+DOWNLOAD_EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp"}
+
+
+@router.get("/blobs/{digest}")
+async def get_blob(request: Request, digest: str, download: Optional[str] = None):
+    """
+    Stream a stored result image. The ETag is its SHA-256, so If-None-Match revalidation is free;
+    Range requests are answered with partial content.
+
+    Args:
+        download (str, optional): Serve as an attachment named download + the type's extension.
+    """
+    store = request.app.state.blob_store
+    if not DIGEST_PATTERN.match(digest):
+        raise HTTPException(status_code=404, detail="Unknown blob")
+    media_type = await asyncio.to_thread(store.media_type, digest)
+    if media_type is None:
+        raise HTTPException(status_code=404, detail="Unknown blob")
+
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+
+    filename = None
+    if download:
+        filename = f"{os.path.basename(download)}.{DOWNLOAD_EXTENSIONS.get(media_type, 'bin')}"
+    return FileResponse(store.path(digest), media_type=media_type, headers=headers, filename=filename)
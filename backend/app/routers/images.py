@@ -1,167 +1,498 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException, Form
-from sympy import im
-from utils.image_utils import generate_qr_code
-import cv2
-import multiprocessing
-import numpy as np
-import base64
-from PIL import Image, ExifTags
-import os
-from io import BytesIO
-import tempfile
-from services.EthService import EthService
-from services.SolService import SolService
-from pyzbar.pyzbar import decode
-
-# $ mkdir ~/lib
-# $ ln -s $(brew --prefix zbar)/lib/libzbar.dylib ~/lib/libzbar.dylib
+from fastapi import APIRouter, File, UploadFile, HTTPException, Form, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import asyncio
+import json
+import random
+from functools import partial
+from typing import Awaitable, Callable, Dict, List, Optional
+from concurrent.futures.process import BrokenProcessPool
+from services.ChainServices import ChainUnavailableError, DuplicateImageError
+from services.ImagePool import PoolBusyError, JobTimeoutError, WorkerTask
+from services.RegistrationBatcher import DUPLICATE, FAILED, PENDING, REGISTERED
+from utils import metrics
+from utils.explorer import watermark_url
+from utils.ingest import UploadRejected, archive_members, ingest_upload
+import config
 
 router = APIRouter()
 
-# 1 **Monkey Patch `multiprocessing.set_start_method()`**
-def no_op(*args, **kwargs):
-    pass
+# Image jobs are imported by name in the pool's workers; the server process never loads the image
+# libraries (cv2, zbar, the watermark engine) utils.pipeline pulls in
+embed_watermark = WorkerTask("utils.pipeline", "embed_watermark")
+extract_watermark = WorkerTask("utils.pipeline", "extract_watermark")
+# Formats extract_watermark returns the watermark in (utils.pipeline.WATERMARK_FORMATS)
+WATERMARK_FORMATS = ("png", "bits")
+# Very large images are watermarked / read in stripes, with memory-mapped image buffers
+TILING = {"tile_min_pixels": config.TILE_MIN_PIXELS, "tile_stripe_pixels": config.TILE_STRIPE_PIXELS,
+          "tile_threads": config.TILE_THREADS, "tile_dir": config.UPLOAD_SPOOL_DIR}
 
-multiprocessing.set_start_method = no_op  # replace `set_start_method`
 
-from blind_watermark import WaterMark
+ALREADY_REGISTERED = "Error: Your image has already been registered"
 
 
-def register_on_chain(chain: str, key: str, image_data: bytes) -> str:
-    if chain in ["ETH"]:
-        blockchain_service = EthService()
-        tx_hash, image_hash = blockchain_service.register_image(image_data)
-    elif chain in ["SOL"]:
-        blockchain_service = SolService()
-        tx_hash, image_hash = blockchain_service.register_image(image_data)
-    else:
-        tx_hash = ""
-    return tx_hash, image_hash
+# Registration errors worth another attempt: the chain's service is (temporarily) not available.
+# Anything after a transaction may have been sent is not retried, so nothing is registered twice.
+RETRYABLE_REGISTRATION_CODES = {503}
+
+
+def parse_chain_form(state, value: str) -> List[str]:
+    """Chains named by a "chain" form field ("ETH" or "ETH,SOL"), validated against the configured ones."""
+    try:
+        chains = config.parse_chains(value)
+        for chain in chains:
+            state.chain_services.get(chain)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ChainUnavailableError:
+        # Registration retries / reports it per chain
+        pass
+    if len(chains) > 1 and not config.PROOF_BASE_URL:
+        # The proof link is embedded in the image for good; never fall back to a guessed host
+        raise HTTPException(status_code=400,
+                            detail="Multi-chain registration is not available: PROOF_BASE_URL is not configured")
+    return chains
+
+
+async def reject_if_registered(state, chains: List[str], image_hash: bytes):
+    """
+    Pre-flight duplicate check against the registry index: a 409 before any image or chain work when
+    the image is registered on every requested chain.
+    """
+    for chain in chains:
+        if not await state.registry_index.is_registered(chain, image_hash.hex()):
+            return
+    raise HTTPException(status_code=409, detail=ALREADY_REGISTERED)
+
+
+async def register_on_chain(state, chain: str, key: str, image_hash: bytes) -> tuple:
+    """
+    Register an image hash through the app state's chain services / batchers: (tx_hash, hash_hex, status).
+
+    Hashes the chain reports as already registered (409) and confirmed registrations are recorded
+    in the registry index, so the next upload of the image is rejected by the pre-flight check.
+    """
+    registry_index = state.registry_index
+    try:
+        blockchain_service = state.chain_services.get(chain)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ChainUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    batcher = state.batchers.get(chain)
+    if batcher is not None:
+        # Shares a transaction with the other uploads of the current window
+        try:
+            result = await batcher.submit(image_hash)
+        except ChainUnavailableError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Registration failed: {e}")
+        if result.status == DUPLICATE:
+            await registry_index.record(chain, image_hash.hex())
+            raise HTTPException(status_code=409, detail=ALREADY_REGISTERED)
+        if result.status == FAILED:
+            raise HTTPException(status_code=502, detail=f"Registration transaction {result.tx_hash} failed")
+        if result.status == REGISTERED:
+            await registry_index.record(chain, image_hash.hex(), result.tx_hash)
+        return result.tx_hash, image_hash.hex(), result.status
+
+    # The RPC clients are synchronous; keep them off the event loop
+    try:
+        tx_hash, image_hash_hex = await asyncio.to_thread(blockchain_service.register_image, image_hash)
+    except DuplicateImageError:
+        await registry_index.record(chain, image_hash.hex())
+        raise HTTPException(status_code=409, detail=ALREADY_REGISTERED)
+    except Exception as e:
+        # Nonce / RPC failures are not duplicates; report them as upstream errors
+        raise HTTPException(status_code=502, detail=f"Registration failed: {e}")
+    return tx_hash, image_hash_hex, PENDING
+
+
+async def _register_with_retries(state, chain: str, key: str, image_hash: bytes,
+                                 on_timeout: Optional[Callable[[str], Awaitable]] = None) -> dict:
+    """One chain's part of register_on_chains: {"txHash", "status"} or {"error": {"code", "detail"}}."""
+    timeout = config.REGISTER_TIMEOUTS.get(chain)
+    for attempt in range(config.REGISTER_RETRIES + 1):
+        try:
+            if await state.registry_index.is_registered(chain, image_hash.hex()):
+                raise HTTPException(status_code=409, detail=ALREADY_REGISTERED)
+            # Shielded: the hash may already be in a sent or batched transaction, which lands whether
+            # or not we wait; the registration always runs to its end and records the outcome
+            registration = asyncio.ensure_future(register_on_chain(state, chain, key, image_hash))
+            registration.add_done_callback(lambda task: task.cancelled() or task.exception())
+            try:
+                tx_hash, _, status = await asyncio.wait_for(asyncio.shield(registration), timeout)
+            except asyncio.TimeoutError:
+                if on_timeout is None:
+                    return {"error": {"code": 504, "detail": f"{chain} registration timed out after {timeout:g}s"}}
+                await on_timeout(chain)
+                tx_hash, _, status = await registration
+            return {"txHash": tx_hash, "status": status}
+        except HTTPException as e:
+            if e.status_code not in RETRYABLE_REGISTRATION_CODES or attempt == config.REGISTER_RETRIES:
+                return {"error": {"code": e.status_code, "detail": e.detail}}
+        # Jittered exponential backoff, so retries of concurrent uploads do not arrive together
+        await asyncio.sleep(config.REGISTER_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+async def register_on_chains(state, chains: List[str], key: str, image_hash: bytes,
+                             on_timeout: Optional[Callable[[str], Awaitable]] = None) -> Dict[str, dict]:
+    """
+    Register an image hash on several chains at once: each chain has its own timeout and retries, so
+    the slowest chain, not the sum of them, sets the latency.
+
+    A chain that times out is a 504 for that chain; its registration still completes in the background.
+    Callers that can wait for it instead (queued jobs) pass on_timeout, an async callback(chain) called
+    when the timeout passes, and get the registration's actual outcome.
+
+    Returns:
+        dict: Chain -> {"txHash", "status"} or {"error": {"code", "detail"}}, in the order of chains.
+            Partial success is returned as is; if every chain failed, their error is raised instead
+            (409 only when the image is registered on all of them).
+    """
+    results = await asyncio.gather(*(_register_with_retries(state, chain, key, image_hash, on_timeout)
+                                     for chain in chains))
+    registrations = dict(zip(chains, results))
+    errors = [r["error"] for r in results if "error" in r]
+    if len(errors) == len(chains):
+        codes = {error["code"] for error in errors}
+        code = 409 if codes == {409} else max(codes - {409})
+        detail = "; ".join(f"{chain}: {r['error']['detail']}" for chain, r in registrations.items())
+        raise HTTPException(status_code=code, detail=detail if len(chains) > 1 else errors[0]["detail"])
+    return registrations
+
+
+def registered_tx_hashes(registrations: Dict[str, dict]) -> Dict[str, str]:
+    """Chain -> tx hash of the successful registrations."""
+    return {chain: r["txHash"] for chain, r in registrations.items() if "txHash" in r}
+
+
+# Seconds between retries of a batch image while the pool queue is full
+BUSY_RETRY_DELAY = 0.5
+
+
+async def run_image_job(state, fn, *args, timeout: float = None, wait_if_busy: bool = False):
+    """
+    Run an image job in the app's process pool, mapping pool failures to HTTP errors. The stage
+    timings the job collected in its worker are recorded in the metrics.
+
+    Args:
+        wait_if_busy (bool): Wait for room in the pool queue instead of answering 429 (batch uploads,
+            and queued jobs, which already hold the client's image).
+    """
+    try:
+        while True:
+            try:
+                result, timings = await state.image_pool.run(metrics.run_collecting, fn, *args, timeout=timeout)
+                metrics.observe_stages(timings)
+                return result
+            except PoolBusyError:
+                if not wait_if_busy:
+                    raise
+                await asyncio.sleep(BUSY_RETRY_DELAY)
+    except PoolBusyError:
+        metrics.STAGE_ERRORS.inc(stage="image_pool_busy")
+        raise HTTPException(status_code=429, detail="Server is busy, please retry later",
+                            headers={"Retry-After": "5"})
+    except JobTimeoutError:
+        metrics.STAGE_ERRORS.inc(stage="image_pool_timeout")
+        raise HTTPException(status_code=504, detail="Image processing timed out")
+    except BrokenProcessPool:
+        metrics.STAGE_ERRORS.inc(stage="image_pool_crash")
+        raise HTTPException(status_code=503, detail="Image worker crashed, please retry")
+    except Exception as e:
+        # Raised by the job in its worker: count it against the stage it failed in
+        metrics.observe_stages(getattr(e, "pixelproof_timings", []))
+        metrics.STAGE_ERRORS.inc(stage=getattr(e, "pixelproof_stage", "image_job"))
+        raise
+
+
+async def read_upload(file: UploadFile, min_size: int):
+    """Stream the upload through utils.ingest, turning rejections into HTTP errors."""
+    try:
+        with metrics.stage("body_read"):
+            return await ingest_upload(file, min_size=min_size,
+                                       max_size=config.UPLOAD_MAX_BYTES,
+                                       max_pixels=config.UPLOAD_MAX_PIXELS,
+                                       spool_threshold=config.UPLOAD_SPOOL_BYTES,
+                                       chunk_size=config.UPLOAD_CHUNK_BYTES,
+                                       spool_dir=config.UPLOAD_SPOOL_DIR)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+
+async def embed_registered(state, tx_hashes: Dict[str, str], image_hash: str, source,
+                           wait_if_busy: bool = False) -> dict:
+    """
+    Embed the link to an image's registrations (explorer link for one chain, proof URL for several)
+    into the image (bytes or path): the embed_watermark result. The image's perceptual hash is stored
+    with the registrations for similarity search.
+    """
+    result = await run_image_job(state, partial(embed_watermark, **TILING), source,
+                                 watermark_url(config.PROOF_BASE_URL, tx_hashes),
+                                 state.blob_store.root, config.WATERMARK_VERIFY, config.WATERMARK_VERIFY_BITS,
+                                 config.OUTPUT_FORMAT, config.OUTPUT_QUALITY, wait_if_busy=wait_if_busy)
+    for chain in tx_hashes:
+        await state.registry_index.record_fingerprint(chain, image_hash, int(result["phash"], 16))
+    return result
+
+
+def blob_link(blob: dict) -> dict:
+    """Public description of a stored result image: where to fetch it, its type, size and digest."""
+    return {"url": f"/api/v1/blobs/{blob['sha256']}", **blob}
+
+
+def upload_result(result: dict, registrations: Dict[str, dict], image_hash: str) -> dict:
+    """
+    Body describing a watermarked upload, from an embed_watermark result and its registrations.
+    "chain" / "txHash" / "registrationStatus" describe the first successful one.
+    """
+    chain, registration = next((c, r) for c, r in registrations.items() if "txHash" in r)
+    return {
+        "embedded": blob_link(result["embedded"]),
+        "extracted": blob_link(result["preview"]),
+        "bitErrorRate": result["bitErrorRate"],
+        "phash": result["phash"],
+        "chain": chain,
+        "txHash": registration["txHash"],
+        "imageHash": image_hash,
+        "registrationStatus": registration["status"],
+        "registrations": registrations,
+    }
+
+
+async def watermark_upload(state, chains: List[str], key: str, upload, wait_if_busy: bool = False) -> dict:
+    """Register an ingested upload on the chains and embed the link to it: the /upload result body."""
+    try:
+        await reject_if_registered(state, chains, upload.sha256)
+        registrations = await register_on_chains(state, chains, key, upload.sha256)
+
+        image_hash = upload.sha256.hex()
+        result = await embed_registered(state, registered_tx_hashes(registrations), image_hash, upload.source,
+                                        wait_if_busy=wait_if_busy)
+
+        return upload_result(result, registrations, image_hash)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Watermarking failed: {e}")
 
 
-@router.post("/upload")
+@router.post("/upload", status_code=202)
 async def upload_image(
+    request: Request,
     file: UploadFile = File(...),
     chain: str = Form(...),
     key: str = Form(...)
 ):
-    if not file.content_type.startswith('image/'):
-        raise HTTPException(status_code=400, detail="Only images are allowed")
+    """
+    Queue an image for registration and watermarking; poll GET /jobs/{jobId} for progress.
 
-    try:
-        image_data = await file.read()
-        file_size = len(image_data)
-        min_size = 1024 * 1024
-
-        if file_size < min_size:
-            raise HTTPException(status_code=400, detail="Image size too small (must be at least 1MB)")
-
-        tx_hash, image_hash = register_on_chain(chain, key, image_data)
-
-        if chain == "ETH":
-            url = f"https://sepolia.etherscan.io/tx/0x{tx_hash}"
-        elif chain == "SOL":
-            url = f"https://explorer.solana.com/tx/{tx_hash}?cluster=devnet"
-
-        qr_img = generate_qr_code(url)
-        qr_np = np.array(qr_img.convert('L'))
-        wm_bit = qr_np.flatten() > 128
-
-        pil_img = Image.open(BytesIO(image_data)).convert("RGB")
-        image_cv = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
-
-        bwm1 = WaterMark()
-        bwm1.read_img(img=image_cv)
-        bwm1.read_wm(wm_bit, mode='bit')
-
-        embed_image = bwm1.embed()
-        wm_extract = bwm1.extract(embed_img=embed_image, wm_shape=(128, 128), mode='bit')
-        if wm_extract.ndim == 1:
-            wm_extract = wm_extract.reshape((128, 128))
-        wm_img = (wm_extract > 0.5).astype(np.uint8) * 255
-
-        success_embed, embed_buf = cv2.imencode('.jpg', embed_image)
-        if not success_embed:
-            raise HTTPException(status_code=500, detail="Error encoding embedded image to JPEG")
-        embed_bytes = embed_buf.tobytes()
-        embed_b64 = base64.b64encode(embed_bytes).decode('utf-8')
-
-        success_wm, wm_buf = cv2.imencode('.jpg', wm_img)
-        if not success_wm:
-            raise HTTPException(status_code=500, detail="Error encoding watermark image to JPEG")
-        wm_bytes = wm_buf.tobytes()
-        wm_b64 = base64.b64encode(wm_bytes).decode('utf-8')
-
-        return {
-            "embedded": {"data": embed_b64, "type": "image/jpeg"},
-            "extracted": {"data": wm_b64, "type": "image/jpeg"},
-            "txHash": tx_hash,
-            "imageHash": image_hash,
-            
-        }
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error: Your image has already been registered")
+    chain is one chain or several separated by commas ("ETH,SOL"); the image is then registered
+    on all of them concurrently and the watermark links to every registration.
 
+    An Idempotency-Key header (default: chain + image SHA-256) makes retries return the original
+    job instead of registering and embedding the image again. A new upload of an image that is
+    already registered is answered with 409 right away.
+    """
+    # An unavailable chain is not rejected here: the job retries it, and a failed job can be resubmitted
+    chains = parse_chain_form(request.app.state, chain)
+    chain = ",".join(chains)
 
-@router.post("/workspace/decode")
-async def decode_image(file: UploadFile = File(...)):
-    # Validate that the uploaded file is an image
-    if not file.content_type.startswith('image/'):
-        raise HTTPException(status_code=400, detail="Only images are allowed")
+    # Format is sniffed from the bytes, not taken from the client's content_type
+    upload = await read_upload(file, min_size=config.UPLOAD_MIN_BYTES)
 
+    queue = request.app.state.job_queue
     try:
-        # Read the uploaded image data
-        image_data = await file.read()
-        
-        # Convert to RGB using PIL and then to BGR for OpenCV
-        pil_img_rgb = Image.open(BytesIO(image_data)).convert("RGB")
-        image_cv = cv2.cvtColor(np.array(pil_img_rgb), cv2.COLOR_RGB2BGR)
-
-        # Verify the image conversion
-        if image_cv is None or not isinstance(image_cv, np.ndarray):
-            raise HTTPException(status_code=400, detail="Failed to convert image to OpenCV format")
-
-        # Ensure the image has 3 channels (BGR)
-        if len(image_cv.shape) != 3 or image_cv.shape[2] != 3:
-            image_cv = cv2.cvtColor(image_cv, cv2.COLOR_GRAY2BGR)
-
-        # Extract the watermark using the same process as upload_image
-        bwm1 = WaterMark()
+        idempotency_key = request.headers.get("Idempotency-Key") or f"{chain}:{upload.sha256.hex()}"
+        if await queue.find(idempotency_key) is None:
+            await reject_if_registered(request.app.state, chains, upload.sha256)
+        job, created = await queue.submit(idempotency_key, chain, upload.sha256.hex(), upload.source)
+    finally:
+        upload.close()
+
+    # submit() leaves a job for a different upload untouched
+    if job.image_hash != upload.sha256.hex() or job.chain != chain:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different upload")
+    body = {"jobId": job.id, "status": job.status, "statusUrl": f"/api/v1/jobs/{job.id}"}
+    return body if created else JSONResponse(status_code=200, content=body)
+
+
+@router.post("/upload/batch")
+async def upload_batch(
+    request: Request,
+    files: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    chain: str = Form(...),
+    key: str = Form(...)
+):
+    """
+    Watermark many images in one request: several "files" parts, or one zip / tar "archive".
+
+    Images are ingested in order, then registered and embedded concurrently (BATCH_CONCURRENCY at a
+    time), so registrations of neighbouring images share batched transactions while others embed.
+    Each result is streamed as one NDJSON line as soon as it is ready:
+        {"index", "filename", "status": "ok", ...the /upload response body}
+        {"index", "filename", "status": "error", "code", "detail"}
+    followed by {"done": true, "total", "succeeded", "failed"}.
+    """
+    # Reject a bad chain before streaming anything
+    chains = parse_chain_form(request.app.state, chain)
+
+    if bool(files) == (archive is not None):
+        raise HTTPException(status_code=400, detail="Send either files or one archive")
+    if archive is not None:
         try:
-            wm_extract = bwm1.extract(embed_img=image_cv, wm_shape=(128, 128), mode='bit')
-            if wm_extract is None:
-                raise HTTPException(status_code=400, detail="Failed to extract watermark: got None")
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Failed to extract watermark: {str(e)}")
+            # Listing a tar decompresses all of it: keep that off the event loop
+            members = await asyncio.to_thread(archive_members, archive.file)
+        except UploadRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        # Archive members are opened lazily (off the event loop, see _stream_batch) and read one at a time
+        sources = [(name, lambda open_member=open_member, name=name: UploadFile(open_member(), filename=name))
+                   for name, open_member in members]
+    else:
+        sources = [(file.filename, lambda file=file: file) for file in files]
+    if len(sources) > config.BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"Too many images (at most {config.BATCH_MAX_FILES})")
+
+    return StreamingResponse(_stream_batch(request.app.state, chains, key, sources), media_type="application/x-ndjson")
 
-        # Reshape the extracted watermark if it's 1D
-        if wm_extract.ndim == 1:
-            wm_extract = wm_extract.reshape((128, 128))
 
-        # Convert to a binary image (0s and 255s), matching upload_image
-        wm_img = (wm_extract > 0.5).astype(np.uint8) * 255
+async def _stream_batch(state, chains: List[str], key: str, sources: list):
+    results: asyncio.Queue = asyncio.Queue()
+    slots = asyncio.Semaphore(config.BATCH_CONCURRENCY)
+    tasks = set()
+    uploads = []
 
-        # Save the extracted image for debugging
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_file:
-            success, wm_buf = cv2.imencode('.jpg', wm_img)
-            if success:
-                tmp_file.write(wm_buf.tobytes())
-                debug_path = tmp_file.name
+    async def process(index: int, filename: str, upload):
+        try:
+            body = await watermark_upload(state, chains, key, upload, wait_if_busy=True)
+            line = {"index": index, "filename": filename, "status": "ok", **body}
+        except HTTPException as e:
+            line = error_line(index, filename, e.status_code, e.detail)
+        finally:
+            upload.close()
+            slots.release()
+        results.put_nowait(line)
+
+    def error_line(index: int, filename: str, code: int, detail: str) -> dict:
+        return {"index": index, "filename": filename, "status": "error", "code": code, "detail": detail}
+
+    async def produce():
+        try:
+            for index, (filename, open_upload) in enumerate(sources):
+                await slots.acquire()
+                try:
+                    # Opening an archive member seeks / decompresses; UploadFile then reads it in the threadpool
+                    upload = await read_upload(await asyncio.to_thread(open_upload), min_size=config.UPLOAD_MIN_BYTES)
+                except HTTPException as e:
+                    slots.release()
+                    results.put_nowait(error_line(index, filename, e.status_code, e.detail))
+                    continue
+                except Exception as e:
+                    # e.g. a corrupt archive member
+                    slots.release()
+                    results.put_nowait(error_line(index, filename, 400, f"Unreadable file: {e}"))
+                    continue
+                uploads.append(upload)
+                tasks.add(asyncio.create_task(process(index, filename, upload)))
+            await asyncio.gather(*tasks)
+        finally:
+            results.put_nowait(None)
+
+    producer = asyncio.create_task(produce())
+    succeeded = failed = 0
+    try:
+        while (line := await results.get()) is not None:
+            if line["status"] == "ok":
+                succeeded += 1
             else:
-                debug_path = "Failed to save extracted image"
-
-        # Encode the extracted image as base64 for the response
-        success, wm_buf = cv2.imencode('.jpg', wm_img)
-        if not success:
-            raise HTTPException(status_code=500, detail="Error encoding extracted image to JPEG")
-        wm_bytes = wm_buf.tobytes()
-        wm_b64 = base64.b64encode(wm_bytes).decode('utf-8')
-        print(f"Extracted image saved at: {debug_path}")
-        # Return the extracted image and debug path
-        return {
-            "extracted": {"data": wm_b64, "type": "image/jpeg"},
-        }
+                failed += 1
+            yield json.dumps(line) + "\n"
+        yield json.dumps({"done": True, "total": len(sources), "succeeded": succeeded, "failed": failed}) + "\n"
+    finally:
+        # Client went away or the batch ended: stop what is still running (uploads close in process())
+        producer.cancel()
+        for task in tasks:
+            task.cancel()
+        for upload in uploads:
+            upload.close()
+
+
+@router.get("/tx/SOL/{signature}")
+async def solana_tx_status(request: Request, signature: str):
+    """Confirmation status of a Solana registration sent without waiting for confirmation."""
+    try:
+        sol_service = request.app.state.chain_services.get("SOL")
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ChainUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    status = sol_service.confirmation_status(signature)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown transaction")
+    return {"txHash": signature, "status": status}
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
+@router.post("/workspace/decode")
+async def decode_image(
+    request: Request,
+    file: UploadFile = File(...),
+    reduce: int = Form(1),
+    format: str = Form("png"),
+    robust: bool = Form(False),
+    scales: Optional[str] = Form(None),
+    offsets: Optional[str] = Form(None)
+):
+    # reduce=2/4/8 decodes at a fraction of the resolution, for images upscaled after watermarking
+    if reduce not in (1, 2, 4, 8):
+        raise HTTPException(status_code=400, detail="reduce must be 1, 2, 4 or 8")
+    # "png" returns the watermark as an image, "bits" as packed raw bits
+    if format not in WATERMARK_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(WATERMARK_FORMATS)}")
+
+    # robust=true also tries resized / cropped geometries when the image does not decode as-is;
+    # scales ("0.5,2") and offsets ("dy:dx,...") override the configured candidates
+    search = {}
+    if robust:
+        try:
+            search = {
+                "scales": config.parse_scales(scales or config.EXTRACT_SCALES),
+                "offsets": config.parse_offsets(offsets or config.EXTRACT_OFFSETS),
+            }
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid scales / offsets: {e}")
+        search.update(budget=config.EXTRACT_BUDGET, threads=config.EXTRACT_THREADS,
+                      max_pixels=config.UPLOAD_MAX_PIXELS)
+
+    # Validate that the uploaded file is an image and read it in chunks
+    upload = await read_upload(file, min_size=0)
+
+    try:
+        # Decoding and extraction run in the process pool, off the event loop
+        if search:
+            # Search within the budget, plus the usual allowance for the job itself
+            result = await run_image_job(request.app.state, partial(extract_watermark, **search, **TILING),
+                                         upload.source, reduce, format,
+                                         timeout=config.EXTRACT_BUDGET + config.IMAGE_JOB_TIMEOUT)
+        else:
+            result = await run_image_job(request.app.state, partial(extract_watermark, **TILING), upload.source,
+                                         reduce, format)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to extract watermark: {str(e)}")
+    finally:
+        upload.close()
+
+    # url / chain / txHash come from the QR code in the watermark (None if it could not be read)
+    return {
+        "extracted": {"data": result["data"], "type": result["type"]},
+        "url": result["url"],
+        "chain": result["chain"],
+        "txHash": result["txHash"],
+        "txHashes": result["txHashes"],
+        "hypothesis": result["hypothesis"],
+        "tried": result["tried"],
+    }
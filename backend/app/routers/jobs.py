@@ -0,0 +1,75 @@
+from fastapi import APIRouter, HTTPException, Request
+from functools import partial
+import config
+from routers.images import (embed_registered, register_on_chains, registered_tx_hashes, reject_if_registered,
+                            upload_result)
+from services.JobQueue import DONE, Job, JobFailed, JobQueue
+from services.RegistrationBatcher import PENDING
+
+router = APIRouter()
+
+
+async def registration_pending(queue: JobQueue, job: Job, chain: str):
+    """
+    A chain's registration outlived its timeout. Its transaction still lands and would make a
+    resubmitted job fail with 409, so the job reports it as pending and waits for it instead of failing.
+    """
+    job.registration_status = PENDING
+    await queue.update(job.id, registration_status=PENDING)
+
+
+async def process_upload_job(state, queue: JobQueue, job: Job) -> dict:
+    """
+    Job handler for queued uploads: register the image hash on the job's chains, then embed the link
+    to the registrations.
+
+    The registrations are stored on the job as soon as they succeed, so a job resumed after a
+    restart goes straight to embedding.
+    """
+    try:
+        if not job.registrations:
+            chains = config.parse_chains(job.chain)
+            async with queue.stage(job, "registering"):
+                # Registered elsewhere while the job was queued
+                await reject_if_registered(state, chains, bytes.fromhex(job.image_hash))
+                # Registration is signed by the server account; the client's key is not persisted
+                registrations = await register_on_chains(state, chains, None, bytes.fromhex(job.image_hash),
+                                                         on_timeout=partial(registration_pending, queue, job))
+            first = next(r for r in registrations.values() if "txHash" in r)
+            job.registrations = registrations
+            job.tx_hash, job.registration_status = first["txHash"], first["status"]
+            await queue.update(job.id, registrations=registrations, tx_hash=job.tx_hash,
+                               registration_status=job.registration_status)
+
+        async with queue.stage(job, "embedding"):
+            result = await embed_registered(state, registered_tx_hashes(job.registrations), job.image_hash,
+                                            job.source_path, wait_if_busy=True)
+    except HTTPException as e:
+        raise JobFailed(e.status_code, e.detail)
+
+    return upload_result(result, job.registrations, job.image_hash)
+
+
+@router.get("/jobs/{job_id}")
+async def job_status(request: Request, job_id: str):
+    job = await request.app.state.job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    status = job.to_dict()
+    if job.status == DONE:
+        status["resultUrl"] = f"/api/v1/jobs/{job.id}/result"
+    return status
+
+
+@router.get("/jobs/{job_id}/result")
+async def job_result(request: Request, job_id: str):
+    queue = request.app.state.job_queue
+    job = await queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    if job.status != DONE:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    result = await queue.result(job_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Job result is no longer available")
+    return result
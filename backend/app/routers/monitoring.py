@@ -0,0 +1,16 @@
+import asyncio
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from utils.metrics import REGISTRY
+
+router = APIRouter()
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint: stage / RPC / request latency histograms, queue gauges, error counters."""
+    # Some gauges are read from SQLite when scraped; keep that off the event loop
+    return PlainTextResponse(await asyncio.to_thread(REGISTRY.render), media_type=CONTENT_TYPE)
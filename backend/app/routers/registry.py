@@ -0,0 +1,92 @@
+import re
+from fastapi import APIRouter, File, Form, HTTPException, Query, Request, UploadFile
+import config
+from routers.images import read_upload, run_image_job
+from services.ImagePool import WorkerTask
+from utils.explorer import explorer_url, is_valid_tx
+
+router = APIRouter()
+
+fingerprint = WorkerTask("utils.pipeline", "fingerprint")
+
+HASH_PATTERN = re.compile(r"^(0x)?[0-9a-fA-F]{64}$")
+
+
+def _registration(row: dict) -> dict:
+    return {
+        "chain": row["chain"],
+        "hash": row["hash"],
+        "owner": row["owner"],
+        "timestamp": row["timestamp"],
+        "blockNumber": row["block_number"],
+        "txHash": row["tx_hash"],
+    }
+
+
+@router.get("/registry/{image_hash}")
+async def registry_lookup(request: Request, image_hash: str):
+    """Owner(s) of an image hash from the local registry index, without an RPC round trip."""
+    if not HASH_PATTERN.match(image_hash):
+        raise HTTPException(status_code=400, detail="Expected a 32-byte hex hash")
+    image_hash = image_hash.lower().removeprefix("0x")
+    rows = await request.app.state.registry_index.lookup(image_hash)
+    if not rows:
+        raise HTTPException(status_code=404, detail="Hash is not registered (as far as the index has synced)")
+    return {"hash": image_hash, "registrations": [_registration(row) for row in rows]}
+
+
+@router.get("/registry/owner/{address}")
+async def registry_owner(request: Request, address: str, limit: int = Query(100, ge=1, le=1000),
+                         offset: int = Query(0, ge=0)):
+    """Hashes registered by an ETH or SOL address, from the local registry index."""
+    rows = await request.app.state.registry_index.by_owner(address, limit=limit, offset=offset)
+    return {"owner": address, "registrations": [_registration(row) for row in rows]}
+
+
+@router.post("/registry/similar")
+async def registry_similar(
+    request: Request,
+    file: UploadFile = File(...),
+    max_distance: int = Form(config.PHASH_MAX_DISTANCE),
+    limit: int = Form(10)
+):
+    """
+    Images registered through this server that look like the upload: their perceptual hashes are at
+    most max_distance of 64 bits apart (re-encoded or resized copies are usually within a few bits).
+    """
+    if not 0 <= max_distance <= config.PHASH_MAX_DISTANCE_LIMIT:
+        raise HTTPException(status_code=400,
+                            detail=f"max_distance must be between 0 and {config.PHASH_MAX_DISTANCE_LIMIT}")
+    if not 1 <= limit <= 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+
+    upload = await read_upload(file, min_size=0)
+    try:
+        phash = await run_image_job(request.app.state, fingerprint, upload.source)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to read image: {e}")
+    finally:
+        upload.close()
+
+    rows = await request.app.state.registry_index.similar(int(phash, 16), max_distance, limit)
+    return {
+        "phash": phash,
+        "matches": [{**_registration(row), "distance": row["distance"]} for row in rows],
+    }
+
+
+@router.get("/proof")
+async def proof(request: Request):
+    """
+    Target of the proof URL embedded in images registered on several chains (?ETH=<tx>&SOL=<tx>):
+    the explorer link of every listed registration.
+    """
+    tx_hashes = dict(request.query_params)
+    if not tx_hashes or not all(is_valid_tx(chain, tx) for chain, tx in tx_hashes.items()):
+        raise HTTPException(status_code=400, detail="Expected chain=txHash query parameters")
+    return {
+        "registrations": [{"chain": chain, "txHash": tx, "explorerUrl": explorer_url(chain, tx)}
+                          for chain, tx in tx_hashes.items()],
+    }
@@ -0,0 +1,52 @@
+import hashlib
+import os
+import re
+import uuid
+from typing import Optional
+
+from utils.ingest import sniff_format
+
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+MEDIA_TYPES = {"jpeg": "image/jpeg", "png": "image/png", "webp": "image/webp"}
+
+
+class BlobStore:
+    def __init__(self, root: str):
+        """
+        Content-addressed file store for result images: a blob's name is the SHA-256 of its bytes,
+        so identical results are stored once and a stored blob never changes.
+
+        Plain files under root, so worker processes write blobs directly and the API serves them.
+
+        Args:
+            root (str): Directory of the store; blobs live in root/<first 2 hex digits>/<digest>.
+        """
+        self.root = root
+
+    def path(self, digest: str) -> str:
+        if not DIGEST_PATTERN.match(digest):
+            raise ValueError(f"Invalid blob digest: {digest}")
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, data: bytes) -> str:
+        """Store data unless it already is; returns its SHA-256 hex digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written aside and renamed, so concurrent writers of the same blob never expose a partial file
+            tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return digest
+
+    def media_type(self, digest: str) -> Optional[str]:
+        """Media type of a stored blob, or None if there is no such blob."""
+        try:
+            with open(self.path(digest), "rb") as f:
+                head = f.read(16)
+        except (FileNotFoundError, ValueError):
+            return None
+        return MEDIA_TYPES.get(sniff_format(head), "application/octet-stream")
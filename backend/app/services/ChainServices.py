@@ -0,0 +1,59 @@
+import asyncio
+from typing import Any, Callable, Dict
+
+
+class ChainUnavailableError(Exception):
+    """Raised when the service for a chain is not configured or could not connect."""
+
+
+class DuplicateImageError(Exception):
+    """Raised when the chain rejects a registration because the image hash already has an owner."""
+
+
+class ChainServices:
+    def __init__(self, factories: Dict[str, Callable[[], Any]], health_interval: float):
+        """
+        App-scoped blockchain services, created once at startup and shared by every request.
+
+        Args:
+            factories (dict): Chain name ("ETH", "SOL") -> callable building that chain's service.
+            health_interval (float): Seconds between background health checks.
+        """
+        self.factories = factories
+        self.health_interval = health_interval
+        self.services: Dict[str, Any] = {}
+
+    def start(self):
+        """Build every configured service. A chain that fails to start is logged and left unavailable."""
+        for chain, factory in self.factories.items():
+            try:
+                self.services[chain] = factory()
+            except Exception as e:
+                print(f"Error: {chain} service unavailable: {e}")
+
+    def get(self, chain: str) -> Any:
+        if chain not in self.factories:
+            raise ValueError(f"Unsupported chain: {chain}")
+        service = self.services.get(chain)
+        if service is None:
+            raise ChainUnavailableError(f"{chain} service is not available")
+        return service
+
+    async def run_health_checks(self):
+        """Periodically probe each chain (failing over between endpoints) and retry chains that never started."""
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for chain, factory in self.factories.items():
+                service = self.services.get(chain)
+                try:
+                    if service is None:
+                        self.services[chain] = await asyncio.to_thread(factory)
+                    elif not await asyncio.to_thread(service.health_check):
+                        print(f"Error: all {chain} endpoints are unreachable")
+                except Exception as e:
+                    print(f"Error: {chain} health check failed: {e}")
+
+    def close(self):
+        for service in self.services.values():
+            service.close()
+        self.services.clear()
@@ -1,56 +1,254 @@
 from web3 import Web3
 import json
 import os
+import threading
+import time
 from dotenv import load_dotenv
-from web3 import Web3
-from typing import Optional
-import hashlib
+from typing import Dict, List, Optional, Union
+import requests
+from requests.adapters import HTTPAdapter
+from web3.logs import DISCARD
+from web3.exceptions import ContractCustomError, TimeExhausted
+from config import parse_endpoints
+from services.ChainServices import DuplicateImageError
+from services.NonceManager import NonceManager
+from services.RegistrationBatcher import RegistrationResult, REGISTERED, DUPLICATE, PENDING, FAILED
+from utils.metrics import rpc
+
+# 4-byte selector of the contract's HashAlreadyRegistered(bytes32) error
+HASH_ALREADY_REGISTERED_SELECTOR = Web3.keccak(text="HashAlreadyRegistered(bytes32)")[:4].hex()
+
+
+def is_nonce_error(error: Exception) -> bool:
+    """True for node errors meaning the nonce was already used or the transaction was replaced."""
+    message = str(error).lower()
+    return any(text in message for text in ("nonce too low", "already known", "replacement transaction underpriced"))
+
 
 class EthService:
-    def __init__(self, network_rpc: Optional[str] = None, private_key: Optional[str] = None, 
-                 contract_address: Optional[str] = None, abi_path: str = "contracts/abi.json"):
+    def __init__(self, network_rpc: Optional[Union[str, List[str]]] = None, private_key: Optional[str] = None,
+                 contract_address: Optional[str] = None, abi_path: str = "contracts/abi.json",
+                 pool_size: int = 10, receipt_timeout: float = 120, gas_cache_ttl: float = 600,
+                 chain_id: int = 11155111):
+        """
+        Long-lived client for the ImageRegistry contract. Create it once per process and share it.
+
+        Args:
+            network_rpc (str | list, optional): RPC URL, comma-separated URLs or a list of URLs, tried in
+                order on failover. Defaults to environment variable SEPOLIA_RPC.
+            private_key (str, optional): Hex private key. Defaults to environment variable PRIVATE_KEY.
+            contract_address (str, optional): Contract address. Defaults to environment variable ETH_CONTRACT_ADDRESS.
+            abi_path (str): Path of the contract ABI.
+            pool_size (int): Keep-alive HTTP connections kept per endpoint.
+            receipt_timeout (float): Seconds register_batch waits for the batch transaction receipt.
+            gas_cache_ttl (float): Seconds a registerImage gas estimate is reused.
+            chain_id (int): Chain ID signed into transactions (Sepolia; 31337 for a local Hardhat node).
+        """
         # Load environment variables
         load_dotenv()
-        
-        # Initialize Web3 provider
-        self.w3 = Web3(Web3.HTTPProvider(network_rpc or os.getenv("SEPOLIA_RPC"), request_kwargs={'timeout': 10}))
-        if not self.w3.is_connected():
-            raise ConnectionError("Failed to connect to Sepolia devnet. Check your RPC URL.")
-        else:
-            print("Connected to Sepolia devnet")
+
+        self.endpoints = parse_endpoints(network_rpc or os.getenv("SEPOLIA_RPC"))
+        if not self.endpoints:
+            raise ValueError("No Sepolia RPC URL provided or found in environment variables.")
         self.private_key = private_key or os.getenv("PRIVATE_KEY")
         self.contract_address = contract_address or os.getenv("ETH_CONTRACT_ADDRESS")
-        
-        # Load contract ABI
+
+        # Load contract ABI once; it is reused whenever we switch endpoint
         with open(abi_path) as f:
-            contract_abi = json.load(f)
-        
-        # Initialize contract
-        self.contract = self.w3.eth.contract(address=self.contract_address, abi=contract_abi)
-        self.account = self.w3.eth.account.from_key(self.private_key)
-        
-    def register_image(self, image_data: bytes) -> str:
-        """Register an image hash on the blockchain"""
-        # Compute 32-byte hash as bytes
-        image_hash = hashlib.sha256(image_data).digest()
-        print(f"Image hash: {image_hash.hex()}")
-        nonce = self.w3.eth.get_transaction_count(self.account.address)
+            self.contract_abi = json.load(f)
+
+        # One pooled keep-alive session shared by every provider this service creates
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.endpoints), pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.receipt_timeout = receipt_timeout
+        self.gas_cache_ttl = gas_cache_ttl
+        self.chain_id = chain_id
+        self._gas_cache = {}
+        self._lock = threading.Lock()
+        self.endpoint_index = 0
+        self.account = Web3().eth.account.from_key(self.private_key)
+        self.connect()
+        # Nonces are handed out locally; the chain is only read to seed and resynchronize
+        self.nonces = NonceManager(self._fetch_nonce)
+
+    def _fetch_nonce(self) -> int:
+        with rpc("ETH", "nonce"):
+            return self.w3.eth.get_transaction_count(self.account.address, 'pending')
+
+    def _make_web3(self, index: int) -> Web3:
+        return Web3(Web3.HTTPProvider(self.endpoints[index], request_kwargs={'timeout': 10},
+                                      session=self.session))
+
+    def connect(self, start: int = 0):
+        """Connect to the first reachable endpoint, starting at index start and wrapping around."""
+        with self._lock:
+            for offset in range(len(self.endpoints)):
+                index = (start + offset) % len(self.endpoints)
+                w3 = self._make_web3(index)
+                with rpc("ETH", "health"):
+                    connected = w3.is_connected()
+                if connected:
+                    self.w3, self.endpoint_index = w3, index
+                    self.contract = w3.eth.contract(address=self.contract_address, abi=self.contract_abi)
+                    print(f"Connected to Sepolia devnet via endpoint #{index}")
+                    return
+                print(f"Sepolia endpoint #{index} unreachable")
+        raise ConnectionError("Failed to connect to Sepolia devnet. Check your RPC URL.")
+
+    def health_check(self) -> bool:
+        """
+        Probe the current endpoint and fail over to the next reachable one if it is down. Also
+        resynchronizes the local nonce so gaps left by dropped transactions get filled.
+        """
         try:
-            gas_estimate = self.contract.functions.registerImage(image_hash).estimate_gas()
-            print("Gas estimate:", gas_estimate)
-            tx = self.contract.functions.registerImage(image_hash).build_transaction({
-                'chainId': 11155111,  # Sepolia chain ID
-                'gas': gas_estimate*2,
-                'gasPrice': self.w3.to_wei('1', 'gwei'),
-                'nonce': nonce,
-            })
-            print("Success:", tx)
-        except Exception as e:
+            with rpc("ETH", "health"):
+                connected = self.w3.is_connected()
+            if not connected:
+                self.connect(start=self.endpoint_index + 1)
+            self.nonces.resync()
+            return True
+        except (ConnectionError, requests.exceptions.RequestException) as e:
             print(f"Error: {e}")
+            return False
+
+    def close(self):
+        self.session.close()
+
+    def register_image(self, image_hash: bytes) -> str:
+        """Register an image hash (32-byte SHA-256 of the upload) on the blockchain"""
+        try:
+            return self._register_image(image_hash)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            # Endpoint went away mid-request: fail over once and retry
+            print(f"Error: {e}, failing over")
+            self.connect(start=self.endpoint_index + 1)
+            return self._register_image(image_hash)
+
+    @staticmethod
+    def _raise_if_duplicate(error: ContractCustomError):
+        if HASH_ALREADY_REGISTERED_SELECTOR in str(error.data):
+            raise DuplicateImageError("Image hash is already registered") from error
+
+    def _estimate_gas(self, key, call) -> int:
+        """
+        Gas for a call. With a key (a call whose gas does not depend on chain state), the estimate is
+        reused until it expires; key None estimates every time.
+
+        Estimating also simulates the call, which is what turns a revert (e.g. HashAlreadyRegistered)
+        into an error before anything is sent. On a cache hit the call is still simulated with
+        eth_call, so a cached estimate never stands in for that check.
+        """
+        now = time.monotonic()
+        cached = self._gas_cache.get(key) if key is not None else None
+        try:
+            if cached is not None and cached[1] > now:
+                with rpc("ETH", "call"):
+                    call.call()
+                return cached[0]
+            with rpc("ETH", "gas_estimate"):
+                gas = call.estimate_gas()
+        except ContractCustomError as e:
+            self._raise_if_duplicate(e)
             raise
+        if key is not None:
+            self._gas_cache[key] = (gas, now + self.gas_cache_ttl)
+        return gas
+
+    def _send_transaction(self, call, gas_key):
+        """
+        Sign and send a contract call using a locally allocated nonce.
 
-        signed_tx = self.w3.eth.account.sign_transaction(tx, self.private_key)
-        tx_hash = self.w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        Returns:
+            tuple: (transaction hash, web3 instance it was sent through)
+        """
+        # Take provider from the contract so a concurrent failover never mixes endpoints
+        w3 = self.contract.w3
+        gas_estimate = self._estimate_gas(gas_key, call)
+        for attempt in range(2):
+            nonce = self.nonces.allocate()
+            try:
+                tx = call.build_transaction({
+                    'chainId': self.chain_id,
+                    'gas': gas_estimate*2,
+                    'gasPrice': w3.to_wei('1', 'gwei'),
+                    'nonce': nonce,
+                })
+                signed_tx = w3.eth.account.sign_transaction(tx, self.private_key)
+                with rpc("ETH", "send"):
+                    tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+            except Exception as e:
+                if attempt == 0 and is_nonce_error(e):
+                    # Someone else used this nonce (or replaced our tx): resync from chain and retry
+                    print(f"Error: {e}, resyncing nonce")
+                    self.nonces.discard(nonce)
+                    self.nonces.resync()
+                    continue
+                self.nonces.release(nonce)
+                print(f"Error: {e}")
+                raise
+            self.nonces.sent(nonce)
+            print("nonce: ", nonce)
+            return tx_hash, w3
+
+    def _register_image(self, image_hash: bytes) -> str:
+        print(f"Image hash: {image_hash.hex()}")
+        call = self.contract.functions.registerImage(image_hash)
+        tx_hash, _ = self._send_transaction(call, gas_key="registerImage")
         print(f"Image registered on the blockchain with transaction hash: {tx_hash.hex()}")
-        print("nonce: ", nonce)
-        return tx_hash.hex(), image_hash.hex()
\ No newline at end of file
+        return tx_hash.hex(), image_hash.hex()
+
+    def register_batch(self, image_hashes: List[bytes]) -> Dict[bytes, RegistrationResult]:
+        """
+        Register several image hashes with a single batchRegister transaction.
+
+        The contract skips hashes that already have an owner instead of reverting, so the per-hash
+        status is read from the Registered events in the receipt.
+
+        Args:
+            image_hashes (list): 32-byte image hashes.
+
+        Returns:
+            dict: Hash -> RegistrationResult sharing the batch transaction hash.
+        """
+        contract = self.contract
+        call = contract.functions.batchRegister(image_hashes)
+        # Not cached: hashes that are already registered are skipped for a fraction of the gas of a new
+        # one, so an estimate is only valid for the batch it was taken for
+        tx_hash, w3 = self._send_transaction(call, gas_key=None)
+        print(f"Batch of {len(image_hashes)} images sent with transaction hash: {tx_hash.hex()}")
+
+        try:
+            with rpc("ETH", "receipt"):
+                receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=self.receipt_timeout, poll_latency=1)
+        except TimeExhausted:
+            return {h: RegistrationResult(tx_hash.hex(), PENDING) for h in image_hashes}
+        if receipt.status != 1:
+            return {h: RegistrationResult(tx_hash.hex(), FAILED) for h in image_hashes}
+
+        registered = {bytes(event.args.hash)
+                      for event in contract.events.Registered().process_receipt(receipt, errors=DISCARD)}
+        return {h: RegistrationResult(tx_hash.hex(), REGISTERED if h in registered else DUPLICATE)
+                for h in image_hashes}
+
+    def block_number(self) -> int:
+        with rpc("ETH", "block_number"):
+            return self.w3.eth.block_number
+
+    def block_hash(self, number: int) -> str:
+        with rpc("ETH", "block_hash"):
+            return self.w3.eth.get_block(number)["hash"].hex()
+
+    def registered_events(self, from_block: int, to_block: int) -> List[dict]:
+        """Registered events of the contract in blocks from_block..to_block (inclusive), oldest first."""
+        with rpc("ETH", "logs"):
+            events = self.contract.events.Registered().get_logs(from_block=from_block, to_block=to_block)
+        return [{
+            "hash": bytes(event.args.hash).hex(),
+            "owner": event.args.author,
+            "timestamp": event.args.timestamp,
+            "block_number": event.blockNumber,
+            "tx_hash": event.transactionHash.hex(),
+        } for event in events]
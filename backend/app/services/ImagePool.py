@@ -0,0 +1,186 @@
+import asyncio
+import importlib
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Set
+
+
+class PoolBusyError(Exception):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+class JobTimeoutError(Exception):
+    """Raised when a job does not finish within its timeout."""
+
+
+def _init_worker():
+    # One OpenCV thread per worker process; the pool itself provides the parallelism.
+    import cv2
+    cv2.setNumThreads(1)
+
+
+def _warm_worker() -> bool:
+    # Importing the pipeline loads numpy / cv2 / the watermark code once per worker; the prewarm
+    # then runs its stages once, so the first real job does not pay for their first-call setup.
+    from utils.pipeline import prewarm
+    prewarm()
+    return True
+
+
+def _terminate(executor: ProcessPoolExecutor):
+    # Kills the workers whatever they are running (ProcessPoolExecutor.terminate_workers() from Python 3.14)
+    for process in list((executor._processes or {}).values()):
+        process.terminate()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+class WorkerTask:
+    def __init__(self, module: str, name: str):
+        """
+        A function that is only imported in the worker processes, e.g. WorkerTask("utils.pipeline",
+        "embed_watermark"). It is pickled by name, so the server process never loads the image
+        libraries the function's module imports.
+        """
+        self.module = module
+        self.name = name
+
+    def __call__(self, *args, **kwargs):
+        return getattr(importlib.import_module(self.module), self.name)(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        return f"{self.module}.{self.name}"
+
+
+class ImagePool:
+    def __init__(self, workers: int, max_queue: int, timeout: float):
+        """
+        Bounded process pool for the CPU-heavy image pipeline.
+
+        Args:
+            workers (int): Number of worker processes.
+            max_queue (int): Jobs allowed to wait for a free worker before submissions are rejected.
+            timeout (float): Default per-job timeout in seconds.
+        """
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self.in_flight = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Unfinished jobs of each executor, so one retired after a timeout can finish them first
+        self._jobs: Dict[ProcessPoolExecutor, Set[Future]] = {}
+        self._retiring = set()  # _retire tasks
+        # spawn keeps workers independent of the threads already running in the server process
+        self._mp_context = multiprocessing.get_context("spawn")
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.max_queue
+
+    @property
+    def queued(self) -> int:
+        return max(0, self.in_flight - self.workers)
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=self._mp_context,
+                                       initializer=_init_worker)
+        self._jobs[executor] = set()
+        return executor
+
+    async def start(self):
+        """Start the worker processes and wait until every one of them has loaded the pipeline."""
+        self._executor = self._create_executor()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _warm_worker)
+                               for _ in range(self.workers)))
+        print(f"Image pool started with {self.workers} workers")
+
+    async def run(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None) -> Any:
+        """
+        Run fn(*args) in a worker process.
+
+        Raises:
+            PoolBusyError: If the pool and its wait queue are full.
+            JobTimeoutError: If the job takes longer than the timeout. A job that was already running
+                keeps its worker busy, so the pool is rebuilt for later jobs (see _recycle).
+            BrokenProcessPool: If a worker died; the pool is rebuilt for later jobs.
+        """
+        if self._executor is None:
+            raise RuntimeError("ImagePool has not been started")
+        if self.in_flight >= self.capacity:
+            raise PoolBusyError(f"Image pool is full ({self.in_flight} jobs in flight)")
+
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        self.in_flight += 1
+        try:
+            cf_future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self.in_flight -= 1
+            self._restart(executor)
+            raise
+        # The slot is released when the worker is actually done, not when the caller stops
+        # waiting, so timed-out jobs still count against the limit while they keep running.
+        jobs = self._jobs[executor]
+        jobs.add(cf_future)
+        cf_future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release, jobs, cf_future))
+
+        future = asyncio.wrap_future(cf_future)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            # Nobody waits for its outcome any more (e.g. the BrokenProcessPool of a killed worker)
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            if not cf_future.cancel():
+                # Already running: a worker cannot be interrupted, only killed
+                self._recycle(executor, cf_future)
+            raise JobTimeoutError(f"Image job timed out after {timeout or self.timeout}s")
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise
+
+    def _release(self, jobs: Set[Future], cf_future: Future):
+        self.in_flight -= 1
+        jobs.discard(cf_future)
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        # Several jobs can fail on the same broken executor; only replace it once.
+        if self._executor is broken:
+            print("Image pool worker died, restarting pool")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._jobs.pop(broken, None)
+            self._executor = self._create_executor()
+
+    def _recycle(self, executor: ProcessPoolExecutor, hung: Future):
+        """
+        Replace the executor running a timed-out job, so later jobs get all workers again. Its other
+        jobs may finish (for up to one job timeout); then its processes, the hung one's included, are
+        terminated and the hung job's slot is released.
+        """
+        if self._executor is not executor:
+            # Already retired (or broken): its processes are terminated anyway
+            return
+        print("Image job timed out while running, recycling the pool")
+        self._executor = self._create_executor()
+        others = [job for job in self._jobs.pop(executor) if job is not hung]
+        task = asyncio.create_task(self._retire(executor, others))
+        self._retiring.add(task)
+        task.add_done_callback(self._retiring.discard)
+
+    async def _retire(self, executor: ProcessPoolExecutor, jobs: list):
+        try:
+            if jobs:
+                await asyncio.to_thread(wait, jobs, self.timeout)
+        finally:
+            _terminate(executor)
+
+    async def shutdown(self):
+        """Cancel queued jobs and wait for running ones to finish."""
+        # Executors retired after a timeout go right away: their hung worker would never finish
+        for task in list(self._retiring):
+            task.cancel()
+        await asyncio.gather(*self._retiring, return_exceptions=True)
+        self._jobs.clear()
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
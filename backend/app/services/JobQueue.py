@@ -0,0 +1,325 @@
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Union
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Failures that a retry with the same image cannot fix; resubmitting returns the failed job as is
+PERMANENT_ERROR_CODES = {400, 409, 413, 415}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    chain TEXT NOT NULL,
+    image_hash TEXT NOT NULL,
+    source_path TEXT,
+    status TEXT NOT NULL,
+    stage TEXT,
+    tx_hash TEXT,
+    registration_status TEXT,
+    registrations TEXT NOT NULL DEFAULT '{}',
+    error_code INTEGER,
+    error_detail TEXT,
+    timings TEXT NOT NULL DEFAULT '{}',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_queued ON jobs (status, created_at);
+"""
+
+# Columns added after the first release: (name, definition), added to older jobs.db files on open
+MIGRATIONS = [
+    ("registrations", "TEXT NOT NULL DEFAULT '{}'"),
+]
+
+# Columns holding JSON-encoded dicts
+JSON_COLUMNS = ("timings", "registrations")
+
+
+def _read_json(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_json(path: str, value: dict):
+    # Written aside and renamed, so a reader never sees a partial result
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(value, f)
+    os.replace(f"{path}.tmp", path)
+
+
+class JobFailed(Exception):
+    """Raised by a job handler to fail the job with an HTTP-style status code and message."""
+
+    def __init__(self, code: int, detail: str):
+        super().__init__(detail)
+        self.code = code
+        self.detail = detail
+
+
+@dataclass
+class Job:
+    id: str
+    idempotency_key: str
+    chain: str
+    image_hash: str
+    source_path: Optional[str]
+    status: str
+    stage: Optional[str]
+    tx_hash: Optional[str]
+    registration_status: Optional[str]
+    error_code: Optional[int]
+    error_detail: Optional[str]
+    created_at: float
+    updated_at: float
+    timings: Dict[str, float] = field(default_factory=dict)
+    registrations: Dict[str, dict] = field(default_factory=dict)
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Job":
+        values = dict(row)
+        for name in JSON_COLUMNS:
+            values[name] = json.loads(values[name])
+        return cls(**values)
+
+    def to_dict(self) -> dict:
+        """Public status of the job, as returned by GET /jobs/{id}."""
+        return {
+            "jobId": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "chain": self.chain,
+            "imageHash": self.image_hash,
+            "txHash": self.tx_hash,
+            "registrationStatus": self.registration_status,
+            "registrations": self.registrations,
+            "timings": self.timings,
+            "error": {"code": self.error_code, "detail": self.error_detail} if self.status == FAILED else None,
+            "createdAt": self.created_at,
+            "updatedAt": self.updated_at,
+        }
+
+
+class JobQueue:
+    def __init__(self, data_dir: str, handler: Callable[["JobQueue", Job], Awaitable[dict]], workers: int,
+                 poll_interval: float = 1.0):
+        """
+        Persistent upload job queue backed by SQLite, processed by asyncio worker tasks.
+
+        Jobs survive restarts: the uploaded image is kept under data_dir until the job ends, and jobs
+        that were running when the process stopped are queued again on start. Handlers record the
+        progress they make (e.g. a tx hash) on the job, so a resumed job skips finished stages.
+
+        Args:
+            data_dir (str): Directory for jobs.db, uploads/ and results/.
+            handler (callable): async handler(queue, job) -> result dict; raises JobFailed on errors.
+            workers (int): Jobs processed at once.
+            poll_interval (float): Seconds idle workers wait before checking the queue again.
+        """
+        self.data_dir = data_dir
+        self.upload_dir = os.path.join(data_dir, "uploads")
+        self.result_dir = os.path.join(data_dir, "results")
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+
+    # ---- database (runs in worker threads; one connection guarded by a lock) ----
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        with self._lock, self._db:
+            return self._db.execute(sql, params).fetchall()
+
+    def _open(self):
+        os.makedirs(self.upload_dir, exist_ok=True)
+        os.makedirs(self.result_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(self.data_dir, "jobs.db"), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        columns = {row["name"] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for name, definition in MIGRATIONS:
+            if name not in columns:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {name} {definition}")
+        # Whatever was running when the process stopped starts over from its last recorded stage
+        requeued = self._execute("UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? RETURNING id",
+                                 (QUEUED, time.time(), RUNNING))
+        if requeued:
+            print(f"Requeued {len(requeued)} interrupted job(s)")
+
+    def _get(self, job_id: str) -> Optional[Job]:
+        rows = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return Job.from_row(rows[0]) if rows else None
+
+    def _claim(self) -> Optional[Job]:
+        rows = self._execute(
+            "UPDATE jobs SET status = ?, updated_at = ? "
+            "WHERE id = (SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1) RETURNING *",
+            (RUNNING, time.time(), QUEUED))
+        return Job.from_row(rows[0]) if rows else None
+
+    def _update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        for name in JSON_COLUMNS:
+            if name in fields:
+                fields[name] = json.dumps(fields[name])
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        self._execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def _store_source(self, job_id: str, source: Union[bytes, str]) -> str:
+        path = os.path.join(self.upload_dir, job_id)
+        if isinstance(source, str):
+            shutil.move(source, path)
+        else:
+            with open(path, "wb") as f:
+                f.write(source)
+        return path
+
+    def _find(self, idempotency_key: str) -> Optional[Job]:
+        rows = self._execute("SELECT * FROM jobs WHERE idempotency_key = ?", (idempotency_key,))
+        return Job.from_row(rows[0]) if rows else None
+
+    def _submit(self, idempotency_key: str, chain: str, image_hash: str,
+                source: Union[bytes, str]) -> Tuple[Job, bool]:
+        existing = self._find(idempotency_key)
+        if existing is not None and (existing.image_hash != image_hash or existing.chain != chain):
+            # The key belongs to a different upload: never touch that job; the caller rejects the request
+            return existing, False
+        if existing is not None and (existing.status != FAILED or existing.error_code in PERMANENT_ERROR_CODES):
+            return existing, False
+
+        now = time.time()
+        if existing is not None:
+            # Transient failure: run it again with the new copy of the upload, keeping recorded progress
+            path = self._store_source(existing.id, source)
+            self._update(existing.id, source_path=path, status=QUEUED, stage=None, error_code=None,
+                         error_detail=None)
+            return self._get(existing.id), True
+
+        job_id = uuid.uuid4().hex
+        path = self._store_source(job_id, source)
+        try:
+            self._execute(
+                "INSERT INTO jobs (id, idempotency_key, chain, image_hash, source_path, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, idempotency_key, chain, image_hash, path, QUEUED, now, now))
+        except sqlite3.IntegrityError:
+            # A concurrent request with the same key won the insert
+            os.remove(path)
+            return self._find(idempotency_key), False
+        return self._get(job_id), True
+
+    def counts(self) -> Dict[str, int]:
+        """Queued and running jobs by status. Blocking; safe to call from any thread (e.g. a metrics scrape)."""
+        rows = self._execute("SELECT status, COUNT(*) FROM jobs WHERE status IN (?, ?) GROUP BY status",
+                             (QUEUED, RUNNING))
+        return {QUEUED: 0, RUNNING: 0, **{status: count for status, count in rows}}
+
+    # ---- public API ----
+
+    async def start(self):
+        await asyncio.to_thread(self._open)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def submit(self, idempotency_key: str, chain: str, image_hash: str,
+                     source: Union[bytes, str]) -> Tuple[Job, bool]:
+        """
+        Queue an upload unless a job with this idempotency key exists. A job for the key is only
+        re-run (after a transient failure) if it is for the same image hash and chain; otherwise it is
+        returned unchanged, for the caller to reject.
+
+        Args:
+            source: The upload's bytes, or the path of its spooled file (moved into the queue's storage).
+
+        Returns:
+            (job, created): created is False when an existing job is returned unchanged.
+        """
+        job, created = await asyncio.to_thread(self._submit, idempotency_key, chain, image_hash, source)
+        if created:
+            self._wakeup.set()
+        return job, created
+
+    async def find(self, idempotency_key: str) -> Optional[Job]:
+        return await asyncio.to_thread(self._find, idempotency_key)
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await asyncio.to_thread(self._get, job_id)
+
+    async def update(self, job_id: str, **fields):
+        await asyncio.to_thread(self._update, job_id, **fields)
+
+    async def result(self, job_id: str) -> Optional[dict]:
+        path = os.path.join(self.result_dir, f"{job_id}.json")
+        try:
+            return await asyncio.to_thread(_read_json, path)
+        except FileNotFoundError:
+            return None
+
+    @asynccontextmanager
+    async def stage(self, job: Job, name: str):
+        """Mark the job as being in stage name and record how long the stage took in its timings."""
+        job.stage = name
+        await self.update(job.id, stage=name)
+        started = time.perf_counter()
+        yield
+        job.timings[name] = round(time.perf_counter() - started, 3)
+        await self.update(job.id, timings=job.timings)
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._db is not None:
+            self._db.close()
+
+    # ---- workers ----
+
+    async def _worker(self):
+        while True:
+            job = await asyncio.to_thread(self._claim)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Job):
+        try:
+            result = await self.handler(self, job)
+        except asyncio.CancelledError:
+            # Shutting down: the job stays running in the database and is requeued on next start
+            raise
+        except JobFailed as e:
+            await self._finish(job, FAILED, error_code=e.code, error_detail=e.detail)
+        except Exception as e:
+            await self._finish(job, FAILED, error_code=500, error_detail=f"Unexpected error: {e}")
+        else:
+            path = os.path.join(self.result_dir, f"{job.id}.json")
+            await asyncio.to_thread(_write_json, path, result)
+            await self._finish(job, DONE)
+
+    async def _finish(self, job: Job, status: str, **fields):
+        await self.update(job.id, status=status, stage=None, source_path=None, **fields)
+        if job.source_path:
+            try:
+                await asyncio.to_thread(os.remove, job.source_path)
+            except FileNotFoundError:
+                pass
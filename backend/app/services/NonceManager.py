@@ -0,0 +1,70 @@
+import heapq
+import threading
+from typing import Callable, List, Optional, Set
+
+
+class NonceManager:
+    def __init__(self, fetch_nonce: Callable[[], int]):
+        """
+        Hands out transaction nonces for one account locally so concurrent senders never read the same
+        nonce from the chain.
+
+        All methods are thread-safe. The lock is only held for in-memory bookkeeping, except while
+        seeding / resynchronizing from the chain, so async callers should use it from worker threads
+        (asyncio.to_thread), as the registration paths already do.
+
+        Args:
+            fetch_nonce (callable): Returns the account's pending transaction count from the chain.
+        """
+        self.fetch_nonce = fetch_nonce
+        self._lock = threading.Lock()
+        self._next: Optional[int] = None  # seeded from the chain on first use
+        self._released: List[int] = []    # allocated but never sent; reused first so no gap is left behind
+        self._outstanding: Set[int] = set()
+
+    def allocate(self) -> int:
+        with self._lock:
+            if self._next is None:
+                self._next = self.fetch_nonce()
+            if self._released:
+                nonce = heapq.heappop(self._released)
+            else:
+                nonce = self._next
+                self._next += 1
+            self._outstanding.add(nonce)
+            return nonce
+
+    def sent(self, nonce: int):
+        """The transaction with this nonce reached the node."""
+        with self._lock:
+            self._outstanding.discard(nonce)
+
+    def release(self, nonce: int):
+        """The transaction was never sent; hand the nonce out again before any fresh one."""
+        with self._lock:
+            if nonce in self._outstanding:
+                self._outstanding.discard(nonce)
+                heapq.heappush(self._released, nonce)
+
+    def discard(self, nonce: int):
+        """The nonce was consumed elsewhere (nonce too low / replaced); forget it without reusing it."""
+        with self._lock:
+            self._outstanding.discard(nonce)
+
+    def resync(self):
+        """
+        Re-read the pending nonce from the chain.
+
+        If the chain is ahead (transactions sent from this account by someone else) we jump forward.
+        If it is behind and nothing is being sent right now, the missing nonces were dropped by the
+        mempool and are handed out again to close the gap.
+        """
+        chain_nonce = self.fetch_nonce()
+        with self._lock:
+            if self._next is None or not self._outstanding:
+                self._next = chain_nonce
+                self._released = []
+            else:
+                self._next = max(self._next, chain_nonce)
+                self._released = [n for n in self._released if n >= chain_nonce]
+                heapq.heapify(self._released)
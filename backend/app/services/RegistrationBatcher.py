@@ -0,0 +1,100 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+# Per-hash outcomes of a batch registration
+REGISTERED = "registered"   # a Registered event for the hash was emitted by the batch transaction
+DUPLICATE = "duplicate"     # the transaction succeeded but skipped the hash because it already had an owner
+PENDING = "pending"         # the transaction was sent but its receipt did not arrive in time
+FAILED = "failed"           # the transaction reverted
+
+
+@dataclass
+class RegistrationResult:
+    tx_hash: str
+    status: str
+
+
+class RegistrationBatcher:
+    def __init__(self, register_batch: Callable[[List[bytes]], Dict[bytes, RegistrationResult]],
+                 window: float, max_size: int, max_in_flight: int = 1):
+        """
+        Collects image hashes from concurrent requests and registers them with one transaction per batch.
+
+        A batch is sent when max_size hashes are waiting or window seconds after its first hash arrived,
+        whichever comes first.
+
+        Args:
+            register_batch (callable): Blocking function registering a list of hashes and returning a
+                RegistrationResult per hash. It runs in a worker thread.
+            window (float): Seconds to wait for more hashes before sending a partial batch.
+            max_size (int): Maximum hashes per transaction.
+            max_in_flight (int): Batches that may be sent / awaiting receipts at the same time.
+        """
+        self.register_batch = register_batch
+        self.window = window
+        self.max_size = max(1, max_size)
+        self._pending: List[Tuple[bytes, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._in_flight = asyncio.Semaphore(max(1, max_in_flight))
+        self._tasks = set()
+
+    @property
+    def pending(self) -> int:
+        """Hashes waiting for the next batch."""
+        return len(self._pending)
+
+    async def submit(self, image_hash: bytes) -> RegistrationResult:
+        """Queue a hash for the next batch and wait for its result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((image_hash, future))
+
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[:self.max_size], self._pending[self.max_size:]
+        if self._pending:
+            # More than one batch was waiting; start the window again for the remainder
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        if batch:
+            task = asyncio.create_task(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: List[Tuple[bytes, asyncio.Future]]):
+        # The same image may be uploaded twice within one window; register it once
+        hashes = list(dict.fromkeys(image_hash for image_hash, _ in batch))
+        async with self._in_flight:
+            try:
+                results = await asyncio.to_thread(self.register_batch, hashes)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+        seen = set()
+        for image_hash, future in batch:
+            result = results[image_hash]
+            if image_hash in seen and result.status in (REGISTERED, PENDING):
+                # Only the first upload of the hash registered it; later ones in the same window are
+                # duplicates, as they would be in a later batch
+                result = RegistrationResult("", DUPLICATE)
+            seen.add(image_hash)
+            if not future.done():
+                future.set_result(result)
+
+    async def close(self):
+        """Send whatever is still queued and wait for all batches to finish."""
+        while self._pending:
+            self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
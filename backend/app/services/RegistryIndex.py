@@ -0,0 +1,324 @@
+import asyncio
+import os
+import sqlite3
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+from services.ChainServices import ChainUnavailableError
+from utils.bloom import BloomFilter
+from utils.phash import MultiIndexHash
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS registrations (
+    chain TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    timestamp INTEGER,
+    block_number INTEGER,
+    tx_hash TEXT,
+    PRIMARY KEY (chain, hash)
+);
+CREATE INDEX IF NOT EXISTS registrations_owner ON registrations (owner, chain, hash);
+-- ETH blocks indexed through and their hashes, newest reorg_depth kept to detect reorgs
+CREATE TABLE IF NOT EXISTS checkpoints (
+    chain TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    block_hash TEXT NOT NULL,
+    PRIMARY KEY (chain, block_number)
+);
+-- SOL owner PDAs: whose they are and how many of their hashes are indexed
+CREATE TABLE IF NOT EXISTS owner_accounts (
+    chain TEXT NOT NULL,
+    address TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    indexed INTEGER NOT NULL,
+    PRIMARY KEY (chain, address)
+);
+-- Hashes known to be registered before the indexer sees them: our own registrations and the ones
+-- the chain rejected as duplicates
+CREATE TABLE IF NOT EXISTS known_hashes (
+    chain TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    tx_hash TEXT,
+    PRIMARY KEY (chain, hash)
+);
+-- Perceptual hashes of the images we registered (64-bit, stored as signed integers)
+CREATE TABLE IF NOT EXISTS fingerprints (
+    id INTEGER PRIMARY KEY,
+    chain TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    phash INTEGER NOT NULL,
+    UNIQUE (chain, hash)
+);
+"""
+
+
+def normalize_owner(owner: str) -> str:
+    # ETH addresses are case-insensitive (checksum casing); Solana base58 addresses are not
+    return owner.lower() if owner.startswith("0x") else owner
+
+
+def _bloom_key(chain: str, image_hash: str) -> bytes:
+    return f"{chain}:{image_hash}".encode()
+
+
+def _signed64(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class RegistryIndex:
+    def __init__(self, path: str, eth_start_block: int = 0, eth_batch_blocks: int = 2000, eth_reorg_depth: int = 64,
+                 bloom_capacity: int = 1_000_000, bloom_error_rate: float = 0.001):
+        """
+        Local SQLite copy of every registration on chain, so ownership lookups need no RPC.
+
+        ETH: Registered events are read in block-range batches from eth_start_block on, then followed
+        incrementally. After each batch the hash of its last block is kept as a checkpoint; when a
+        checkpoint's block hash changes the chain reorganized, and everything after the newest
+        checkpoint still on chain is dropped and indexed again.
+
+        SOL: the program's owner PDAs list every registered hash; hashes added since the last sync are
+        indexed, with the owner read once per PDA from one of its hash PDAs. Only finalized state is
+        read, which does not roll back.
+
+        Every known (chain, hash) is also kept in an in-memory Bloom filter, so the duplicate
+        pre-check of an upload (is_registered) answers "not registered" without touching the database.
+
+        Images registered through this server also get a perceptual hash (pHash), kept in a
+        multi-index hashing table in memory, so near-duplicates are found by Hamming distance
+        (similar) in milliseconds at millions of images.
+
+        Args:
+            path (str): SQLite database file.
+            eth_start_block (int): Block the contract was deployed in; earlier blocks are not scanned.
+            eth_batch_blocks (int): Blocks per eth_getLogs call (halved while the node rejects the range).
+            eth_reorg_depth (int): Checkpoints kept, i.e. how deep a reorg can be rolled back.
+            bloom_capacity (int): Hashes the Bloom filter is sized for (at least twice those stored at start).
+            bloom_error_rate (float): Share of unregistered hashes that still need a database lookup.
+        """
+        self.path = path
+        self.eth_start_block = eth_start_block
+        self.eth_batch_blocks = max(1, eth_batch_blocks)
+        self.eth_reorg_depth = max(1, eth_reorg_depth)
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+        self._bloom: Optional[BloomFilter] = None
+        self._fingerprints = MultiIndexHash()
+        self._fingerprints_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    # ---- database (runs in worker threads; one connection guarded by a lock) ----
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        with self._lock, self._db:
+            return self._db.execute(sql, params).fetchall()
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        rows = self._execute("SELECT chain, hash FROM registrations UNION SELECT chain, hash FROM known_hashes")
+        self._bloom = BloomFilter(max(self.bloom_capacity, 2 * len(rows)), self.bloom_error_rate)
+        for chain, image_hash in rows:
+            self._bloom.add(_bloom_key(chain, image_hash))
+        rows = self._execute("SELECT id, phash FROM fingerprints")
+        if rows:
+            ids, hashes = np.array(rows, dtype=np.int64).T
+            self._fingerprints.add_many(ids, hashes.view(np.uint64))
+
+    def _lookup(self, image_hash: str) -> List[dict]:
+        rows = self._execute("SELECT * FROM registrations WHERE hash = ? ORDER BY chain", (image_hash,))
+        return [dict(row) for row in rows]
+
+    def _is_known(self, chain: str, image_hash: str) -> bool:
+        rows = self._execute("SELECT 1 FROM registrations WHERE chain = ? AND hash = ? "
+                             "UNION ALL SELECT 1 FROM known_hashes WHERE chain = ? AND hash = ?",
+                             (chain, image_hash, chain, image_hash))
+        return bool(rows)
+
+    def _record(self, chain: str, image_hash: str, tx_hash: Optional[str]):
+        self._execute("INSERT OR IGNORE INTO known_hashes VALUES (?, ?, ?)", (chain, image_hash, tx_hash))
+        self._bloom.add(_bloom_key(chain, image_hash))
+
+    def _record_fingerprint(self, chain: str, image_hash: str, phash: int):
+        rows = self._execute("INSERT OR IGNORE INTO fingerprints (chain, hash, phash) VALUES (?, ?, ?) RETURNING id",
+                             (chain, image_hash, _signed64(phash)))
+        if not rows:
+            return
+        with self._fingerprints_lock:
+            build = self._fingerprints.start_rebuild() if self._fingerprints.add(rows[0][0], phash) else None
+        if build is not None:
+            # Sorting every stored hash takes a while at millions of them: searches use the old tables
+            # (and the buffer) until the new ones are swapped in
+            try:
+                build.run()
+            finally:
+                with self._fingerprints_lock:
+                    self._fingerprints.finish_rebuild(build)
+
+    def _similar(self, phash: int, max_distance: int, limit: int) -> List[dict]:
+        with self._fingerprints_lock:
+            matches = self._fingerprints.search(phash, max_distance, limit)
+        if not matches:
+            return []
+        distances = dict(matches)
+        rows = self._execute(
+            "SELECT f.id, f.chain, f.hash, r.owner, r.timestamp, r.block_number, r.tx_hash "
+            "FROM fingerprints f LEFT JOIN registrations r ON r.chain = f.chain AND r.hash = f.hash "
+            f"WHERE f.id IN ({', '.join('?' * len(distances))})", tuple(distances))
+        results = [{**dict(row), "distance": distances[row["id"]]} for row in rows]
+        return sorted(results, key=lambda row: (row["distance"], row["id"]))
+
+    def _by_owner(self, owner: str, limit: int, offset: int) -> List[dict]:
+        rows = self._execute("SELECT * FROM registrations WHERE owner = ? ORDER BY chain, hash LIMIT ? OFFSET ?",
+                             (normalize_owner(owner), limit, offset))
+        return [dict(row) for row in rows]
+
+    # ---- ETH ----
+
+    def _eth_checkpoints(self) -> list:
+        return self._execute("SELECT block_number, block_hash FROM checkpoints WHERE chain = 'ETH' "
+                             "ORDER BY block_number DESC")
+
+    def _eth_rollback(self, service) -> Optional[int]:
+        """Drop what was indexed after the newest checkpoint still on chain; returns the block indexed through."""
+        checkpoints = self._eth_checkpoints()
+        for number, block_hash in checkpoints:
+            if service.block_hash(number) == block_hash:
+                break
+        else:
+            number = None
+        if checkpoints and number != checkpoints[0][0]:
+            print(f"ETH reorg: re-indexing after block {number}")
+            keep = number if number is not None else self.eth_start_block - 1
+            with self._lock, self._db:
+                self._db.execute("DELETE FROM registrations WHERE chain = 'ETH' AND block_number > ?", (keep,))
+                self._db.execute("DELETE FROM checkpoints WHERE chain = 'ETH' AND block_number > ?", (keep,))
+        return number
+
+    def sync_eth(self, service):
+        """Index Registered events up to the current head, rolling back first if the chain reorganized."""
+        indexed = self._eth_rollback(service)
+        cursor = indexed if indexed is not None else self.eth_start_block - 1
+        head = service.block_number()
+        batch = self.eth_batch_blocks
+        while cursor < head and not self._stop.is_set():
+            to_block = min(cursor + batch, head)
+            to_hash = service.block_hash(to_block)
+            try:
+                events = service.registered_events(cursor + 1, to_block)
+            except Exception as e:
+                if batch == 1:
+                    raise
+                # Most nodes cap the range or the number of logs per call
+                print(f"Error reading ETH events ({e}), retrying with smaller ranges")
+                batch = self.eth_batch_blocks = max(1, batch // 2)
+                continue
+            if service.block_hash(to_block) != to_hash:
+                # Reorganized while reading: read the range again
+                continue
+            with self._lock, self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO registrations (chain, hash, owner, timestamp, block_number, tx_hash) "
+                    "VALUES ('ETH', ?, ?, ?, ?, ?)",
+                    [(e["hash"], normalize_owner(e["owner"]), e["timestamp"], e["block_number"], e["tx_hash"])
+                     for e in events])
+                self._db.execute("INSERT OR REPLACE INTO checkpoints VALUES ('ETH', ?, ?)", (to_block, to_hash))
+                self._db.execute(
+                    "DELETE FROM checkpoints WHERE chain = 'ETH' AND block_number NOT IN "
+                    "(SELECT block_number FROM checkpoints WHERE chain = 'ETH' ORDER BY block_number DESC LIMIT ?)",
+                    (self.eth_reorg_depth,))
+            for e in events:
+                self._bloom.add(_bloom_key("ETH", e["hash"]))
+            cursor = to_block
+
+    # ---- SOL ----
+
+    def sync_sol(self, service):
+        """Index hashes added to the program's owner PDAs since the last sync."""
+        known = {row["address"]: (row["owner"], row["indexed"])
+                 for row in self._execute("SELECT * FROM owner_accounts WHERE chain = 'SOL'")}
+        accounts = {address: hashes for address, hashes in service.owner_accounts().items()
+                    if hashes and len(hashes) > known.get(address, (None, 0))[1]}
+        if not accounts:
+            return
+        # Any hash of an owner PDA names its owner
+        unknown = {hashes[0]: address for address, hashes in accounts.items() if address not in known}
+        owners = {unknown[h]: owner for h, owner in service.hash_owners(list(unknown)).items()}
+
+        with self._lock, self._db:
+            for address, hashes in accounts.items():
+                owner = known[address][0] if address in known else owners.get(address)
+                if owner is None:
+                    continue
+                start = known.get(address, (None, 0))[1]
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO registrations (chain, hash, owner) VALUES ('SOL', ?, ?)",
+                    [(h.hex(), owner) for h in hashes[start:]])
+                self._db.execute("INSERT OR REPLACE INTO owner_accounts VALUES ('SOL', ?, ?, ?)",
+                                 (address, owner, len(hashes)))
+                for h in hashes[start:]:
+                    self._bloom.add(_bloom_key("SOL", h.hex()))
+
+    # ---- public API ----
+
+    async def start(self):
+        await asyncio.to_thread(self._open)
+
+    async def lookup(self, image_hash: str) -> List[dict]:
+        """Registrations of a hash (lowercase hex), one per chain it is registered on."""
+        return await asyncio.to_thread(self._lookup, image_hash)
+
+    async def is_registered(self, chain: str, image_hash: str) -> bool:
+        """
+        Whether a hash (lowercase hex) is known to be registered on chain. Most uploads are new, and
+        for those the Bloom filter answers in microseconds; its hits are confirmed in the database.
+        """
+        if _bloom_key(chain, image_hash) not in self._bloom:
+            return False
+        return await asyncio.to_thread(self._is_known, chain, image_hash)
+
+    async def record(self, chain: str, image_hash: str, tx_hash: Optional[str] = None):
+        """Remember a hash registered by us (tx_hash) or rejected by the chain as already registered."""
+        await asyncio.to_thread(self._record, chain, image_hash, tx_hash)
+
+    async def record_fingerprint(self, chain: str, image_hash: str, phash: int):
+        """Store the perceptual hash of a registered image (first one wins)."""
+        await asyncio.to_thread(self._record_fingerprint, chain, image_hash, phash)
+
+    async def similar(self, phash: int, max_distance: int, limit: int = 10) -> List[dict]:
+        """Registered images whose pHash is within max_distance bits of phash, nearest first."""
+        return await asyncio.to_thread(self._similar, phash, max_distance, limit)
+
+    async def by_owner(self, owner: str, limit: int = 100, offset: int = 0) -> List[dict]:
+        """Registrations by an ETH or SOL address."""
+        return await asyncio.to_thread(self._by_owner, owner, limit, offset)
+
+    async def run(self, chain_services, interval: float):
+        """Sync every available chain, then again every interval seconds."""
+        syncs = {"ETH": self.sync_eth, "SOL": self.sync_sol}
+        while True:
+            for chain, sync in syncs.items():
+                try:
+                    service = chain_services.get(chain)
+                except (ValueError, ChainUnavailableError):
+                    continue
+                try:
+                    await asyncio.to_thread(sync, service)
+                except Exception as e:
+                    print(f"Error: {chain} registry sync failed: {e}")
+            await asyncio.sleep(interval)
+
+    def close(self):
+        # Stops a running backfill at its next batch
+        self._stop.set()
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
@@ -1,35 +1,192 @@
-import hashlib
 import base58
 import os
+import time
+from dataclasses import dataclass
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Dict, List, Optional, Set, Union
+import hashlib
+import threading
+import httpx
 from solana.rpc.api import Client
+from solana.rpc.commitment import Confirmed, Finalized
+from solana.rpc.core import RPCException
+from solana.rpc.types import MemcmpOpts, TxOpts
+from solders.compute_budget import set_compute_unit_limit
+from solders.hash import Hash
 from solders.instruction import Instruction, AccountMeta
 from solders.transaction import Transaction
 from solders.pubkey import Pubkey
 from solders.keypair import Keypair
 from solders.system_program import ID as SYS_PROGRAM_ID
 from solders.message import Message
+from solders.signature import Signature
+from config import parse_endpoints
+from services.ChainServices import DuplicateImageError
+from services.RegistrationBatcher import RegistrationResult, DUPLICATE, PENDING
+from utils.metrics import rpc
+
+# Maximum serialized transaction size and compute units per transaction
+PACKET_DATA_SIZE = 1232
+MAX_COMPUTE_UNITS = 1_400_000
+# Anchor error code 6001 (HashAlreadyRegistered) as reported in program logs
+HASH_ALREADY_REGISTERED_ERROR = "custom program error: 0x1771"
+# Anchor account discriminator of OwnerAccount: first 8 bytes of SHA256("account:OwnerAccount")
+OWNER_ACCOUNT_DISCRIMINATOR = hashlib.sha256(b"account:OwnerAccount").digest()[:8]
+
+
+@dataclass
+class CachedBlockhash:
+    blockhash: Hash
+    last_valid_block_height: int
+    fetched_at: float
+
+
+class BlockhashCache:
+    def __init__(self, get_client, refresh_interval: float = 20, max_age: float = 45):
+        """
+        Recent blockhash refreshed by a background thread, so sending a transaction needs no extra RPC.
+
+        A blockhash stays valid for ~150 blocks (60-90 s); max_age keeps us well inside that window
+        and get() falls back to a synchronous fetch if the background refresh fell behind.
+        """
+        self.get_client = get_client
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self._cached: Optional[CachedBlockhash] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._refresh_loop, name="blockhash-cache", daemon=True)
+        self._thread.start()
+
+    def refresh(self) -> CachedBlockhash:
+        with rpc("SOL", "blockhash"):
+            value = self.get_client().get_latest_blockhash().value
+        cached = CachedBlockhash(value.blockhash, value.last_valid_block_height, time.monotonic())
+        with self._lock:
+            self._cached = cached
+        return cached
+
+    def get(self) -> CachedBlockhash:
+        with self._lock:
+            cached = self._cached
+        if cached is None or time.monotonic() - cached.fetched_at > self.max_age:
+            cached = self.refresh()
+        return cached
+
+    def invalidate(self):
+        with self._lock:
+            self._cached = None
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error refreshing blockhash: {e}")
+
+    def close(self):
+        self._stop.set()
+
+
+class ConfirmationTracker:
+    def __init__(self, get_client, poll_interval: float = 2, keep: int = 10000):
+        """
+        Follows sent transactions in a background thread so senders do not wait for confirmation.
+
+        Status is "pending" until the cluster reports it, then "processed", "confirmed", "finalized"
+        or "failed"; a transaction still unseen when its blockhash expires becomes "expired".
+        """
+        self.get_client = get_client
+        self.poll_interval = poll_interval
+        self.keep = keep
+        self._statuses: Dict[str, str] = {}
+        self._watching: Dict[str, int] = {}  # signature -> last valid block height
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._poll_loop, name="confirmation-tracker", daemon=True)
+        self._thread.start()
+
+    def track(self, signature: Signature, last_valid_block_height: int):
+        with self._lock:
+            self._statuses[str(signature)] = PENDING
+            self._watching[str(signature)] = last_valid_block_height
+            # Forget the oldest statuses (dicts keep insertion order)
+            while len(self._statuses) > self.keep:
+                oldest = next(iter(self._statuses))
+                self._statuses.pop(oldest)
+                self._watching.pop(oldest, None)
+
+    def status(self, signature: str) -> Optional[str]:
+        with self._lock:
+            return self._statuses.get(signature)
+
+    def poll(self):
+        with self._lock:
+            watching = list(self._watching.items())
+        if not watching:
+            return
+        client = self.get_client()
+        with rpc("SOL", "block_height"):
+            block_height = client.get_block_height().value
+        for start in range(0, len(watching), 256):  # RPC limit per call
+            chunk = watching[start:start + 256]
+            with rpc("SOL", "signature_statuses"):
+                statuses = client.get_signature_statuses([Signature.from_string(sig) for sig, _ in chunk]).value
+            with self._lock:
+                for (sig, last_valid), status in zip(chunk, statuses):
+                    if status is None:
+                        if block_height > last_valid:
+                            self._statuses[sig] = "expired"
+                            self._watching.pop(sig, None)
+                        continue
+                    if status.err is not None:
+                        self._statuses[sig] = "failed"
+                        print(f"Error: transaction {sig} failed: {status.err}")
+                    elif status.confirmation_status is not None:
+                        # TransactionConfirmationStatus.Confirmed -> "confirmed"
+                        self._statuses[sig] = str(status.confirmation_status).split(".")[-1].lower()
+                    if self._statuses[sig] in ("failed", "finalized"):
+                        self._watching.pop(sig, None)
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error polling confirmations: {e}")
+
+    def close(self):
+        self._stop.set()
+
 
 class SolService:
-    def __init__(self, network_rpc: Optional[str] = None, private_key: Optional[str] = None, 
-                 program_id: Optional[str] = None):
+    def __init__(self, network_rpc: Optional[Union[str, List[str]]] = None, private_key: Optional[str] = None, 
+                 program_id: Optional[str] = None, confirm_mode: str = "async", skip_preflight: bool = False,
+                 cu_per_register: int = 50_000):
         """
         Initialize the SolService class to interact with a Solana program on the devnet.
+        Create it once per process and share it; clients keep their HTTP connections alive.
         
         Args:
-            network_rpc (str, optional): Solana devnet RPC URL. Defaults to environment variable SOLANA_DEVNET_RPC.
+            network_rpc (str | list, optional): Solana devnet RPC URL, comma-separated URLs or a list of URLs,
+                tried in order on failover. Defaults to environment variable SOLANA_DEVNET_RPC.
             private_key (str, optional): Base58-encoded private key. Defaults to environment variable SOLANA_PRIVATE_KEY.
             program_id (str, optional): Solana program ID. Defaults to environment variable SOLANA_PROGRAM_ID.
+            confirm_mode (str): "async" returns right after sending and tracks confirmation in the
+                background; "wait" blocks until the transaction is confirmed.
+            skip_preflight (bool): Skip the RPC node's simulation before sending.
+            cu_per_register (int): Compute units budgeted per register_image instruction when packing.
         """
         # Load environment variables
         load_dotenv()
         
-        # Initialize Solana client
-        self.client = Client(network_rpc or os.getenv("SOLANA_DEVNET_RPC"))
-        if not self.client.is_connected():
-            raise ConnectionError("Failed to connect to Solana devnet. Check your RPC URL.")
-        print("Connected to Solana devnet")
+        self.endpoints = parse_endpoints(network_rpc or os.getenv("SOLANA_DEVNET_RPC"))
+        if not self.endpoints:
+            raise ValueError("No Solana RPC URL provided or found in environment variables.")
+        # One client (and so one keep-alive connection pool) per endpoint, created on first use
+        self._clients = {}
+        self._lock = threading.Lock()
+        self.endpoint_index = 0
         
         # Load wallet private key (assuming base58-encoded 64-byte keypair)
         private_key_str = private_key or os.getenv("SOLANA_PRIVATE_KEY")
@@ -43,70 +200,263 @@ class SolService:
         if not program_id_str:
             raise ValueError("No program ID provided or found in environment variables.")
         self.program_id = Pubkey.from_string(program_id_str)
-        
-    def register_image(self, image_data: bytes) -> str:
-        """
-        Register an image hash on the Solana blockchain.
-        
-        Args:
-            image_data (bytes): The image data to hash and register.
-        
-        Returns:
-            str: The transaction signature (hash) as a string.
-        
-        Raises:
-            Exception: If the transaction fails to send.
-        """
-        # Compute the 32-byte SHA256 hash of the image data
-        image_hash = hashlib.sha256(image_data).digest()
-        print(f"Image hash: {image_hash.hex()}")  
-        # Compute the instruction discriminator (first 8 bytes of SHA256("global:register_image"))
-        discriminator = hashlib.sha256(b"global:register_image").digest()[:8]
-  
-        # Derive program-derived addresses (PDAs) for hash_account and owner_account
+
+        # Depend only on the program and the wallet: compute once
+        # Instruction discriminator: first 8 bytes of SHA256("global:register_image")
+        self.discriminator = hashlib.sha256(b"global:register_image").digest()[:8]
+        self.owner_account, self.owner_bump = Pubkey.find_program_address(
+            [b"owner", bytes(self.wallet.pubkey())], self.program_id)
+
+        self.confirm_mode = confirm_mode
+        self.skip_preflight = skip_preflight
+        self.cu_per_register = cu_per_register
+
+        self.connect()
+        self.blockhashes = BlockhashCache(lambda: self.client)
+        self.confirmations = ConfirmationTracker(lambda: self.client)
+
+    def _client_for(self, index: int) -> Client:
+        if index not in self._clients:
+            self._clients[index] = Client(self.endpoints[index], timeout=10)
+        return self._clients[index]
+
+    def _is_connected(self, client: Client) -> bool:
+        try:
+            with rpc("SOL", "health"):
+                return client.is_connected()
+        except Exception:
+            return False
+
+    def connect(self, start: int = 0):
+        """Connect to the first healthy endpoint, starting at index start and wrapping around."""
+        with self._lock:
+            for offset in range(len(self.endpoints)):
+                index = (start + offset) % len(self.endpoints)
+                client = self._client_for(index)
+                if self._is_connected(client):
+                    self.client, self.endpoint_index = client, index
+                    print(f"Connected to Solana devnet via endpoint #{index}")
+                    return
+                print(f"Solana endpoint #{index} unreachable")
+        raise ConnectionError("Failed to connect to Solana devnet. Check your RPC URL.")
+
+    def health_check(self) -> bool:
+        """Probe the current endpoint and fail over to the next healthy one if it is down."""
+        if self._is_connected(self.client):
+            return True
+        try:
+            self.connect(start=self.endpoint_index + 1)
+            return True
+        except ConnectionError as e:
+            print(f"Error: {e}")
+            return False
+
+    def close(self):
+        self.blockhashes.close()
+        self.confirmations.close()
+        for client in self._clients.values():
+            client._provider.session.close()
+
+    def register_image(self, image_hash: bytes) -> str:
+        """Register an image hash, failing over to the next endpoint once on connection errors."""
+        try:
+            return self._register_image(image_hash)
+        except (httpx.ConnectError, httpx.TimeoutException) as e:
+            print(f"Error registering image: {e}, failing over")
+            self.connect(start=self.endpoint_index + 1)
+            return self._register_image(image_hash)
+
+    def _register_instruction(self, image_hash: bytes) -> Instruction:
+        # Only the hash PDA depends on the image; the owner PDA and discriminator are computed once
         hash_account, hash_bump = Pubkey.find_program_address([b"hash", image_hash], self.program_id)
-        owner_account, owner_bump = Pubkey.find_program_address([b"owner", bytes(self.wallet.pubkey())], self.program_id) 
 
         instruction_data = (
-            discriminator +           # 8字节
+            self.discriminator +      # 8字节
             image_hash +              # 32字节
             bytes([hash_bump]) +      # 1字节
-            bytes([owner_bump])       # 1字节
+            bytes([self.owner_bump])  # 1字节
         )  # 总共 42字节
-              
+
         # Define the accounts required by the RegisterImage instruction
         accounts = [
             AccountMeta(pubkey=hash_account, is_signer=False, is_writable=True),      # hash_account (writable)
-            AccountMeta(pubkey=owner_account, is_signer=False, is_writable=True),    # owner_account (writable)
+            AccountMeta(pubkey=self.owner_account, is_signer=False, is_writable=True),    # owner_account (writable)
             AccountMeta(pubkey=self.wallet.pubkey(), is_signer=True, is_writable=True), # author (signer, writable)
             AccountMeta(pubkey=SYS_PROGRAM_ID, is_signer=False, is_writable=False),  # system_program (read-only)
         ]
-        
-        # Create the transaction instruction
-        instruction = Instruction(
+
+        return Instruction(
             program_id=self.program_id,
             accounts=accounts,
             data=instruction_data
         )
-        
-        # Build the transaction
-        recent_blockhash = self.client.get_latest_blockhash().value.blockhash
+
+    def _build_transaction(self, instructions: List[Instruction], recent_blockhash) -> Transaction:
         message = Message(
                 payer=self.wallet.pubkey(),
-                instructions=[instruction],
+                instructions=instructions,
             )
+        # Transaction() signs with the given keypairs
+        return Transaction([self.wallet], message, recent_blockhash)
+
+    def _send(self, instructions: List[Instruction]) -> str:
+        """
+        Sign and send a transaction with the cached blockhash. A stale blockhash is refreshed and the
+        send retried once. Depending on confirm_mode the signature is tracked in the background
+        ("async") or confirmed before returning ("wait").
+        """
+        client = self.client
+        for attempt in range(2):
+            blockhash = self.blockhashes.get()
+            transaction = self._build_transaction(instructions, blockhash.blockhash)
+            try:
+                with rpc("SOL", "send"):
+                    response = client.send_raw_transaction(bytes(transaction),
+                                                           opts=TxOpts(skip_preflight=self.skip_preflight))
+                break
+            except RPCException as e:
+                if HASH_ALREADY_REGISTERED_ERROR in str(e):
+                    raise DuplicateImageError("Image hash is already registered") from e
+                if attempt == 0 and "blockhash not found" in str(e).lower():
+                    self.blockhashes.invalidate()
+                    continue
+                print(f"Error registering image: {e}")
+                raise
+
+        tx_signature = response.value
+        if self.confirm_mode == "wait":
+            with rpc("SOL", "confirm"):
+                client.confirm_transaction(tx_signature, commitment=Confirmed,
+                                           last_valid_block_height=blockhash.last_valid_block_height)
+        else:
+            self.confirmations.track(tx_signature, blockhash.last_valid_block_height)
+        return str(tx_signature)
+
+    def _register_image(self, image_hash: bytes) -> str:
+        """
+        Register an image hash on the Solana blockchain.
         
-        transaction = Transaction([self.wallet], message, recent_blockhash)
+        Args:
+            image_hash (bytes): 32-byte SHA256 hash of the image data.
         
-         # Sign the transaction
-        transaction.sign([self.wallet], recent_blockhash)
+        Returns:
+            str: The transaction signature (hash) as a string.
         
-        # Send the transaction
+        Raises:
+            Exception: If the transaction fails to send.
+        """
+        print(f"Image hash: {image_hash.hex()}")
+
+        tx_signature = self._send([self._register_instruction(image_hash)])
+        print(f"Image registered on the blockchain with transaction signature: {tx_signature}")
+        return tx_signature, str(image_hash.hex())
+
+    def hash_owners(self, image_hashes: List[bytes], commitment=None) -> Dict[bytes, str]:
+        """Owner of each registered hash (read from its hash PDA with getMultipleAccounts); unregistered ones are left out."""
+        owners = {}
+        for start in range(0, len(image_hashes), 100):  # RPC limit per call
+            chunk = image_hashes[start:start + 100]
+            pdas = [Pubkey.find_program_address([b"hash", h], self.program_id)[0] for h in chunk]
+            with rpc("SOL", "accounts"):
+                accounts = self.client.get_multiple_accounts(pdas, commitment=commitment).value
+            for image_hash, account in zip(chunk, accounts):
+                # HashAccount: 8-byte discriminator + 32-byte owner
+                if account is not None and bytes(account.data[8:40]) != bytes(32):
+                    owners[image_hash] = str(Pubkey.from_bytes(bytes(account.data[8:40])))
+        return owners
+
+    def _registered_hashes(self, image_hashes: List[bytes]) -> Set[bytes]:
+        """Hashes whose hash PDA already has an owner."""
+        return set(self.hash_owners(image_hashes))
+
+    def owner_accounts(self) -> Dict[str, List[bytes]]:
+        """
+        Hashes listed in every owner PDA of the program (finalized state), by PDA address.
+
+        The owner's own address is only a seed of the PDA; the hash PDAs of the listed hashes hold it
+        (see hash_owners).
+        """
+        with rpc("SOL", "program_accounts"):
+            response = self.client.get_program_accounts(
+                self.program_id, commitment=Finalized,
+                filters=[MemcmpOpts(offset=0, bytes=base58.b58encode(OWNER_ACCOUNT_DISCRIMINATOR).decode())])
+        accounts = {}
+        for keyed in response.value:
+            # OwnerAccount: 8-byte discriminator + u32 (little-endian) count + 32-byte hashes
+            data = bytes(keyed.account.data)
+            count = int.from_bytes(data[8:12], "little")
+            accounts[str(keyed.pubkey)] = [data[12 + 32 * i:44 + 32 * i] for i in range(count)]
+        return accounts
+
+    def pack_instructions(self, image_hashes: List[bytes]) -> List[List[bytes]]:
+        """
+        Split hashes into groups that each fit one transaction, limited by the serialized transaction
+        size and by the compute budget (cu_per_register units per instruction).
+        """
+        max_by_compute = MAX_COMPUTE_UNITS // self.cu_per_register
+        placeholder = Hash.default()
+        groups, current = [], []
+        for image_hash in image_hashes:
+            candidate = current + [image_hash]
+            instructions = [set_compute_unit_limit(len(candidate) * self.cu_per_register)] + \
+                [self._register_instruction(h) for h in candidate]
+            fits = len(candidate) <= max_by_compute and \
+                len(bytes(self._build_transaction(instructions, placeholder))) <= PACKET_DATA_SIZE
+            if fits or not current:
+                current = candidate
+            else:
+                groups.append(current)
+                current = [image_hash]
+        if current:
+            groups.append(current)
+        return groups
+
+    def register_batch(self, image_hashes: List[bytes]) -> Dict[bytes, RegistrationResult]:
+        """
+        Register several image hashes, packing as many register_image instructions per transaction as
+        the size and compute limits allow.
+
+        A transaction is atomic, so one duplicate would fail the whole group: hashes that are already
+        registered are found up front and reported as duplicates instead of being sent. If a group still
+        fails as a duplicate, only the hashes registered by then are duplicates; the rest are resent.
+
+        Args:
+            image_hashes (list): 32-byte image hashes.
+
+        Returns:
+            dict: Hash -> RegistrationResult. Sent hashes are "pending" until confirmed, see
+                confirmation_status().
+        """
+        registered = self._registered_hashes(image_hashes)
+        results = {h: RegistrationResult("", DUPLICATE) for h in registered}
+        for group in self.pack_instructions([h for h in image_hashes if h not in registered]):
+            instructions = [set_compute_unit_limit(len(group) * self.cu_per_register)] + \
+                [self._register_instruction(h) for h in group]
+            try:
+                tx_signature = self._send(instructions)
+            except DuplicateImageError:
+                # Some hash was registered by someone else since the check above. The transaction rolled
+                # back as a whole, so the rest of the group is not registered: look up which hashes are
+                # taken now and send the others one per transaction.
+                taken = self._registered_hashes(group)
+                results.update({h: RegistrationResult("", DUPLICATE) for h in taken})
+                for image_hash in group:
+                    if image_hash not in taken:
+                        results[image_hash] = self._register_single(image_hash)
+                continue
+            print(f"Batch of {len(group)} images sent with transaction signature: {tx_signature}")
+            results.update({h: RegistrationResult(tx_signature, PENDING) for h in group})
+        return results
+
+    def _register_single(self, image_hash: bytes) -> RegistrationResult:
+        """Send one hash in a transaction of its own; a duplicate then really is this hash."""
         try:
-            response = self.client.send_raw_transaction(bytes(transaction))
-            tx_signature = response.value
-            print(f"Image registered on the blockchain with transaction signature: {tx_signature}")
-            return str(tx_signature), str(image_hash.hex())
-        except Exception as e:
-            print(f"Error registering image: {e}")
-            raise
\ No newline at end of file
+            tx_signature = self._send([set_compute_unit_limit(self.cu_per_register),
+                                       self._register_instruction(image_hash)])
+        except DuplicateImageError:
+            return RegistrationResult("", DUPLICATE)
+        return RegistrationResult(tx_signature, PENDING)
+
+    def confirmation_status(self, tx_signature: str) -> Optional[str]:
+        """Last known status of a transaction sent by this service (see ConfirmationTracker)."""
+        return self.confirmations.status(tx_signature)
@@ -0,0 +1,34 @@
+"""
+Bloom filter over byte strings: "definitely not present" in a few microseconds, with a bounded
+false positive rate for "maybe present".
+"""
+import hashlib
+import math
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        """
+        Args:
+            capacity (int): Items the filter is sized for; past it the false positive rate grows.
+            error_rate (float): False positive rate at capacity.
+        """
+        capacity = max(1, capacity)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: bytes):
+        # Kirsch-Mitzenmacher: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key: bytes):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
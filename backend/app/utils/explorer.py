@@ -0,0 +1,76 @@
+"""
+Block explorer links embedded in watermarks, and parsing them back out of a decoded QR code.
+
+An image registered on one chain carries that chain's explorer link. One registered on several
+carries a proof URL listing every transaction ({base}?ETH=<tx>&SOL=<signature>), which the proof
+endpoint resolves to the explorer links.
+"""
+import re
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+EXPLORER_URLS = {
+    "ETH": "https://sepolia.etherscan.io/tx/0x{tx_hash}",
+    "SOL": "https://explorer.solana.com/tx/{tx_hash}?cluster=devnet",
+}
+
+EXPLORER_PATTERNS = {
+    "ETH": re.compile(r"^https://sepolia\.etherscan\.io/tx/0x(?P<tx>[0-9a-fA-F]{64})$"),
+    "SOL": re.compile(r"^https://explorer\.solana\.com/tx/(?P<tx>[1-9A-HJ-NP-Za-km-z]{32,88})\?cluster=devnet$"),
+}
+
+
+def explorer_url(chain: str, tx_hash: str) -> str:
+    """Explorer link for a registration transaction (ETH tx hashes are given without 0x)."""
+    if chain not in EXPLORER_URLS:
+        raise ValueError(f"Unsupported chain: {chain}")
+    return EXPLORER_URLS[chain].format(tx_hash=tx_hash)
+
+
+def parse_explorer_url(url: str) -> Optional[Tuple[str, str]]:
+    """(chain, tx_hash) of an explorer link made by explorer_url, or None for anything else."""
+    for chain, pattern in EXPLORER_PATTERNS.items():
+        match = pattern.match(url)
+        if match:
+            return chain, match.group("tx")
+    return None
+
+
+def is_valid_tx(chain: str, tx_hash: str) -> bool:
+    return chain in EXPLORER_PATTERNS and EXPLORER_PATTERNS[chain].match(explorer_url(chain, tx_hash)) is not None
+
+
+def proof_url(base_url: Optional[str], tx_hashes: Dict[str, str]) -> str:
+    """Proof URL listing the registration transactions of an image on several chains."""
+    if not base_url:
+        raise ValueError("No proof base URL configured (PROOF_BASE_URL)")
+    return f"{base_url}?{urlencode(tx_hashes)}"
+
+
+def parse_proof_url(url: str) -> Optional[Dict[str, str]]:
+    """Chain -> tx hash of a proof URL made by proof_url (any base URL), or None for anything else."""
+    try:
+        query = urlsplit(url).query
+        pairs = parse_qsl(query, strict_parsing=True) if query else []
+    except ValueError:
+        return None
+    tx_hashes = dict(pairs)
+    if not pairs or len(tx_hashes) != len(pairs) or not all(is_valid_tx(c, tx) for c, tx in tx_hashes.items()):
+        return None
+    return tx_hashes
+
+
+def watermark_url(proof_base_url: Optional[str], tx_hashes: Dict[str, str]) -> str:
+    """The link embedded for a registration: the explorer link for one chain, a proof URL for several."""
+    if len(tx_hashes) == 1:
+        (chain, tx_hash), = tx_hashes.items()
+        return explorer_url(chain, tx_hash)
+    return proof_url(proof_base_url, tx_hashes)
+
+
+def parse_watermark_url(url: str) -> Dict[str, str]:
+    """Chain -> tx hash named by a link made by watermark_url; empty for any other text."""
+    explorer = parse_explorer_url(url)
+    if explorer is not None:
+        return dict([explorer])
+    return parse_proof_url(url) or {}
@@ -1,42 +1,194 @@
 import qrcode
-import os
 import io
+from functools import lru_cache
+from typing import Optional, Tuple, Union
+import cv2
+import numpy as np
 from PIL import Image
+# pyzbar needs the zbar shared library; on macOS:
+# $ mkdir ~/lib
+# $ ln -s $(brew --prefix zbar)/lib/libzbar.dylib ~/lib/libzbar.dylib
+from pyzbar.pyzbar import decode as zbar_decode
+
+# cv2 flags decoding a JPEG straight to 1/1, 1/2, 1/4 or 1/8 resolution in the DCT domain
+REDUCED_JPEG_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+# EXIF orientation -> operations turning the stored pixels upright
+EXIF_ORIENTATION_OPS = {
+    2: [lambda img: cv2.flip(img, 1)],
+    3: [lambda img: cv2.rotate(img, cv2.ROTATE_180)],
+    4: [lambda img: cv2.flip(img, 0)],
+    5: [lambda img: cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE), lambda img: cv2.flip(img, 1)],
+    6: [lambda img: cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)],
+    7: [lambda img: cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE), lambda img: cv2.flip(img, 1)],
+    8: [lambda img: cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)],
+}
+
+
+def _exif_orientation(source: Union[bytes, str]) -> int:
+    # Image.open only parses the header
+    try:
+        with Image.open(source if isinstance(source, str) else io.BytesIO(source)) as header:
+            if header.format == "PNG":
+                # PngImageFile.getexif() decodes the whole image looking for a late eXIf chunk
+                exif = Image.Exif()
+                exif.load(header.info.get("exif", b""))
+            else:
+                exif = header.getexif()
+            return exif.get(0x0112, 1)
+    except Exception:
+        return 1
+
+
+def _to_bgr8(img: np.ndarray) -> np.ndarray:
+    """Bring an IMREAD_UNCHANGED result to 8-bit, 3-channel BGR (alpha is composited onto white)."""
+    if img.dtype == np.uint16:
+        img = (img >> 8).astype(np.uint8)
+    elif img.dtype != np.uint8:
+        img = np.clip(img, 0, 255).astype(np.uint8)
+    if img.ndim == 2:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    if img.shape[2] == 4:
+        bgr, alpha = img[:, :, :3], img[:, :, 3:]
+        if alpha.min() == 255:
+            return np.ascontiguousarray(bgr)
+        # Transparent pixels carry arbitrary colour data; show them as white
+        white = np.full_like(bgr, 255)
+        return cv2.blendLinear(bgr, white, (alpha[:, :, 0] / 255).astype(np.float32),
+                               (1 - alpha[:, :, 0] / 255).astype(np.float32))
+    return img
 
-def generate_qr_code(url, output_file=None, target_size=(128, 128)):
-    # Create QR code object
+
+def decode_image_bgr(source: Union[bytes, str], reduce: int = 1) -> np.ndarray:
+    """
+    Decode an image straight to an upright 8-bit BGR ndarray, without intermediate PIL / RGB copies.
+
+    Args:
+        source: Encoded image bytes or the path of a spooled upload.
+        reduce (int): 1, 2, 4 or 8. JPEGs are decoded at that fraction of their resolution in the DCT
+            domain, other formats are decoded in full and downscaled.
+
+    Returns:
+        np.ndarray: HxWx3 uint8 BGR image with EXIF orientation applied.
+    """
+    if reduce not in REDUCED_JPEG_FLAGS:
+        raise ValueError("reduce must be 1, 2, 4 or 8")
+    buf = np.fromfile(source, dtype=np.uint8) if isinstance(source, str) else np.frombuffer(source, dtype=np.uint8)
+
+    if buf[:3].tobytes() == b"\xff\xd8\xff":
+        # JPEG: libjpeg scales during decoding and IMREAD_COLOR applies EXIF orientation itself
+        img = cv2.imdecode(buf, REDUCED_JPEG_FLAGS[reduce])
+        if img is None:
+            raise ValueError("Unreadable image")
+        return img
+
+    # Other formats may carry alpha or 16-bit samples, which IMREAD_COLOR would silently mangle
+    img = cv2.imdecode(buf, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise ValueError("Unreadable image")
+    img = _to_bgr8(img)
+    for op in EXIF_ORIENTATION_OPS.get(_exif_orientation(source), []):
+        img = op(img)
+    if reduce > 1:
+        img = cv2.resize(img, (img.shape[1] // reduce, img.shape[0] // reduce), interpolation=cv2.INTER_AREA)
+    return img
+
+
+def _module_index(pixels: int, modules: int) -> np.ndarray:
+    """Module sampled by each pixel when `modules` modules are drawn across `pixels` (nearest neighbour)."""
+    return (2 * np.arange(pixels) + 1) * modules // (2 * pixels)
+
+
+@lru_cache(maxsize=1024)
+def qr_watermark_bits(url: str, size: Tuple[int, int] = (128, 128)) -> np.ndarray:
+    """
+    Watermark bits of a QR code for url, built straight from the module matrix.
+
+    Same result as rendering the code with generate_qr_code's settings and thresholding it
+    (True = white), without rasterizing through PIL. Cached per (url, size): uploads that are
+    retried or re-embedded reuse the same explorer URL.
+
+    Returns:
+        np.ndarray: Read-only boolean vector of size[0] * size[1] bits, row-major.
+    """
     qr = qrcode.QRCode(
         error_correction=qrcode.constants.ERROR_CORRECT_L,  # Low error correction to minimize data size
-        box_size=10,  # Initial pixels per module
-        border=1,     # Standard border size
+        border=1,
     )
-    
-    # Add URL data and generate QR code
     qr.add_data(url)
     qr.make(fit=True)  # Automatically choose smallest version that fits the data
-    
-    # Generate image
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Resize to 128x128 pixels
-    img = img.resize(target_size, Image.NEAREST)  # NEAREST preserves binary (black/white) quality
-    
-    if output_file:
-        # Save the image to a file
-        img.save(output_file, format="PNG")
+    modules = np.array(qr.get_matrix(), dtype=bool)  # True = dark, border included
 
-        # Check file size
-        file_size_kb = os.path.getsize(output_file) / 1024  # Convert bytes to KB
-    else:
-        # Save image to a memory buffer and check its size
-        img_bytes = io.BytesIO()
-        img.save(img_bytes, format="PNG")
-        file_size_kb = len(img_bytes.getvalue()) / 1024  # Convert bytes to KB
+    # Nearest-neighbour sampling at pixel centres, as PIL's Image.NEAREST resize does
+    n = modules.shape[0]
+    width, height = size
+    bits = ~modules[np.ix_(_module_index(height, n), _module_index(width, n))].ravel()
+    bits.flags.writeable = False
+    return bits
 
 
+def generate_qr_code(url, output_file=None, target_size=(128, 128)):
+    """The watermark QR code as a black and white PIL image, optionally saved as PNG."""
+    bits = qr_watermark_bits(url, tuple(target_size))
+    img = Image.fromarray(bits.reshape(target_size[1], target_size[0]).astype(np.uint8) * 255, mode="L")
+    if output_file:
+        img.save(output_file, format="PNG")
     return img
 
 
+def snap_to_modules(img: np.ndarray, modules: int) -> np.ndarray:
+    """
+    Clean up a noisy QR bitmap by majority vote over the pixels of each module, assuming it was
+    drawn with `modules` modules per side the way qr_watermark_bits draws it.
+    """
+    height, width = img.shape
+    rows, cols = _module_index(height, modules), _module_index(width, modules)
+    row_onehot = np.zeros((modules, height))
+    row_onehot[rows, np.arange(height)] = 1
+    col_onehot = np.zeros((modules, width))
+    col_onehot[cols, np.arange(width)] = 1
+    votes = row_onehot @ img @ col_onehot.T
+    sizes = row_onehot.sum(axis=1)[:, None] * col_onehot.sum(axis=1)[None, :]
+    return (votes * 2 > sizes)[np.ix_(rows, cols)]
+
+
+def _zbar_text(img: np.ndarray, scale: int) -> Optional[str]:
+    quiet = img.shape[0] // 8
+    img = cv2.copyMakeBorder(img.astype(np.uint8) * 255, quiet, quiet, quiet, quiet,
+                             cv2.BORDER_CONSTANT, value=255)
+    img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+    for symbol in zbar_decode(img):
+        try:
+            return symbol.data.decode("utf-8")
+        except UnicodeDecodeError:
+            continue
+    return None
+
+
+def decode_qr_bits(bits: np.ndarray, shape: Tuple[int, int] = (128, 128), scale: int = 4) -> Optional[str]:
+    """
+    Read the QR code in an extracted watermark.
+
+    The watermark only keeps a 1-module border, so a white quiet zone is added and the code is
+    upscaled before zbar sees it. If the raw bits do not decode, bit errors are voted away per
+    module for each QR version that fits (version v has 17 + 4v modules plus the border).
+
+    Returns:
+        str: The decoded text (the explorer URL), or None if no QR code could be read.
+    """
+    img = np.asarray(bits, dtype=bool).reshape(shape)
+    text = _zbar_text(img, scale)
+    version = 1
+    while text is None and 19 + 4 * version <= min(shape) // 2:
+        text = _zbar_text(snap_to_modules(img, 19 + 4 * version), scale)
+        version += 1
+    return text
+
+
 # if __name__ == "__main__":
 #     from blind_watermark import WaterMark
 #     import numpy as np
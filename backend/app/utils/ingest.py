@@ -0,0 +1,158 @@
+"""
+Chunked upload ingestion: hash as bytes arrive, sniff the real format, enforce size and pixel
+limits from the header, and spool large uploads to disk so they are never held in memory whole.
+"""
+import hashlib
+import os
+import tarfile
+import tempfile
+import zipfile
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import BinaryIO, Callable, List, Optional, Tuple, Union
+
+from fastapi import UploadFile
+from PIL import Image
+
+class UploadRejected(Exception):
+    """The upload fails a size / type / dimension check; status_code is the HTTP status to answer with."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """Image format from the file's magic bytes, or None if it is not a supported image."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head.startswith(b"BM"):
+        return "bmp"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    return None
+
+
+@dataclass
+class IngestedUpload:
+    size: int
+    sha256: bytes
+    format: str
+    width: int
+    height: int
+    # Small uploads stay in memory, larger ones live in a temp file until close()
+    data: Optional[bytes] = None
+    path: Optional[str] = None
+    _closed: bool = field(default=False, repr=False)
+
+    @property
+    def source(self) -> Union[bytes, str]:
+        """What the image workers read: the bytes themselves or the path of the spooled file."""
+        return self.data if self.data is not None else self.path
+
+    def close(self):
+        if not self._closed and self.path is not None:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+        self._closed = True
+
+
+async def ingest_upload(upload: UploadFile, min_size: int, max_size: int, max_pixels: int,
+                        spool_threshold: int, chunk_size: int = 1024 * 1024,
+                        spool_dir: Optional[str] = None) -> IngestedUpload:
+    """
+    Read an upload in chunks, computing its SHA-256 on the way.
+
+    Raises:
+        UploadRejected: 415 for non-image data, 413 when too large (bytes or pixels), 400 when too small.
+    """
+    digest = hashlib.sha256()
+    buffer = BytesIO()
+    spool = None
+    size = 0
+    image_format = None
+
+    try:
+        while True:
+            chunk = await upload.read(chunk_size)
+            if not chunk:
+                break
+            if image_format is None:
+                image_format = sniff_format(chunk[:16])
+                if image_format is None:
+                    raise UploadRejected(415, "Only images are allowed")
+            size += len(chunk)
+            if size > max_size:
+                raise UploadRejected(413, f"Image too large (must be at most {max_size // (1024 * 1024)}MB)")
+            digest.update(chunk)
+            if spool is None and size > spool_threshold:
+                # Past the threshold: move what we have to disk and keep streaming there
+                spool = tempfile.NamedTemporaryFile(delete=False, dir=spool_dir, suffix=f".{image_format}")
+                spool.write(buffer.getbuffer())
+                buffer = None
+            if spool is not None:
+                spool.write(chunk)
+            else:
+                buffer.write(chunk)
+
+        if image_format is None:
+            raise UploadRejected(415, "Only images are allowed")
+        if size < min_size:
+            raise UploadRejected(400, f"Image size too small (must be at least {min_size // (1024 * 1024)}MB)")
+
+        if spool is not None:
+            spool.close()
+            data, path = None, spool.name
+        else:
+            data, path = buffer.getvalue(), None
+
+        # Image.open only parses the header; nothing is decoded here
+        try:
+            with Image.open(path or BytesIO(data)) as header:
+                width, height = header.size
+        except Image.DecompressionBombError:
+            raise UploadRejected(413, "Image has too many pixels")
+        except Exception:
+            raise UploadRejected(415, "Unreadable image")
+        if width * height > max_pixels:
+            raise UploadRejected(413, f"Image has too many pixels ({width}x{height}, limit {max_pixels})")
+    except BaseException:
+        if spool is not None:
+            spool.close()
+            os.remove(spool.name)
+        raise
+
+    return IngestedUpload(size=size, sha256=digest.digest(), format=image_format,
+                          width=width, height=height, data=data, path=path)
+
+
+def archive_members(fileobj: BinaryIO) -> List[Tuple[str, Callable[[], BinaryIO]]]:
+    """
+    Regular files of a zip or tar archive (any tar compression), as (name, open) pairs in archive order.
+    Members are opened one at a time, so they must be read one after another.
+
+    Raises:
+        UploadRejected: 415 if the data is neither a zip nor a tar archive.
+    """
+    fileobj.seek(0)
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        archive = zipfile.ZipFile(fileobj)
+        return [(info.filename, lambda info=info: archive.open(info))
+                for info in archive.infolist()
+                if not info.is_dir() and not info.filename.startswith("__MACOSX/")]
+
+    fileobj.seek(0)
+    try:
+        archive = tarfile.open(fileobj=fileobj, mode="r:*")
+    except tarfile.TarError:
+        raise UploadRejected(415, "Archive must be a zip or tar file")
+    return [(member.name, lambda member=member: archive.extractfile(member))
+            for member in archive.getmembers() if member.isfile()]
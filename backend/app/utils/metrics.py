@@ -0,0 +1,252 @@
+"""
+Process-wide metrics in the Prometheus text format (served at GET /metrics).
+
+Pipeline stages are timed with stage(name). In the API process a stage is observed directly; image
+jobs run in pool worker processes, so there run_collecting() gathers the job's stage timings and
+returns them with the result, and the API process observes them when the job comes back
+(observe_stages). RPC calls of the chain services are timed with rpc(chain, call).
+"""
+import bisect
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Seconds; from cached lookups up to whole-image passes over large uploads
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return header + "".join(f"{line}\n" for line in self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}_total{_labels(self.labelnames, key)} {_number(value)}" for key, value in values]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """A value set directly (set / inc / dec), or read at scrape time from set_function's callback."""
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Optional[Callable[[], Dict[Tuple[str, ...], float]]]):
+        """Read the gauge from function() -> {label values: value} when scraped; None to stop."""
+        self._function = function
+
+    def samples(self) -> List[str]:
+        function = self._function
+        if function is not None:
+            try:
+                values = sorted(function().items())
+            except Exception as e:
+                print(f"Error reading gauge {self.name}: {e}")
+                values = []
+        else:
+            with self._lock:
+                values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in values]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Label values -> ([count per bucket (non-cumulative), +Inf last], sum)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "".join(metric.render() for metric in self._metrics)
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "pixelproof_stage_seconds", "Duration of image pipeline stages.", ["stage"]))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "pixelproof_stage_errors", "Pipeline stages that raised, by stage.", ["stage"]))
+RPC_SECONDS = REGISTRY.register(Histogram(
+    "pixelproof_rpc_seconds", "Duration of blockchain RPC calls.", ["chain", "call"]))
+RPC_ERRORS = REGISTRY.register(Counter(
+    "pixelproof_rpc_errors", "Blockchain RPC calls that raised.", ["chain", "call"]))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "pixelproof_http_request_seconds", "Duration of HTTP requests, by route template.",
+    ["method", "route", "status"]))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "pixelproof_http_requests_in_flight", "HTTP requests being handled."))
+IMAGE_POOL_JOBS = REGISTRY.register(Gauge(
+    "pixelproof_image_pool_jobs", "Image jobs in the process pool, running or waiting for a worker.", ["state"]))
+UPLOAD_JOBS = REGISTRY.register(Gauge(
+    "pixelproof_upload_jobs", "Upload jobs in the job queue, by status.", ["status"]))
+REGISTRATIONS_PENDING = REGISTRY.register(Gauge(
+    "pixelproof_registrations_batched", "Image hashes waiting for the next registration batch.", ["chain"]))
+
+# Stage timings of the image job running in this (worker) process, see run_collecting()
+_collected: Optional[List[Tuple[str, float]]] = None
+_collected_lock = threading.Lock()
+# Stage timings of the current request, for the slow-request log (see utils.profiler)
+request_stages: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = \
+    contextvars.ContextVar("request_stages", default=None)
+
+
+def observe_stages(timings: List[Tuple[str, float]]):
+    """Record (stage, seconds) timings, e.g. those an image job returned from its worker process."""
+    stages = request_stages.get()
+    for name, seconds in timings:
+        STAGE_SECONDS.observe(seconds, stage=name)
+        if stages is not None:
+            stages.append((name, seconds))
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Time a pipeline stage. An exception raised inside it is counted against the stage, and carries
+    the stage's name as its pixelproof_stage attribute (also across the process pool).
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        if not hasattr(e, "pixelproof_stage"):
+            e.pixelproof_stage = name
+            if _collected is None:
+                STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        if _collected is not None:
+            with _collected_lock:
+                _collected.append((name, elapsed))
+        else:
+            observe_stages([(name, elapsed)])
+
+
+@contextmanager
+def rpc(chain: str, call: str):
+    """Time one RPC call of a chain service (runs in the API process's threads)."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        RPC_ERRORS.inc(chain=chain, call=call)
+        raise
+    finally:
+        RPC_SECONDS.observe(time.perf_counter() - started, chain=chain, call=call)
+
+
+def run_collecting(fn: Callable, *args):
+    """
+    Run fn(*args) in a pool worker, collecting its stage timings: (result, timings). If fn raises,
+    the timings travel on the exception as pixelproof_timings.
+    """
+    global _collected
+    _collected = []
+    try:
+        return fn(*args), _collected
+    except Exception as e:
+        e.pixelproof_timings = _collected
+        raise
+    finally:
+        _collected = None
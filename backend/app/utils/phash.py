@@ -0,0 +1,163 @@
+"""
+Perceptual hashes of images and a Hamming-distance index over them.
+
+pHash: the image is reduced to 32x32 grey levels and transformed with a DCT; each of the 64 lowest
+frequencies (8x8, DC excluded from the threshold) becomes one bit, set when its coefficient is above
+their median. Re-encoding, resizing and small edits move only a few bits, so visually identical
+images are a small Hamming distance apart.
+"""
+from itertools import combinations
+from typing import List, Tuple
+
+import numpy as np
+
+PHASH_BITS = 64
+# Multi-index hashing: the 64 bits are split into 4 chunks of 16 bits, one lookup table each
+MIH_CHUNKS = 4
+MIH_CHUNK_BITS = PHASH_BITS // MIH_CHUNKS
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)
+    matrix = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT32 = _dct_matrix(32)
+
+
+def phash(image_bgr: np.ndarray) -> int:
+    """64-bit DCT perceptual hash of a BGR (or grey) image."""
+    # Only image pool workers hash images; the server process uses the index below without OpenCV
+    import cv2
+    grey = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY) if image_bgr.ndim == 3 else image_bgr
+    small = cv2.resize(grey, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float64)
+    low = (_DCT32 @ small @ _DCT32.T)[:8, :8].ravel()
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    return _POPCOUNT[values.view(np.uint8)].reshape(len(values), 8).sum(axis=1)
+
+
+def _chunks(values: np.ndarray) -> List[np.ndarray]:
+    mask = np.uint64((1 << MIH_CHUNK_BITS) - 1)
+    return [((values >> np.uint64(MIH_CHUNK_BITS * i)) & mask).astype(np.int64) for i in range(MIH_CHUNKS)]
+
+
+def _neighbours(value: int, radius: int) -> List[int]:
+    """Every chunk value within radius bits of value."""
+    result = [value]
+    for r in range(1, radius + 1):
+        for positions in combinations(range(MIH_CHUNK_BITS), r):
+            flipped = value
+            for position in positions:
+                flipped ^= 1 << position
+            result.append(flipped)
+    return result
+
+
+class MultiIndexHash:
+    def __init__(self, rebuild_threshold: int = 4096):
+        """
+        Hamming-radius search over 64-bit hashes (multi-index hashing, Norouzi et al.).
+
+        Two hashes within distance r agree to within r // 4 bits on at least one of their four 16-bit
+        chunks, so a query only probes the chunk values that close to its own in four tables and
+        checks the few hashes found there. Each table is a CSR layout over numpy arrays (ids sorted by
+        chunk value, plus bucket offsets), a few bytes per hash even at millions of them.
+
+        New hashes go to a small buffer scanned linearly; the tables are rebuilt once it holds
+        rebuild_threshold hashes. Not thread-safe: callers serialize add() and search(). A rebuild
+        can run outside that lock, so searches are not held up by it: start_rebuild() and
+        finish_rebuild() under the lock, TableBuild.run() in between without it.
+
+        Args:
+            rebuild_threshold (int): Minimum buffered hashes before the tables are rebuilt.
+        """
+        self.rebuild_threshold = rebuild_threshold
+        self.ids = np.empty(0, dtype=np.int64)
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self._order: List[np.ndarray] = []
+        self._offsets: List[np.ndarray] = []
+        self._pending_ids: List[int] = []
+        self._pending_hashes: List[int] = []
+        self._rebuilding = False
+
+    def __len__(self) -> int:
+        return len(self.hashes) + len(self._pending_hashes)
+
+    def add(self, item_id: int, value: int) -> bool:
+        """Buffer a hash. Returns True when the buffer is full and no rebuild is running: time to start one."""
+        self._pending_ids.append(item_id)
+        self._pending_hashes.append(value)
+        return len(self._pending_hashes) >= self.rebuild_threshold and not self._rebuilding
+
+    def add_many(self, ids: np.ndarray, values: np.ndarray):
+        self.ids = np.concatenate([self.ids, np.asarray(ids, dtype=np.int64)])
+        self.hashes = np.concatenate([self.hashes, np.asarray(values, dtype=np.uint64)])
+        self.rebuild()
+
+    def rebuild(self):
+        """Merge the buffer into the tables in one go."""
+        build = self.start_rebuild()
+        build.run()
+        self.finish_rebuild(build)
+
+    def start_rebuild(self) -> "TableBuild":
+        """Rebuild of the tables from the hashes stored and buffered now; search() uses the old ones until then."""
+        self._rebuilding = True
+        return TableBuild(self.ids, self.hashes, list(self._pending_ids), list(self._pending_hashes))
+
+    def finish_rebuild(self, build: "TableBuild"):
+        """Swap in the tables of a build that has run (a failed one is dropped)."""
+        self._rebuilding = False
+        if build.order is None:
+            return
+        self.ids, self.hashes, self._order, self._offsets = build.ids, build.hashes, build.order, build.offsets
+        # Hashes added while the build ran stay buffered
+        del self._pending_ids[:build.merged]
+        del self._pending_hashes[:build.merged]
+
+    def search(self, value: int, radius: int, limit: int = 10) -> List[Tuple[int, int]]:
+        """(id, distance) of the stored hashes within radius of value, nearest first."""
+        chunk_radius = radius // MIH_CHUNKS
+        candidates = []
+        for i, (order, offsets) in enumerate(zip(self._order, self._offsets)):
+            chunk = (value >> (MIH_CHUNK_BITS * i)) & ((1 << MIH_CHUNK_BITS) - 1)
+            for probe in _neighbours(chunk, chunk_radius):
+                start, end = offsets[probe], offsets[probe + 1]
+                if end > start:
+                    candidates.append(order[start:end])
+        found = np.unique(np.concatenate(candidates)) if candidates else np.empty(0, dtype=np.int64)
+
+        ids = np.concatenate([self.ids[found], np.array(self._pending_ids, dtype=np.int64)])
+        hashes = np.concatenate([self.hashes[found], np.array(self._pending_hashes, dtype=np.uint64)])
+        distances = _popcount(hashes ^ np.uint64(value))
+        keep = np.flatnonzero(distances <= radius)
+        keep = keep[np.argsort(distances[keep], kind="stable")][:limit]
+        return [(int(ids[k]), int(distances[k])) for k in keep]
+
+
+class TableBuild:
+    def __init__(self, ids: np.ndarray, hashes: np.ndarray, pending_ids: List[int], pending_hashes: List[int]):
+        """New MultiIndexHash tables over the stored hashes plus a copy of the buffered ones (see start_rebuild)."""
+        self.merged = len(pending_ids)
+        self._parts = (ids, hashes, pending_ids, pending_hashes)
+        self.ids = self.hashes = self.order = self.offsets = None
+
+    def run(self):
+        """Sort the hashes into the four tables. Touches only this build, so it needs no lock."""
+        ids, hashes, pending_ids, pending_hashes = self._parts
+        all_ids = np.concatenate([ids, np.array(pending_ids, dtype=np.int64)])
+        all_hashes = np.concatenate([hashes, np.array(pending_hashes, dtype=np.uint64)])
+        order, offsets = [], []
+        for chunk in _chunks(all_hashes):
+            chunk_order = np.argsort(chunk, kind="stable")
+            order.append(chunk_order)
+            offsets.append(np.searchsorted(chunk[chunk_order], np.arange((1 << MIH_CHUNK_BITS) + 1)))
+        self.ids, self.hashes, self.order, self.offsets = all_ids, all_hashes, order, offsets
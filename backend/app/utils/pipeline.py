@@ -0,0 +1,369 @@
+"""
+CPU-heavy image work. Everything here runs inside ImagePool worker processes,
+so functions take and return plain picklable values.
+"""
+import base64
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+
+from services.BlobStore import BlobStore
+from utils.explorer import parse_watermark_url
+from utils.image_utils import decode_image_bgr, decode_qr_bits, qr_watermark_bits
+from utils.metrics import stage
+from utils.phash import phash
+from utils.watermark import WatermarkEngine
+
+# Watermark bits per image: a 128x128 QR code
+WM_SHAPE = (128, 128)
+
+# Stateless, so one engine per worker process serves every job
+engine = WatermarkEngine()
+
+# prewarm() runs the pipeline on a 128x128 image, which has room for an 8x8 watermark
+PREWARM_SIZE = 128
+PREWARM_WM_SHAPE = (8, 8)
+
+
+VERIFY_MODES = ("none", "sampled", "full")
+# How /workspace/decode returns the extracted watermark
+WATERMARK_FORMATS = ("png", "bits")
+# Codecs for the watermarked image: (extension, media type, OpenCV quality flag)
+OUTPUT_FORMATS = {
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+    "png": (".png", "image/png", None),
+    # WebP quality above 100 is lossless
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+def _encode(img: np.ndarray, ext: str = '.jpg', params: Sequence[int] = ()) -> np.ndarray:
+    success, buf = cv2.imencode(ext, img, list(params))
+    if not success:
+        raise ValueError(f"Error encoding image to {ext}")
+    return buf
+
+
+def _b64(buf: np.ndarray) -> str:
+    return base64.b64encode(buf.tobytes()).decode('utf-8')
+
+
+def _watermark_image(wm_extract: np.ndarray) -> np.ndarray:
+    return wm_extract.reshape(WM_SHAPE).astype(np.uint8) * 255
+
+
+def _store(blobs: BlobStore, buf: np.ndarray, media_type: str) -> dict:
+    return {"sha256": blobs.put(buf.tobytes()), "type": media_type, "size": int(buf.size)}
+
+
+def _tiling(shape: Tuple[int, ...], min_pixels: int, stripe_pixels: int, threads: int) -> dict:
+    """engine.embed / extract options: stripes for images of at least min_pixels pixels (0: never)."""
+    if min_pixels and shape[0] * shape[1] >= min_pixels:
+        return {"stripe_pixels": stripe_pixels, "threads": threads}
+    return {}
+
+
+def _memmap(shape: Tuple[int, ...], dtype, spool_dir: Optional[str]) -> np.ndarray:
+    """
+    An array in an unlinked temporary file. Its pages are file-backed, so under memory pressure the
+    kernel writes them out instead of OOM-killing the worker; the file goes away with the array.
+    """
+    with tempfile.TemporaryFile(dir=spool_dir) as f:
+        # The mapping keeps its own reference to the file
+        return np.memmap(f, dtype=dtype, mode="w+", shape=shape)
+
+
+def _spill(img: np.ndarray, spool_dir: Optional[str]) -> np.ndarray:
+    """Move a decoded image to a memory-mapped file (see _memmap); the in-memory copy is freed."""
+    mapped = _memmap(img.shape, img.dtype, spool_dir)
+    mapped[...] = img
+    return mapped
+
+
+def embed_watermark(source: Union[bytes, str], url: str, blob_dir: str, verify: str = "sampled",
+                    sample_bits: int = 1024, output_format: str = "jpeg", quality: int = 95,
+                    tile_min_pixels: int = 0, tile_stripe_pixels: int = 1024 * 1024, tile_threads: int = 1,
+                    tile_dir: Optional[str] = None) -> dict:
+    """
+    Embed a QR code of url into the image (bytes or spooled file path) and store the results as
+    blobs in the BlobStore at blob_dir.
+
+    Args:
+        verify (str): Check of the returned image: "none", "sampled" (bit error rate of sample_bits
+            random watermark bits) or "full" (extract the whole watermark and compare it with the QR code).
+        output_format (str): Codec of the embedded image: "jpeg", "png" or "webp".
+        quality (int): JPEG / WebP quality (0-100; above 100 makes WebP lossless). Ignored for PNG.
+        tile_min_pixels (int): Images with at least this many pixels are watermarked in stripes of
+            about tile_stripe_pixels pixels, tile_threads at a time, with the decoded and watermarked
+            images memory-mapped from temporary files in tile_dir. Same output; 0 never tiles.
+
+    Returns:
+        dict: {"sha256", "type", "size"} blobs of the embedded image ("embedded") and a PNG preview of
+            the watermark ("preview": the extracted bits for "full", otherwise the QR code itself),
+            "bitErrorRate" (None when verify is "none") and "phash", the perceptual hash of the
+            original image (16 hex digits).
+    """
+    if verify not in VERIFY_MODES:
+        raise ValueError(f"Unknown verification mode: {verify}")
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    ext, media_type, quality_flag = OUTPUT_FORMATS[output_format]
+
+    with stage("qr"):
+        wm_bit = qr_watermark_bits(url, WM_SHAPE)
+
+    # source is the upload itself or the path it was spooled to (see utils.ingest)
+    with stage("decode"):
+        image_cv = decode_image_bgr(source)
+        tiling = _tiling(image_cv.shape, tile_min_pixels, tile_stripe_pixels, tile_threads)
+        if tiling:
+            image_cv = _spill(image_cv, tile_dir)
+    params = (quality_flag, quality) if quality_flag is not None else ()
+    with stage("embed"):
+        out = _memmap(image_cv.shape, np.uint8, tile_dir) if tiling else None
+        watermarked = engine.embed(image_cv, wm_bit, out=out, **tiling)
+    with stage("encode"):
+        embedded = _encode(watermarked, ext, params)
+    del watermarked, out
+
+    preview_bits = wm_bit
+    bit_error_rate = None
+    if verify != "none":
+        # Check what the client actually receives, compression loss included
+        with stage("verify"):
+            returned = cv2.imdecode(embedded, cv2.IMREAD_COLOR)
+            if verify == "full":
+                preview_bits = engine.extract(returned, wm_shape=WM_SHAPE, **tiling)
+                bit_error_rate = float(np.mean(preview_bits != wm_bit))
+            else:
+                bit_error_rate = engine.bit_error_rate(returned, wm_bit, sample=sample_bits)
+
+    with stage("phash"):
+        image_phash = f"{phash(image_cv):016x}"
+    blobs = BlobStore(blob_dir)
+    with stage("store"):
+        return {
+            "embedded": _store(blobs, embedded, media_type),
+            "preview": _store(blobs, _encode(_watermark_image(preview_bits), '.png'), "image/png"),
+            "bitErrorRate": bit_error_rate,
+            "phash": image_phash,
+        }
+
+
+def fingerprint(source: Union[bytes, str]) -> str:
+    """Perceptual hash of an image (16 hex digits). Decoded at 1/4 resolution, which pHash does not notice."""
+    with stage("decode"):
+        image_cv = decode_image_bgr(source, reduce=4)
+    with stage("phash"):
+        return f"{phash(image_cv):016x}"
+
+
+def _read_qr(wm_extract: np.ndarray) -> Tuple[Optional[str], Dict[str, str]]:
+    """(url, chain -> tx_hash) from extracted watermark bits; tx hashes only for explorer / proof links."""
+    with stage("qr_read"):
+        url = decode_qr_bits(wm_extract, WM_SHAPE)
+    return url, parse_watermark_url(url) if url else {}
+
+
+def _check_capacity(image_cv: np.ndarray):
+    # One bit per 4x4 block of the half-resolution DWT band
+    if engine.capacity(image_cv.shape) <= WM_SHAPE[0] * WM_SHAPE[1]:
+        raise ValueError(f"Image too small to carry a watermark ({image_cv.shape[1]}x{image_cv.shape[0]})")
+
+
+def _resample(image_cv: np.ndarray, scale: float, offset: Tuple[int, int]) -> np.ndarray:
+    """
+    Map an image back onto the block grid of the image the watermark was embedded in, assuming it
+    was resized by scale and then cropped so that its top-left corner was at offset (dy, dx) of the
+    resized original. Cropped-away rows / columns are padded back; they only add noise to the blocks
+    they fall in, while every surviving block lands on its original position and index.
+    """
+    if scale != 1:
+        height, width = image_cv.shape[:2]
+        size = (round(width / scale), round(height / scale))
+        interpolation = cv2.INTER_CUBIC if scale < 1 else cv2.INTER_AREA
+        image_cv = cv2.resize(image_cv, size, interpolation=interpolation)
+    dy, dx = (round(o / scale) for o in offset)
+    if dy or dx:
+        image_cv = cv2.copyMakeBorder(image_cv, dy, 0, dx, 0, cv2.BORDER_REPLICATE)
+    return image_cv
+
+
+def _try_hypothesis(image_cv: np.ndarray, scale: float, offset: Tuple[int, int], stop: threading.Event,
+                    max_pixels: Optional[int], tile_min_pixels: int = 0, tile_stripe_pixels: int = 0):
+    """
+    Extract under one (scale, offset) hypothesis; None if skipped, stopped or too small. Large
+    candidates are read in stripes, one at a time: hypotheses already run in parallel.
+    """
+    if stop.is_set():
+        return None
+    height, width = image_cv.shape[:2]
+    if max_pixels and (width / scale) * (height / scale) > max_pixels:
+        return None
+    with stage("resample"):
+        candidate = _resample(image_cv, scale, offset)
+    if stop.is_set() or engine.capacity(candidate.shape) <= WM_SHAPE[0] * WM_SHAPE[1]:
+        return None
+    with stage("extract"):
+        wm_extract = engine.extract(candidate, wm_shape=WM_SHAPE,
+                                    **_tiling(candidate.shape, tile_min_pixels, tile_stripe_pixels, 1))
+    return wm_extract, _read_qr(wm_extract)
+
+
+def _search_hypotheses(image_cv: np.ndarray, hypotheses: List[Tuple[float, Tuple[int, int]]],
+                       budget: float, threads: int, max_pixels: Optional[int], tile_min_pixels: int = 0,
+                       tile_stripe_pixels: int = 0):
+    """
+    Try hypotheses on a thread pool (numpy / OpenCV release the GIL) until one yields a readable QR
+    code or the time budget runs out. No hypothesis starts after that; ones already running see the
+    stop flag between stages, and are waited for so no work outlives the job.
+
+    Returns:
+        (match, tried, timed_out): match is (hypothesis, wm_extract, qr) or None; tried counts finished
+            attempts (hypotheses skipped as too large / too small are not attempts); timed_out tells
+            whether the budget ran out with hypotheses left.
+    """
+    stop = threading.Event()
+    deadline = time.monotonic() + budget
+    match, tried, timed_out = None, 0, False
+    executor = ThreadPoolExecutor(max_workers=max(1, threads))
+    try:
+        pending = {executor.submit(_try_hypothesis, image_cv, scale, offset, stop, max_pixels,
+                                   tile_min_pixels, tile_stripe_pixels): (scale, offset)
+                   for scale, offset in hypotheses}
+        while pending and match is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                hypothesis = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception:
+                    result = None
+                if result is None:
+                    continue
+                tried += 1
+                wm_extract, qr = result
+                if qr[0] is not None and match is None:
+                    match = (hypothesis, wm_extract, qr)
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+    return match, tried, timed_out
+
+
+def extract_watermark(source: Union[bytes, str], reduce: int = 1, wm_format: str = "png",
+                      scales: Sequence[float] = (), offsets: Sequence[Tuple[int, int]] = (),
+                      budget: float = 0, threads: int = 1, max_pixels: Optional[int] = None,
+                      tile_min_pixels: int = 0, tile_stripe_pixels: int = 1024 * 1024, tile_threads: int = 1,
+                      tile_dir: Optional[str] = None) -> dict:
+    """
+    Extract the 128x128 watermark from an image (bytes or spooled file path) and read its QR code.
+
+    The image is first read at its own geometry. If that gives no readable QR code and scales /
+    offsets are given, every (scale, offset) combination is tried in parallel (see _resample) until
+    one decodes or budget seconds have passed.
+
+    Args:
+        reduce (int): Decode at 1/reduce resolution (JPEG DCT-domain scaling). Only useful when the
+            image was upscaled by that factor after the watermark was embedded.
+        wm_format (str): "png" for a base64 PNG of the watermark, "bits" for the raw bits packed
+            8 per byte (np.packbits, row-major), base64 encoded.
+        scales (list): Factors the image may have been resized by since embedding.
+        offsets (list): (dy, dx) pixel offsets (in the received image) it may have been cropped at.
+        budget (float): Seconds allowed for the hypothesis search.
+        threads (int): Hypotheses tried at once.
+        max_pixels (int, optional): Skip hypotheses that would resample to more pixels than this.
+        tile_min_pixels (int): Read images with at least this many pixels in stripes, as in
+            embed_watermark (tile_threads at a time at the image's own geometry, one at a time per
+            hypothesis). Same result; 0 never tiles.
+
+    Returns:
+        dict: "data" / "type" of the watermark, plus "url" recovered from the QR code, "txHashes"
+            (chain -> tx hash) of the explorer or proof link in it, and "chain" / "txHash" of its
+            first registration (None when it could not be read or is not such a link). "hypothesis" is the
+            {"scale", "offset"} that decoded (None if none did) and "tried" the attempts made.
+    """
+    if wm_format not in WATERMARK_FORMATS:
+        raise ValueError(f"Unknown watermark format: {wm_format}")
+
+    with stage("decode"):
+        image_cv = decode_image_bgr(source, reduce=reduce)
+        tiling = _tiling(image_cv.shape, tile_min_pixels, tile_stripe_pixels, tile_threads)
+        if tiling:
+            image_cv = _spill(image_cv, tile_dir)
+    native = (1.0, (0, 0))
+    scales = sorted({1.0, *map(float, scales)}, key=lambda scale: (scale != 1.0, 1 / scale))
+    # Crops at the original size first, then the cheapest resamplings (smallest original) first
+    hypotheses = [(scale, tuple(offset)) for scale in scales for offset in (offsets or [(0, 0)])]
+    hypotheses = [h for h in hypotheses if h != native]
+    if not hypotheses:
+        _check_capacity(image_cv)
+
+    # The image's own geometry first: it is by far the most likely to match
+    wm_extract, qr, matched, tried, timed_out = None, (None, {}), None, 0, False
+    if engine.capacity(image_cv.shape) > WM_SHAPE[0] * WM_SHAPE[1]:
+        with stage("extract"):
+            wm_extract = engine.extract(image_cv, wm_shape=WM_SHAPE, **tiling)
+        qr = _read_qr(wm_extract)
+        tried = 1
+        if qr[0] is not None:
+            matched = native
+
+    if matched is None and hypotheses:
+        match, searched, timed_out = _search_hypotheses(image_cv, hypotheses, budget, threads, max_pixels,
+                                             tile_min_pixels, tile_stripe_pixels)
+        tried += searched
+        if match is not None:
+            matched, wm_extract, qr = match
+    if wm_extract is None:
+        if timed_out:
+            raise ValueError("No hypothesis could be extracted within the time budget")
+        if tried == 0:
+            # Every geometry was too small (or beyond max_pixels), the native one included: the same
+            # error as without a search
+            _check_capacity(image_cv)
+        raise ValueError("No hypothesis yielded a readable watermark")
+
+    url, tx_hashes = qr
+    chain, tx_hash = next(iter(tx_hashes.items()), (None, None))
+    with stage("encode"):
+        if wm_format == "bits":
+            data, data_type = _b64(np.packbits(wm_extract)), "application/octet-stream"
+        else:
+            data, data_type = _b64(_encode(_watermark_image(wm_extract), '.png')), "image/png"
+
+    return {
+        "data": data, "type": data_type, "url": url, "chain": chain, "txHash": tx_hash, "txHashes": tx_hashes,
+        "hypothesis": {"scale": matched[0], "offset": list(matched[1])} if matched else None,
+        "tried": tried,
+    }
+
+
+def prewarm():
+    """
+    Run every stage of the embed / extract path once on a tiny image: QR code, decode, embed,
+    encode in each output format, verify, extract, QR read and pHash. A fresh worker process loads
+    codecs, zbar and numpy's BLAS lazily on first use; this moves that cost to pool start-up.
+    """
+    img = np.random.default_rng(0).integers(0, 256, (PREWARM_SIZE, PREWARM_SIZE, 3), dtype=np.uint8)
+    wm_bit = qr_watermark_bits("http://localhost/prewarm", WM_SHAPE)
+    decode_qr_bits(wm_bit, WM_SHAPE)
+    # JPEG (libjpeg's own orientation) and PNG (PIL's EXIF reader) take different decode paths
+    for ext in (".jpg", ".png"):
+        decode_image_bgr(_encode(img, ext).tobytes())
+    small_bits = wm_bit[:PREWARM_WM_SHAPE[0] * PREWARM_WM_SHAPE[1]]
+    watermarked = engine.embed(img, small_bits)
+    for ext, _, quality_flag in OUTPUT_FORMATS.values():
+        _encode(watermarked, ext, (quality_flag, 95) if quality_flag is not None else ())
+    engine.bit_error_rate(watermarked, small_bits, sample=16)
+    engine.extract(watermarked, wm_shape=PREWARM_WM_SHAPE)
+    phash(img)
@@ -0,0 +1,98 @@
+"""
+Opt-in sampling profiler for slow requests.
+
+While a profiled request is in flight, a background thread samples the stacks of every thread of
+the API process (event loop, asyncio.to_thread workers, chain service threads) every interval
+seconds. Requests that turn out slower than the threshold get their samples written as collapsed
+stacks ("thread;outer;...;inner count" lines, for flamegraph.pl or speedscope) together with their
+stage timings. Image work runs in pool worker processes and shows up as time spent waiting on the
+pool; its breakdown comes from the stage timings the workers report.
+
+Other requests running at the same time are sampled too; profile at low load or read the stacks
+of the request's own handler.
+"""
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# Frames deeper than this are cut from the root side
+MAX_DEPTH = 64
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _collapse(frame) -> str:
+    labels = []
+    while frame is not None and len(labels) < MAX_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float, threshold: float, out_dir: str):
+        """
+        Args:
+            interval (float): Seconds between stack samples.
+            threshold (float): Requests taking at least this many seconds are written out.
+            out_dir (str): Directory for the .folded profiles.
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.out_dir = out_dir
+        self._sessions: Dict[int, Counter] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._ids = itertools.count(1)
+
+    def start(self) -> int:
+        """Start collecting samples for one request; returns its session id."""
+        with self._lock:
+            session = next(self._ids)
+            self._sessions[session] = Counter()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._sample_loop, name="slow-request-profiler",
+                                                daemon=True)
+                self._thread.start()
+        return session
+
+    def stop(self, session: int) -> Counter:
+        """Stop collecting for a session and return its samples (collapsed stack -> count)."""
+        with self._lock:
+            return self._sessions.pop(session, Counter())
+
+    def _sample_loop(self):
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._sessions:
+                    self._thread = None
+                    return
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = [f"{names.get(ident, ident)};{_collapse(frame)}"
+                      for ident, frame in sys._current_frames().items() if ident != me]
+            with self._lock:
+                for samples in self._sessions.values():
+                    samples.update(stacks)
+            time.sleep(self.interval)
+
+    def write(self, label: str, duration: float, samples: Counter, stages: List[Tuple[str, float]]) -> str:
+        """Write a slow request's profile; returns its path."""
+        os.makedirs(self.out_dir, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9_.-]+", "_", label).strip("_")
+        path = os.path.join(self.out_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{int(duration * 1000)}ms-{name}.folded")
+        with open(path, "w") as f:
+            f.write(f"# {label} took {duration:.3f}s, sampled every {self.interval * 1000:g}ms\n")
+            for stage, seconds in stages:
+                f.write(f"# stage {stage} {seconds:.4f}s\n")
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
@@ -0,0 +1,149 @@
+"""
+In-process stand-ins for EthService and SolService: the same methods, backed by a dict instead of
+an RPC node. Every simulated RPC round trip sleeps for latency seconds, so registration and
+indexing cost roughly what they would against a nearby node, without the network's variance.
+"""
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import base58
+
+from services.ChainServices import DuplicateImageError
+from services.RegistrationBatcher import RegistrationResult, DUPLICATE, PENDING, REGISTERED
+
+
+class _FakeChain:
+    def __init__(self, latency: float = 0.05, **_):
+        """
+        Args:
+            latency (float): Seconds each simulated RPC call takes.
+            **_: The real service's options (pool sizes, timeouts), accepted and ignored.
+        """
+        self.latency = latency
+        self.owner = self._address(os.urandom(32))
+        self.registrations: Dict[bytes, dict] = {}
+        self._lock = threading.Lock()
+
+    def _rpc(self):
+        time.sleep(self.latency)
+
+    @staticmethod
+    def _address(key: bytes) -> str:
+        raise NotImplementedError
+
+    def _tx_hash(self, image_hashes: List[bytes]) -> str:
+        raise NotImplementedError
+
+    def _add(self, image_hashes: List[bytes], tx_hash: str) -> Dict[bytes, bool]:
+        """Register the hashes that have no owner yet: hash -> whether it was added."""
+        added = {}
+        with self._lock:
+            for image_hash in image_hashes:
+                added[image_hash] = image_hash not in self.registrations
+                if added[image_hash]:
+                    self.registrations[image_hash] = {"tx_hash": tx_hash, "owner": self.owner,
+                                                      "block_number": len(self.registrations) + 1,
+                                                      "timestamp": int(time.time())}
+        return added
+
+    def health_check(self) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+    def register_image(self, image_hash: bytes):
+        self._rpc()
+        tx_hash = self._tx_hash([image_hash])
+        if not self._add([image_hash], tx_hash)[image_hash]:
+            raise DuplicateImageError(f"Image hash {image_hash.hex()} is already registered")
+        return tx_hash, image_hash.hex()
+
+
+class FakeEthService(_FakeChain):
+    """
+    EthService stand-in: batches are confirmed one simulated receipt wait after they are sent. Every
+    registered hash gets a block of its own; reorg() replaces the newest blocks.
+    """
+
+    def __init__(self, latency: float = 0.05, **options):
+        super().__init__(latency, **options)
+        self._forks: Dict[int, bytes] = {}  # block number -> salt of its replacement's hash
+
+    @staticmethod
+    def _address(key: bytes) -> str:
+        return "0x" + key[:20].hex()
+
+    def _tx_hash(self, image_hashes: List[bytes]) -> str:
+        return hashlib.sha256(b"".join(image_hashes) + os.urandom(8)).hexdigest()
+
+    def register_batch(self, image_hashes: List[bytes]) -> Dict[bytes, RegistrationResult]:
+        self._rpc()  # send
+        tx_hash = self._tx_hash(image_hashes)
+        added = self._add(image_hashes, tx_hash)
+        self._rpc()  # receipt
+        return {h: RegistrationResult(tx_hash, REGISTERED if added[h] else DUPLICATE) for h in image_hashes}
+
+    def block_number(self) -> int:
+        self._rpc()
+        return len(self.registrations)
+
+    def block_hash(self, number: int) -> str:
+        return hashlib.sha256(number.to_bytes(8, "big") + self._forks.get(number, b"")).hexdigest()
+
+    def reorg(self, block: int):
+        """Replace the blocks after block: their registrations are gone and their hashes change."""
+        with self._lock:
+            for image_hash, registration in list(self.registrations.items()):
+                if registration["block_number"] > block:
+                    del self.registrations[image_hash]
+                    self._forks[registration["block_number"]] = os.urandom(8)
+
+    def registered_events(self, from_block: int, to_block: int) -> List[dict]:
+        self._rpc()
+        with self._lock:
+            return [{"hash": h.hex(), "owner": r["owner"], "timestamp": r["timestamp"],
+                     "block_number": r["block_number"], "tx_hash": r["tx_hash"]}
+                    for h, r in self.registrations.items() if from_block <= r["block_number"] <= to_block]
+
+
+class FakeSolService(_FakeChain):
+    """SolService stand-in: batches are sent as one "pending" transaction, confirmed immediately after."""
+
+    @staticmethod
+    def _address(key: bytes) -> str:
+        return base58.b58encode(key).decode()
+
+    def _tx_hash(self, image_hashes: List[bytes]) -> str:
+        return base58.b58encode(os.urandom(64)).decode()
+
+    def register_batch(self, image_hashes: List[bytes]) -> Dict[bytes, RegistrationResult]:
+        self._rpc()  # getMultipleAccounts
+        with self._lock:
+            registered = {h for h in image_hashes if h in self.registrations}
+        results = {h: RegistrationResult("", DUPLICATE) for h in registered}
+        new = [h for h in image_hashes if h not in registered]
+        if new:
+            self._rpc()  # sendTransaction
+            tx_hash = self._tx_hash(new)
+            added = self._add(new, tx_hash)
+            results.update({h: RegistrationResult(tx_hash if added[h] else "", PENDING if added[h] else DUPLICATE)
+                            for h in new})
+        return results
+
+    def confirmation_status(self, tx_signature: str) -> Optional[str]:
+        return "finalized"
+
+    def hash_owners(self, image_hashes: List[bytes], commitment=None) -> Dict[bytes, str]:
+        self._rpc()
+        with self._lock:
+            return {h: self.registrations[h]["owner"] for h in image_hashes if h in self.registrations}
+
+    def owner_accounts(self) -> Dict[str, List[bytes]]:
+        self._rpc()
+        with self._lock:
+            hashes = list(self.registrations)
+        return {self._address(hashlib.sha256(self.owner.encode()).digest()): hashes} if hashes else {}
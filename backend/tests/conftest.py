@@ -0,0 +1,187 @@
+"""
+Benchmark suite for the image pipeline and the upload / decode endpoints.
+
+Benchmarks are skipped unless pytest runs with --bench (from backend/):
+
+    python -m pytest tests --bench                          # everything
+    python -m pytest tests --bench -k pipeline --bench-sizes=1,12
+    python -m pytest tests --bench --bench-report=bench.json
+
+Chains are replaced by in-process fakes (tests/chain_fakes.py) with a configurable RPC latency, so runs
+are offline and repeatable. To register on a local Hardhat node instead of the fake ETH service:
+
+    cd eth && npx hardhat node
+    cd eth && npx hardhat run deployments/deploy.js --network localhost
+    BENCH_ETH_RPC=http://127.0.0.1:8545 BENCH_ETH_CONTRACT=<address> BENCH_ETH_PRIVATE_KEY=<key> \\
+        python -m pytest tests --bench
+
+Every benchmark reports p50 / p95 / p99 latency, throughput and peak RSS (ru_maxrss of this process
+and of its reaped children, i.e. image pool workers once the app has shut down). Peak RSS only
+grows during a run; select one size with -k for per-size memory figures.
+"""
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from functools import partial
+from typing import Callable, List, Optional
+
+import numpy as np
+import pytest
+
+BACKEND_APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+sys.path.insert(0, BACKEND_APP)
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("bench", "PixelProof benchmarks")
+    group.addoption("--bench", action="store_true", help="Run the benchmarks (skipped otherwise)")
+    group.addoption("--bench-report", default=None, help="Write the benchmark results to this JSON file")
+    # The smallest size still holds the 128x128-bit watermark (about 1.05 MP at 4:3)
+    group.addoption("--bench-sizes", default="1.2,12,24,48", help="Image sizes in megapixels, comma-separated")
+    group.addoption("--bench-rounds", type=int, default=5, help="Timed rounds per micro-benchmark")
+    group.addoption("--bench-requests", type=int, default=32, help="Requests per end-to-end load test")
+    group.addoption("--bench-concurrency", type=int, default=8, help="Concurrent clients in load tests")
+    group.addoption("--bench-rpc-latency", type=float, default=50.0,
+                    help="Milliseconds each fake chain RPC call takes")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "bench: benchmark, run with --bench")
+    if config.getoption("--bench"):
+        # Read by the app's config module, which benchmark modules import after this hook
+        os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="pixelproof-bench-"))
+        os.environ.setdefault("UPLOAD_MIN_BYTES", "0")
+        os.environ.setdefault("JOB_POLL_INTERVAL", "0.05")
+        os.environ.setdefault("PROOF_BASE_URL", "http://bench/api/v1/proof")
+        if os.getenv("BENCH_ETH_RPC"):
+            os.environ.setdefault("ETH_CHAIN_ID", "31337")
+    config._bench_results = []
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--bench"):
+        return
+    skip = pytest.mark.skip(reason="benchmark, run with --bench")
+    for item in items:
+        if "bench" in item.keywords:
+            item.add_marker(skip)
+
+
+def pytest_generate_tests(metafunc):
+    if "megapixels" in metafunc.fixturenames:
+        sizes = [float(size) for size in metafunc.config.getoption("--bench-sizes").split(",") if size.strip()]
+        metafunc.parametrize("megapixels", sizes, ids=[f"{size:g}MP" for size in sizes])
+
+
+def peak_rss_mb() -> dict:
+    """Peak resident set size so far, in MiB (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit, 1),
+    }
+
+
+class BenchRecorder:
+    def __init__(self, results: list):
+        """Times benchmark bodies and collects their statistics for the end-of-run report."""
+        self.results = results
+
+    def add(self, name: str, samples: List[float], wall: Optional[float] = None, items: int = None, **params):
+        """
+        Record latency samples (seconds). Throughput is items per second of wall time; both default
+        to the sequential case (one item per sample, wall time = sum of the samples).
+        """
+        wall = sum(samples) if wall is None else wall
+        items = len(samples) if items is None else items
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        result = {
+            "name": name,
+            "params": params,
+            "n": len(samples),
+            "p50_ms": round(p50 * 1000, 2),
+            "p95_ms": round(p95 * 1000, 2),
+            "p99_ms": round(p99 * 1000, 2),
+            "throughput_per_s": round(items / wall, 2) if wall > 0 else None,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        self.results.append(result)
+        return result
+
+    def run(self, name: str, fn: Callable, *args, rounds: int, warmup: int = 1, **params):
+        """Call fn(*args) warmup + rounds times and record the timed rounds; returns the last result."""
+        for _ in range(warmup):
+            value = fn(*args)
+        samples = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            value = fn(*args)
+            samples.append(time.perf_counter() - started)
+        self.add(name, samples, **params)
+        return value
+
+
+@pytest.fixture(scope="session")
+def bench(request) -> BenchRecorder:
+    return BenchRecorder(request.config._bench_results)
+
+
+@pytest.fixture(scope="session")
+def bench_options(request) -> dict:
+    option = request.config.getoption
+    return {
+        "rounds": option("--bench-rounds"),
+        "requests": option("--bench-requests"),
+        "concurrency": option("--bench-concurrency"),
+        "rpc_latency": option("--bench-rpc-latency") / 1000,
+    }
+
+
+@pytest.fixture
+def chain_stand_ins(monkeypatch, bench_options):
+    """
+    Make the app build fake chain services (or, with BENCH_ETH_RPC, an EthService on a local Hardhat
+    node) when it starts; returns the app.
+    """
+    import main
+    from tests.chain_fakes import FakeEthService, FakeSolService
+
+    import config
+
+    latency = bench_options["rpc_latency"]
+    if os.getenv("BENCH_ETH_RPC"):
+        from services.EthService import EthService
+        monkeypatch.setattr(main, "create_eth_service", partial(
+            EthService, network_rpc=os.environ["BENCH_ETH_RPC"],
+            private_key=os.environ["BENCH_ETH_PRIVATE_KEY"], contract_address=os.environ["BENCH_ETH_CONTRACT"],
+            abi_path=os.path.join(BACKEND_APP, "contracts", "abi.json"), pool_size=config.RPC_POOL_SIZE,
+            receipt_timeout=config.ETH_RECEIPT_TIMEOUT, gas_cache_ttl=config.ETH_GAS_CACHE_TTL,
+            chain_id=config.ETH_CHAIN_ID))
+    else:
+        monkeypatch.setattr(main, "create_eth_service", partial(FakeEthService, latency=latency))
+    monkeypatch.setattr(main, "create_sol_service", partial(FakeSolService, latency=latency))
+    monkeypatch.setattr(config, "CHAINS", ["ETH", "SOL"])
+    return main.app
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    results = config._bench_results
+    if not results:
+        return
+    terminalreporter.section("benchmarks")
+    terminalreporter.write_line(f"{'benchmark':<52} {'n':>4} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} "
+                                f"{'per s':>9} {'RSS MiB':>9} {'children':>9}")
+    for r in results:
+        params = ",".join(f"{k}={v}" for k, v in r["params"].items())
+        label = f"{r['name']}[{params}]" if params else r["name"]
+        terminalreporter.write_line(
+            f"{label:<52} {r['n']:>4} {r['p50_ms']:>10} {r['p95_ms']:>10} {r['p99_ms']:>10} "
+            f"{r['throughput_per_s'] or '-':>9} {r['peak_rss_mb']['self']:>9} {r['peak_rss_mb']['children']:>9}")
+    path = config.getoption("--bench-report")
+    if path:
+        with open(path, "w") as f:
+            json.dump({"created": time.time(), "results": results}, f, indent=2)
+        terminalreporter.write_line(f"Benchmark report written to {path}")
@@ -0,0 +1,17 @@
+"""Deterministic test images."""
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+
+@lru_cache(maxsize=1)
+def synthetic_image(megapixels: float) -> np.ndarray:
+    """Deterministic 4:3 photo-like BGR image: smooth shapes plus sensor-like noise, so codecs work as on photos."""
+    width = int(round((megapixels * 1e6 * 4 / 3) ** 0.5))
+    height = int(round(width * 3 / 4))
+    rng = np.random.default_rng(int(megapixels * 1000))
+    coarse = rng.integers(0, 256, size=(12, 16, 3), dtype=np.uint8)
+    img = cv2.resize(coarse, (width, height), interpolation=cv2.INTER_CUBIC)
+    noise = rng.normal(0, 6, size=(height, width, 1))
+    return np.clip(img + noise, 0, 255).astype(np.uint8)
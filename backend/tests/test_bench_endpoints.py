@@ -0,0 +1,110 @@
+"""
+End-to-end load tests of /api/v1/upload (queued job, polled to completion) and
+/api/v1/workspace/decode, through the ASGI app with its real lifespan (image pool, job queue,
+registry index) and the chain stand-ins of conftest.py.
+"""
+import asyncio
+import itertools
+import time
+
+import cv2
+import httpx
+import pytest
+
+from tests.synthetic import synthetic_image
+
+pytestmark = pytest.mark.bench
+
+# Size of the uploaded images; the pipeline benchmarks cover the other sizes
+E2E_MEGAPIXELS = 2
+POLL_INTERVAL = 0.02
+# Wait before resending a request the image pool turned away (429), as a client would
+BUSY_RETRY_INTERVAL = 0.05
+
+# Every upload must be a new image, or it is rejected as already registered
+_variants = itertools.count()
+
+
+def unique_jpegs(count: int) -> list:
+    img = synthetic_image(E2E_MEGAPIXELS).copy()
+    jpegs = []
+    for _ in range(count):
+        # The variant number as a row of black / white 8x8 blocks, which survives JPEG compression
+        variant = next(_variants)
+        for bit in range(32):
+            img[:8, 8 * bit:8 * bit + 8] = 255 if variant >> bit & 1 else 0
+        jpegs.append(cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 95])[1].tobytes())
+    return jpegs
+
+
+async def upload_and_wait(client: httpx.AsyncClient, jpeg: bytes, chain: str) -> dict:
+    response = await client.post("/api/v1/upload", files={"file": ("bench.jpg", jpeg, "image/jpeg")},
+                                 data={"chain": chain, "key": "bench"})
+    assert response.status_code == 202, response.text
+    status_url = response.json()["statusUrl"]
+    while True:
+        status = (await client.get(status_url)).json()
+        if status["status"] == "done":
+            return (await client.get(status["resultUrl"])).json()
+        assert status["status"] != "failed", status["error"]
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+async def run_load(app, concurrency: int, requests: list) -> tuple:
+    """Run request(client) coroutine factories, concurrency at a time: (latencies, wall seconds)."""
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def timed(client, request):
+        async with slots:
+            started = time.perf_counter()
+            await request(client)
+            latencies.append(time.perf_counter() - started)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            # Untimed warm-up request, so pool start-up does not count
+            await requests[0](client)
+            started = time.perf_counter()
+            await asyncio.gather(*(timed(client, request) for request in requests[1:]))
+            wall = time.perf_counter() - started
+    return latencies, wall
+
+
+@pytest.mark.parametrize("chain", ["ETH", "SOL", "ETH,SOL"])
+def test_upload_load(bench, bench_options, chain_stand_ins, chain):
+    jpegs = unique_jpegs(bench_options["requests"] + 1)
+    requests = [lambda client, jpeg=jpeg: upload_and_wait(client, jpeg, chain) for jpeg in jpegs]
+    latencies, wall = asyncio.run(run_load(chain_stand_ins, bench_options["concurrency"], requests))
+    # Recorded after the app has shut down, so the image pool workers' peak RSS is included
+    bench.add("POST /upload (job)", latencies, wall=wall, chain=chain, mp=E2E_MEGAPIXELS,
+              concurrency=bench_options["concurrency"])
+
+
+def test_decode_load(bench, bench_options, chain_stand_ins):
+    embedded = []
+
+    async def prepare(client):
+        result = await upload_and_wait(client, unique_jpegs(1)[0], "ETH")
+        embedded.append((await client.get(result["embedded"]["url"])).content)
+
+    busy = 0
+
+    async def decode(client):
+        nonlocal busy
+        while True:
+            response = await client.post("/api/v1/workspace/decode",
+                                         files={"file": ("embedded.jpg", embedded[0], "image/jpeg")})
+            if response.status_code != 429:
+                break
+            busy += 1
+            await asyncio.sleep(BUSY_RETRY_INTERVAL)
+        assert response.status_code == 200, response.text
+        assert response.json()["chain"] == "ETH"
+
+    requests = [prepare] + [decode] * bench_options["requests"]
+    latencies, wall = asyncio.run(run_load(chain_stand_ins, bench_options["concurrency"], requests))
+    # Latencies include the retries of requests turned away with 429
+    bench.add("POST /workspace/decode", latencies, wall=wall, mp=E2E_MEGAPIXELS,
+              concurrency=bench_options["concurrency"], busy=busy)
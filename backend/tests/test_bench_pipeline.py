@@ -0,0 +1,87 @@
+"""Micro-benchmarks of the watermark pipeline stages, per image size (megapixels) and codec."""
+import itertools
+import os
+from functools import lru_cache, partial
+
+import numpy as np
+import pytest
+
+from utils.explorer import explorer_url, proof_url
+from utils.image_utils import decode_image_bgr, generate_qr_code, qr_watermark_bits
+from utils.pipeline import OUTPUT_FORMATS, WM_SHAPE, _encode, engine
+
+from tests.synthetic import synthetic_image
+
+pytestmark = pytest.mark.bench
+
+ETH_TX = "ab" * 32
+SOL_TX = "5" * 87
+URLS = {
+    "explorer": explorer_url("ETH", ETH_TX),
+    "proof": proof_url("http://localhost:8000/api/v1/proof", {"ETH": ETH_TX, "SOL": SOL_TX}),
+}
+
+
+def _encode_params(fmt: str) -> tuple:
+    ext, _, quality_flag = OUTPUT_FORMATS[fmt]
+    return ext, (quality_flag, 95) if quality_flag is not None else ()
+
+
+@lru_cache(maxsize=len(OUTPUT_FORMATS))
+def encoded_image(megapixels: float, fmt: str) -> bytes:
+    ext, params = _encode_params(fmt)
+    return _encode(synthetic_image(megapixels), ext, params).tobytes()
+
+
+@lru_cache(maxsize=1)
+def embedded_image(megapixels: float) -> np.ndarray:
+    return engine.embed(synthetic_image(megapixels), qr_watermark_bits(URLS["explorer"], WM_SHAPE))
+
+
+@pytest.mark.parametrize("url", list(URLS))
+def test_generate_qr_code(bench, bench_options, url):
+    # Cold: a new URL per call, as for every new registration
+    counter = itertools.count()
+    bench.run("generate_qr_code", lambda: generate_qr_code(f"{URLS[url]}&n={next(counter)}"),
+              rounds=bench_options["rounds"] * 20, url=url, cache="cold")
+    bench.run("generate_qr_code", generate_qr_code, URLS[url], rounds=bench_options["rounds"] * 20,
+              url=url, cache="warm")
+
+
+@pytest.mark.parametrize("fmt", list(OUTPUT_FORMATS))
+def test_decode(bench, bench_options, megapixels, fmt):
+    data = encoded_image(megapixels, fmt)
+    img = bench.run("decode_image_bgr", decode_image_bgr, data, rounds=bench_options["rounds"],
+                    mp=megapixels, fmt=fmt)
+    assert img.shape == synthetic_image(megapixels).shape
+
+
+def test_embed(bench, bench_options, megapixels):
+    img = synthetic_image(megapixels)
+    bits = qr_watermark_bits(URLS["explorer"], WM_SHAPE)
+    embedded = bench.run("engine.embed", engine.embed, img, bits, rounds=bench_options["rounds"], mp=megapixels)
+    assert embedded.shape == img.shape
+
+
+@pytest.mark.parametrize("threads", sorted({1, os.cpu_count() or 1}))
+def test_embed_tiled(bench, bench_options, megapixels, threads):
+    img = synthetic_image(megapixels)
+    bits = qr_watermark_bits(URLS["explorer"], WM_SHAPE)
+    embed = partial(engine.embed, stripe_pixels=1024 * 1024, threads=threads)
+    embedded = bench.run("engine.embed (tiled)", embed, img, bits, rounds=bench_options["rounds"],
+                         mp=megapixels, threads=threads)
+    assert np.array_equal(embedded, embedded_image(megapixels))
+
+
+def test_extract(bench, bench_options, megapixels):
+    bits = bench.run("engine.extract", engine.extract, embedded_image(megapixels), WM_SHAPE,
+                     rounds=bench_options["rounds"], mp=megapixels)
+    assert np.mean(bits != qr_watermark_bits(URLS["explorer"], WM_SHAPE)) < 0.05
+
+
+@pytest.mark.parametrize("fmt", list(OUTPUT_FORMATS))
+def test_encode(bench, bench_options, megapixels, fmt):
+    ext, params = _encode_params(fmt)
+    buf = bench.run("_encode", _encode, embedded_image(megapixels), ext, params,
+                    rounds=bench_options["rounds"], mp=megapixels, fmt=fmt)
+    assert buf.size > 0
@@ -0,0 +1,27 @@
+"""ImagePool timeouts: a job that hangs in its worker must not keep the worker."""
+import asyncio
+import time
+
+import pytest
+
+from services.ImagePool import ImagePool, JobTimeoutError
+
+
+def test_timed_out_job_frees_its_worker():
+    async def scenario():
+        pool = ImagePool(workers=1, max_queue=1, timeout=0.5)
+        await pool.start()
+        try:
+            with pytest.raises(JobTimeoutError):
+                await pool.run(time.sleep, 3600)
+            # The only worker was hung; the job after it runs on the replacement pool
+            assert await pool.run(abs, -1, timeout=30) == 1
+            for _ in range(100):
+                if pool.in_flight == 0:
+                    break
+                await asyncio.sleep(0.05)
+            assert pool.in_flight == 0
+        finally:
+            await pool.shutdown()
+
+    asyncio.run(scenario())
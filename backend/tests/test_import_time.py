@@ -0,0 +1,42 @@
+"""
+Start-up budget of the API process: importing main (what every uvicorn worker does first) must not
+load the chain SDKs or the image libraries, and must stay within IMPORT_TIME_BUDGET seconds.
+Image work imports them in the pool's workers, chain services when they are created.
+"""
+import json
+import os
+import subprocess
+import sys
+
+from tests.conftest import BACKEND_APP
+
+# Seconds for "import main" in a fresh interpreter, best of RUNS; about 0.5s at the time of writing,
+# most of it FastAPI itself
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "0.75"))
+RUNS = 3
+# Loaded lazily, per feature
+HEAVY_MODULES = ("web3", "eth_account", "solana", "solders", "cv2", "pyzbar", "qrcode", "sympy",
+                 "utils.pipeline", "utils.watermark")
+
+IMPORT_MAIN = """
+import json, sys, time
+started = time.perf_counter()
+import main
+print(json.dumps({"seconds": time.perf_counter() - started, "modules": sorted(sys.modules)}))
+"""
+
+
+def import_main() -> dict:
+    output = subprocess.run([sys.executable, "-c", IMPORT_MAIN], cwd=BACKEND_APP, capture_output=True,
+                            text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_main_does_not_import_heavy_modules():
+    loaded = set(import_main()["modules"])
+    assert not [module for module in HEAVY_MODULES if module in loaded]
+
+
+def test_import_time_budget():
+    seconds = min(import_main()["seconds"] for _ in range(RUNS))
+    assert seconds <= IMPORT_TIME_BUDGET, f"import main took {seconds:.3f}s (budget {IMPORT_TIME_BUDGET}s)"
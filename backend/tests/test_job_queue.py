@@ -0,0 +1,118 @@
+"""JobQueue idempotency keys: returned, re-run after a transient failure, never reused for another upload."""
+import asyncio
+
+from services.JobQueue import DONE, FAILED, JobFailed, JobQueue
+
+HASH_A = "aa" * 32
+HASH_B = "bb" * 32
+
+
+class Handler:
+    """Fails each job with the next code of failures, then succeeds."""
+
+    def __init__(self, *failures: int):
+        self.failures = list(failures)
+        self.runs = 0
+
+    async def __call__(self, queue: JobQueue, job) -> dict:
+        self.runs += 1
+        if self.failures:
+            raise JobFailed(self.failures.pop(0), "chain unavailable")
+        return {"imageHash": job.image_hash}
+
+
+async def settled(queue: JobQueue, job_id: str):
+    for _ in range(200):
+        job = await queue.get(job_id)
+        if job.status in (DONE, FAILED):
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def run_with_queue(tmp_path, handler, scenario):
+    async def main():
+        queue = JobQueue(str(tmp_path), handler, workers=1, poll_interval=0.01)
+        await queue.start()
+        try:
+            await scenario(queue)
+        finally:
+            await queue.close()
+
+    asyncio.run(main())
+
+
+def test_same_key_returns_the_job(tmp_path):
+    handler = Handler()
+
+    async def scenario(queue):
+        job, created = await queue.submit("key", "ETH", HASH_A, b"image")
+        assert created
+        await settled(queue, job.id)
+        again, created = await queue.submit("key", "ETH", HASH_A, b"image")
+        assert not created and again.id == job.id and again.status == DONE
+        assert await queue.result(job.id) == {"imageHash": HASH_A}
+
+    run_with_queue(tmp_path, handler, scenario)
+    assert handler.runs == 1
+
+
+def test_key_of_another_upload_leaves_the_job_alone(tmp_path):
+    # A job failed transiently, so its key could be re-run: not by a different image or chain
+    handler = Handler(503)
+
+    async def scenario(queue):
+        job, _ = await queue.submit("key", "ETH", HASH_A, b"image a")
+        failed = await settled(queue, job.id)
+        assert failed.error_code == 503
+
+        for chain, image_hash in (("ETH", HASH_B), ("SOL", HASH_A), ("ETH,SOL", HASH_A)):
+            other, created = await queue.submit("key", chain, image_hash, b"image b")
+            assert not created and other.id == job.id
+            assert (other.chain, other.image_hash) == ("ETH", HASH_A)
+        unchanged = await queue.get(job.id)
+        assert unchanged.status == FAILED and unchanged.source_path is None
+        assert unchanged.updated_at == failed.updated_at
+
+        # The same upload re-runs it, with the new copy of the image
+        rerun, created = await queue.submit("key", "ETH", HASH_A, b"image a")
+        assert created and rerun.id == job.id
+        assert read(rerun.source_path) == b"image a"
+        assert (await settled(queue, job.id)).status == DONE
+
+    run_with_queue(tmp_path, handler, scenario)
+    assert handler.runs == 2
+
+
+def test_permanent_failure_is_not_rerun(tmp_path):
+    handler = Handler(409)
+
+    async def scenario(queue):
+        job, _ = await queue.submit("key", "ETH", HASH_A, b"image")
+        await settled(queue, job.id)
+        again, created = await queue.submit("key", "ETH", HASH_A, b"image")
+        assert not created and again.status == FAILED and again.error_code == 409
+
+    run_with_queue(tmp_path, handler, scenario)
+    assert handler.runs == 1
+
+
+def test_queued_job_source_is_kept_for_a_mismatched_key(tmp_path):
+    class Blocking:
+        """Keeps the job running."""
+
+        async def __call__(self, queue, job):
+            await asyncio.sleep(3600)
+
+    async def scenario(queue):
+        job, _ = await queue.submit("key", "ETH", HASH_A, b"image a")
+        other, created = await queue.submit("key", "ETH", HASH_B, b"image b")
+        assert not created and other.id == job.id
+        assert read(job.source_path) == b"image a"
+
+    run_with_queue(tmp_path, Blocking(), scenario)
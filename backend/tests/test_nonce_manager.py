@@ -0,0 +1,85 @@
+"""NonceManager: local nonce allocation, reuse of unsent nonces and resynchronization with the chain."""
+import threading
+
+from services.NonceManager import NonceManager
+
+
+class Chain:
+    """Pending transaction count of the account, as the node reports it."""
+
+    def __init__(self, nonce: int):
+        self.nonce = nonce
+        self.reads = 0
+
+    def __call__(self) -> int:
+        self.reads += 1
+        return self.nonce
+
+
+def test_allocates_consecutive_nonces_from_the_chain():
+    chain = Chain(5)
+    nonces = NonceManager(chain)
+    assert [nonces.allocate() for _ in range(3)] == [5, 6, 7]
+    assert chain.reads == 1
+
+
+def test_released_nonce_is_reused_before_a_fresh_one():
+    nonces = NonceManager(Chain(5))
+    first, second, third = (nonces.allocate() for _ in range(3))
+    nonces.sent(first)
+    nonces.release(third)
+    nonces.release(second)
+    # Lowest first, so no gap is left behind the transactions already sent
+    assert [nonces.allocate() for _ in range(3)] == [6, 7, 8]
+
+
+def test_release_after_sent_or_discard_is_ignored():
+    nonces = NonceManager(Chain(0))
+    sent, discarded = nonces.allocate(), nonces.allocate()
+    nonces.sent(sent)
+    nonces.discard(discarded)
+    nonces.release(sent)
+    nonces.release(discarded)
+    assert nonces.allocate() == 2
+
+
+def test_resync_closes_a_gap_left_by_dropped_transactions():
+    chain = Chain(5)
+    nonces = NonceManager(chain)
+    for _ in range(3):
+        nonces.sent(nonces.allocate())
+    # 6 and 7 were dropped by the mempool; nothing is being sent, so they are handed out again
+    chain.nonce = 6
+    nonces.resync()
+    assert nonces.allocate() == 6
+
+
+def test_resync_jumps_ahead_while_sending():
+    chain = Chain(5)
+    nonces = NonceManager(chain)
+    nonces.allocate()  # being sent
+    unsent = nonces.allocate()
+    nonces.release(unsent)
+    # Someone else sent from the account: the released nonce is used up, ours must not go back
+    chain.nonce = 20
+    nonces.resync()
+    assert nonces.allocate() == 20
+    chain.nonce = 3
+    nonces.resync()
+    assert nonces.allocate() == 21
+
+
+def test_concurrent_allocations_are_unique():
+    nonces = NonceManager(Chain(0))
+    allocated = []
+
+    def allocate():
+        for _ in range(200):
+            allocated.append(nonces.allocate())
+
+    threads = [threading.Thread(target=allocate) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(allocated) == list(range(1600))
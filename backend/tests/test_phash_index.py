@@ -0,0 +1,54 @@
+"""MultiIndexHash search against a linear scan, including while a rebuild is running."""
+import numpy as np
+
+from utils.phash import MultiIndexHash
+
+RADIUS = 10
+
+
+def brute_force(ids: list, hashes: list, value: int, radius: int) -> set:
+    return {(i, bin(h ^ value).count("1")) for i, h in zip(ids, hashes) if bin(h ^ value).count("1") <= radius}
+
+
+def near(rng: np.random.Generator, value: int, flips: int) -> int:
+    for bit in rng.choice(64, size=flips, replace=False):
+        value ^= 1 << int(bit)
+    return value
+
+
+def test_search_matches_linear_scan():
+    rng = np.random.default_rng(0)
+    bases = [int(v) for v in rng.integers(0, 2 ** 63, 50, dtype=np.int64)]
+    hashes = [near(rng, bases[i % len(bases)], int(rng.integers(0, 16))) for i in range(3000)]
+    ids = list(range(1, len(hashes) + 1))
+
+    index = MultiIndexHash(rebuild_threshold=256)
+    index.add_many(np.array(ids[:1000]), np.array(hashes[:1000], dtype=np.uint64))
+    for item_id, value in zip(ids[1000:], hashes[1000:]):
+        if index.add(item_id, value):
+            index.rebuild()
+    assert len(index) == len(hashes)
+
+    for value in bases[:10]:
+        found = index.search(value, RADIUS, limit=len(hashes))
+        assert set(found) == brute_force(ids, hashes, value, RADIUS)
+        assert [d for _, d in found] == sorted(d for _, d in found)
+
+
+def test_search_during_rebuild():
+    rng = np.random.default_rng(1)
+    hashes = [int(v) for v in rng.integers(0, 2 ** 63, 40, dtype=np.int64)]
+    index = MultiIndexHash(rebuild_threshold=16)
+    due = [index.add(i, value) for i, value in enumerate(hashes[:16])]
+    assert due == [False] * 15 + [True]
+
+    build = index.start_rebuild()
+    # Added while the build runs: still found, and no second rebuild is asked for
+    assert not any(index.add(i, value) for i, value in enumerate(hashes[16:], start=16))
+    build.run()
+    assert index.search(hashes[3], 0) == [(3, 0)]
+    index.finish_rebuild(build)
+
+    assert len(index) == len(hashes)
+    for i, value in enumerate(hashes):
+        assert index.search(value, 0) == [(i, 0)]
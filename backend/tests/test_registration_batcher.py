@@ -0,0 +1,95 @@
+"""RegistrationBatcher: one transaction per window, one registration per hash."""
+import asyncio
+import hashlib
+
+from services.RegistrationBatcher import DUPLICATE, REGISTERED, RegistrationBatcher
+
+from tests.chain_fakes import FakeEthService
+
+
+def image_hash(n: int) -> bytes:
+    return hashlib.sha256(str(n).encode()).digest()
+
+
+class Recording(FakeEthService):
+    def __init__(self, **kwargs):
+        super().__init__(latency=0, **kwargs)
+        self.batches = []
+
+    def register_batch(self, image_hashes):
+        self.batches.append(list(image_hashes))
+        return super().register_batch(image_hashes)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_window_shares_one_transaction():
+    chain = Recording()
+
+    async def scenario():
+        batcher = RegistrationBatcher(chain.register_batch, window=0.05, max_size=8)
+        return await asyncio.gather(*(batcher.submit(image_hash(n)) for n in range(5)))
+
+    results = run(scenario())
+    assert chain.batches == [[image_hash(n) for n in range(5)]]
+    assert {r.status for r in results} == {REGISTERED}
+    assert len({r.tx_hash for r in results}) == 1
+
+
+def test_max_size_splits_batches():
+    chain = Recording()
+
+    async def scenario():
+        batcher = RegistrationBatcher(chain.register_batch, window=0.05, max_size=2)
+        results = await asyncio.gather(*(batcher.submit(image_hash(n)) for n in range(5)))
+        await batcher.close()
+        return results
+
+    assert {r.status for r in run(scenario())} == {REGISTERED}
+    assert [len(batch) for batch in chain.batches] == [2, 2, 1]
+
+
+def test_same_hash_within_a_window_is_a_duplicate():
+    chain = Recording()
+
+    async def scenario():
+        batcher = RegistrationBatcher(chain.register_batch, window=0.05, max_size=8)
+        first = await asyncio.gather(batcher.submit(image_hash(1)), batcher.submit(image_hash(1)),
+                                     batcher.submit(image_hash(2)))
+        later = await batcher.submit(image_hash(1))
+        return first, later
+
+    (first, again, other), later = run(scenario())
+    # Registered once, in one transaction with the other hash
+    assert chain.batches[0] == [image_hash(1), image_hash(2)]
+    assert first.status == REGISTERED and other.status == REGISTERED
+    assert again.status == DUPLICATE and again.tx_hash == ""
+    assert later.status == DUPLICATE
+
+
+def test_failed_batch_fails_every_waiter():
+    def register_batch(image_hashes):
+        raise ConnectionError("node unreachable")
+
+    async def scenario():
+        batcher = RegistrationBatcher(register_batch, window=0.01, max_size=8)
+        return await asyncio.gather(batcher.submit(image_hash(1)), batcher.submit(image_hash(2)),
+                                    return_exceptions=True)
+
+    assert all(isinstance(result, ConnectionError) for result in run(scenario()))
+
+
+def test_close_sends_what_is_queued():
+    chain = Recording()
+
+    async def scenario():
+        batcher = RegistrationBatcher(chain.register_batch, window=60, max_size=8)
+        waiter = asyncio.create_task(batcher.submit(image_hash(1)))
+        await asyncio.sleep(0)
+        await batcher.close()
+        return await asyncio.wait_for(waiter, 1)
+
+    assert run(scenario()).status == REGISTERED
+
@@ -0,0 +1,91 @@
+"""Duplicate pre-check of uploads: the Bloom filter and RegistryIndex.is_registered behind the 409."""
+import asyncio
+import hashlib
+import os
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from routers.images import reject_if_registered
+from services.RegistryIndex import RegistryIndex
+from utils.bloom import BloomFilter
+
+
+def key(n: int) -> bytes:
+    return hashlib.sha256(str(n).encode()).digest()
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(10_000, 0.01)
+    for n in range(10_000):
+        bloom.add(key(n))
+    assert all(key(n) in bloom for n in range(10_000))
+    assert bloom.count == 10_000
+
+
+def test_bloom_filter_false_positive_rate():
+    bloom = BloomFilter(10_000, 0.01)
+    for n in range(10_000):
+        bloom.add(key(n))
+    false_positives = sum(key(n) in bloom for n in range(10_000, 30_000))
+    assert false_positives / 20_000 < 0.02
+
+
+def test_is_registered_and_precheck(tmp_path):
+    async def scenario():
+        index = RegistryIndex(os.path.join(tmp_path, "registry.db"), bloom_capacity=1000)
+        await index.start()
+        try:
+            registered, new = key(1), key(2)
+            await index.record("ETH", registered.hex(), "0xtx")
+            assert await index.is_registered("ETH", registered.hex())
+            assert not await index.is_registered("SOL", registered.hex())
+            assert not await index.is_registered("ETH", new.hex())
+
+            state = SimpleNamespace(registry_index=index)
+            with pytest.raises(HTTPException) as rejected:
+                await reject_if_registered(state, ["ETH"], registered)
+            assert rejected.value.status_code == 409
+            # Only rejected when registered on every requested chain
+            await reject_if_registered(state, ["ETH", "SOL"], registered)
+            await reject_if_registered(state, ["ETH"], new)
+        finally:
+            index.close()
+
+    asyncio.run(scenario())
+
+
+def test_bloom_miss_skips_the_database(tmp_path, monkeypatch):
+    async def scenario():
+        index = RegistryIndex(os.path.join(tmp_path, "registry.db"), bloom_capacity=1000)
+        await index.start()
+        try:
+            await index.record("ETH", key(1).hex())
+            monkeypatch.setattr(index, "_is_known", lambda *args: pytest.fail("database read for a Bloom miss"))
+            assert not await index.is_registered("ETH", key(2).hex())
+        finally:
+            index.close()
+
+    asyncio.run(scenario())
+
+
+def test_bloom_filter_is_rebuilt_on_start(tmp_path):
+    path = os.path.join(tmp_path, "registry.db")
+
+    async def record():
+        index = RegistryIndex(path, bloom_capacity=1000)
+        await index.start()
+        await index.record("ETH", key(1).hex())
+        index.close()
+
+    async def check():
+        index = RegistryIndex(path, bloom_capacity=1000)
+        await index.start()
+        try:
+            return await index.is_registered("ETH", key(1).hex())
+        finally:
+            index.close()
+
+    asyncio.run(record())
+    assert asyncio.run(check())
@@ -0,0 +1,97 @@
+"""RegistryIndex.sync_eth: batched backfill, incremental sync and reorg rollback to a checkpoint."""
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+from services.RegistryIndex import RegistryIndex
+
+from tests.chain_fakes import FakeEthService
+
+
+def image_hash(n: int) -> bytes:
+    return hashlib.sha256(str(n).encode()).digest()
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = RegistryIndex(os.path.join(tmp_path, "registry.db"), eth_start_block=1, eth_batch_blocks=2,
+                          eth_reorg_depth=8, bloom_capacity=1000)
+    asyncio.run(index.start())
+    yield index
+    index.close()
+
+
+def indexed(index: RegistryIndex) -> dict:
+    rows = index._execute("SELECT hash, block_number, tx_hash FROM registrations WHERE chain = 'ETH'")
+    return {row["hash"]: (row["block_number"], row["tx_hash"]) for row in rows}
+
+
+def checkpoints(index: RegistryIndex) -> list:
+    return sorted(number for number, _ in index._eth_checkpoints())
+
+
+def register(chain: FakeEthService, *numbers: int):
+    for n in numbers:
+        chain.register_batch([image_hash(n)])
+
+
+def test_backfill_then_incremental(index):
+    chain = FakeEthService(latency=0)
+    register(chain, 1, 2, 3, 4, 5)
+    index.sync_eth(chain)
+    assert set(indexed(index)) == {image_hash(n).hex() for n in range(1, 6)}
+    # Batches of 2 blocks: a checkpoint after each
+    assert checkpoints(index) == [2, 4, 5]
+
+    register(chain, 6)
+    index.sync_eth(chain)
+    assert image_hash(6).hex() in indexed(index)
+    assert checkpoints(index) == [2, 4, 5, 6]
+
+
+def test_reorg_rolls_back_to_the_last_checkpoint_on_chain(index):
+    chain = FakeEthService(latency=0)
+    register(chain, 1, 2, 3, 4, 5)
+    index.sync_eth(chain)
+
+    # Blocks 4 and 5 are replaced by blocks holding other registrations
+    chain.reorg(3)
+    register(chain, 40, 50)
+    index.sync_eth(chain)
+
+    hashes = indexed(index)
+    assert set(hashes) == {image_hash(n).hex() for n in (1, 2, 3, 40, 50)}
+    assert hashes[image_hash(40).hex()][0] == 4
+    # Rolled back to checkpoint 2 (4 no longer matches) and indexed again from block 3
+    assert checkpoints(index) == [2, 4, 5]
+    assert all(chain.block_hash(number) == block_hash for number, block_hash in index._eth_checkpoints())
+    # The dropped hashes may still be in the Bloom filter; the database answers for them
+    assert not asyncio.run(index.is_registered("ETH", image_hash(4).hex()))
+    assert asyncio.run(index.is_registered("ETH", image_hash(50).hex()))
+
+
+def test_reorg_deeper_than_every_checkpoint_reindexes_everything(index):
+    chain = FakeEthService(latency=0)
+    register(chain, 1, 2, 3)
+    index.sync_eth(chain)
+
+    chain.reorg(0)
+    register(chain, 10)
+    index.sync_eth(chain)
+    assert set(indexed(index)) == {image_hash(10).hex()}
+    assert checkpoints(index) == [1]
+
+
+def test_checkpoints_are_limited_to_the_reorg_depth(tmp_path):
+    index = RegistryIndex(os.path.join(tmp_path, "registry.db"), eth_start_block=1, eth_batch_blocks=1,
+                          eth_reorg_depth=3, bloom_capacity=1000)
+    asyncio.run(index.start())
+    try:
+        chain = FakeEthService(latency=0)
+        register(chain, *range(1, 8))
+        index.sync_eth(chain)
+        assert checkpoints(index) == [5, 6, 7]
+    finally:
+        index.close()
@@ -0,0 +1,43 @@
+"""Tiled (striped) embed / extract must give exactly the whole-image result."""
+import numpy as np
+import pytest
+
+from utils.watermark import WatermarkEngine
+
+from tests.synthetic import synthetic_image
+
+WM_SIZE = 64 * 64
+
+engine = WatermarkEngine()
+bits = np.random.default_rng(0).integers(0, 2, WM_SIZE).astype(bool)
+
+
+# Odd heights / widths put the zero padding row / column inside the last stripe's blocks
+@pytest.fixture(params=[(0, 0), (1, 0), (3, 5)], ids=["even", "odd-height", "odd-both"])
+def image(request) -> np.ndarray:
+    img = synthetic_image(0.5)
+    return np.ascontiguousarray(img[:img.shape[0] - request.param[0], :img.shape[1] - request.param[1]])
+
+
+@pytest.mark.parametrize("stripe_pixels, threads", [(1, 1), (50_000, 3), (10 ** 9, 2)],
+                         ids=["one-block-row", "several", "single-stripe"])
+def test_tiled_embed_extract_match(image, stripe_pixels, threads):
+    embedded = engine.embed(image, bits)
+    tiled = engine.embed(image, bits, stripe_pixels=stripe_pixels, threads=threads)
+    assert np.array_equal(tiled, embedded)
+
+    in_place = image.copy()
+    engine.embed(in_place, bits, stripe_pixels=stripe_pixels, threads=threads, out=in_place)
+    assert np.array_equal(in_place, embedded)
+
+    assert np.array_equal(engine.extract_avg(embedded, WM_SIZE, stripe_pixels, threads),
+                          engine.extract_avg(embedded, WM_SIZE))
+
+
+def test_stripes_cover_the_image():
+    shape = (1003, 777, 3)
+    stripes = engine.stripes(shape, 100_000)
+    rows, _ = engine.block_grid(shape)
+    assert sum(count for _, count, _, _ in stripes) == rows
+    assert [top for _, _, top, _ in stripes[1:]] == [bottom for _, _, _, bottom in stripes[:-1]]
+    assert stripes[0][2] == 0 and stripes[-1][3] == shape[0]
@@ -0,0 +1,69 @@
+"""WatermarkEngine round trip, and compatibility with the blind_watermark package it replaces."""
+import multiprocessing
+
+import cv2
+import numpy as np
+import pytest
+
+from utils.watermark import WatermarkEngine
+
+from tests.synthetic import synthetic_image
+
+WM_SHAPE = (64, 64)
+WM_SIZE = WM_SHAPE[0] * WM_SHAPE[1]
+# Bit errors tolerated: a few blocks sit where clipping to 0..255 and rounding to uint8 undo the mark
+MAX_BER = 0.005
+MAX_BER_JPEG = 0.01
+
+# block_values(image, BLOCK_IDS) of the unmarked test image, as read by blind_watermark 0.4.4
+# (WaterMarkCore.block_get_wm_slow on each block, one row per YUV channel)
+BLOCK_IDS = np.arange(0, 7752, 997)
+REFERENCE_BLOCK_VALUES = [
+    [0.25, 1.0, 0.75, 1.0, 0.0, 0.0, 1.0, 1.0],
+    [0.75, 0.0, 0.0, 1.0, 1.0, 0.0, 0.75, 0.0],
+    [0.75, 0.0, 0.75, 0.0, 0.75, 0.0, 1.0, 0.0],
+]
+
+engine = WatermarkEngine()
+bits = np.random.default_rng(0).integers(0, 2, WM_SIZE).astype(bool)
+image = synthetic_image(0.5)
+
+
+def bit_errors(img: np.ndarray) -> float:
+    return float(np.mean(engine.extract(img, WM_SHAPE) != bits))
+
+
+def jpeg(img: np.ndarray, quality: int) -> np.ndarray:
+    data = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1]
+    return cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+
+def test_embed_extract_round_trip():
+    embedded = engine.embed(image, bits)
+    assert embedded.dtype == np.uint8 and embedded.shape == image.shape
+    assert bit_errors(embedded) <= MAX_BER
+    assert bit_errors(jpeg(embedded, 95)) <= MAX_BER_JPEG
+    assert engine.bit_error_rate(embedded, bits) <= MAX_BER
+
+
+def test_block_values_reference():
+    assert engine.block_values(image, BLOCK_IDS).tolist() == REFERENCE_BLOCK_VALUES
+    # The sparse read (only the pixels under the blocks) and the whole-image read agree
+    assert engine.block_values(image)[:, BLOCK_IDS].tolist() == REFERENCE_BLOCK_VALUES
+
+
+def test_blind_watermark_compatibility(monkeypatch):
+    # Not a dependency any more; checked where it is installed. Importing it sets the global
+    # multiprocessing start method (an error once a process pool ran); its "common" mode needs none.
+    monkeypatch.setattr(multiprocessing, "set_start_method", lambda *args, **kwargs: None)
+    blind_watermark = pytest.importorskip("blind_watermark")
+
+    reader = blind_watermark.WaterMark(password_wm=1, password_img=1, processes=1)
+    read = reader.extract(embed_img=engine.embed(image, bits), wm_shape=WM_SIZE, mode="bit")
+    assert np.mean(np.asarray(read).astype(bool) != bits) <= MAX_BER
+
+    writer = blind_watermark.WaterMark(password_wm=1, password_img=1, processes=1)
+    writer.read_img(img=image)
+    writer.read_wm(bits, mode="bit")
+    embedded = np.round(writer.embed()).astype(np.uint8)
+    assert bit_errors(embedded) <= MAX_BER
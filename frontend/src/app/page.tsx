@@ -10,6 +10,7 @@ import BottomSection from "@/components/BottomSection";
 import DisplaySection from "@/components/DisplaySection";
 //hooks
 import { useLocalSettings } from "@/hooks/useLocalSettings";
+import { API_BASE, uploadAndWait } from "@/lib/jobs";
 
 export default function HomePage() {
   const router = useRouter();
@@ -71,21 +72,11 @@ export default function HomePage() {
     formData.append("key", walletKey);
 
     try {
-      const response = await fetch("http://localhost:8000/api/v1/upload", {
-        method: "POST",
-        body: formData,
-      });
-
-      if (!response.ok) {
-        console.error("Upload failed:", response);
-        throw new Error("Upload failed. You have already registered this image.");
-      }
-
-      const data = await response.json();
-      const embeddedBase64 = `data:${data.embedded.type};base64,${data.embedded.data}`;
-      const extractedBase64 = `data:${data.extracted.type};base64,${data.extracted.data}`;
-      setEmbeddedImg(embeddedBase64);
-      setExtractedImg(extractedBase64);
+      // The upload is processed as a background job; wait for its result
+      const data = await uploadAndWait(formData);
+      // Result images are served by URL from the backend's blob store
+      setEmbeddedImg(`${API_BASE}${data.embedded.url}`);
+      setExtractedImg(`${API_BASE}${data.extracted.url}`);
 
       if (data.txHash) {
         setTxHash(data.txHash);
@@ -8,6 +8,8 @@ export default function DecodePage() {
   const [selectedFile, setSelectedFile] = useState<File | null>(null);
   const [preview, setPreview] = useState<string>("");
   const [extractedImageUrl, setExtractedImageUrl] = useState<string>("");
+  const [txHash, setTxHash] = useState<string>("");
+  const [link, setLink] = useState<string>("");
   const [error, setError] = useState<string>("");
   const [loading, setLoading] = useState<boolean>(false);
 
@@ -17,6 +19,8 @@ export default function DecodePage() {
     setSelectedFile(file);
     setPreview(URL.createObjectURL(file));
     setExtractedImageUrl("");
+    setTxHash("");
+    setLink("");
     setError("");
   };
 
@@ -26,6 +30,8 @@ export default function DecodePage() {
     setLoading(true);
     setError("");
     setExtractedImageUrl("");
+    setTxHash("");
+    setLink("");
 
     const formData = new FormData();
     formData.append("file", selectedFile);
@@ -46,6 +52,9 @@ export default function DecodePage() {
       if (extracted && extracted.data && extracted.type) {
         const imageUrl = `data:${extracted.type};base64,${extracted.data}`;
         setExtractedImageUrl(imageUrl);
+        // Explorer link read from the QR code by the server, when it could be decoded
+        setTxHash(data.txHash || "");
+        setLink(data.url || "");
       } else {
         throw new Error("Invalid response format");
       }
@@ -77,6 +86,8 @@ export default function DecodePage() {
         mode="decode"
         preview={preview} // Your uploaded image preview URL
         extractedImg={extractedImageUrl}
+        txHash={txHash}
+        link={link}
       />
       </div>
     </main>
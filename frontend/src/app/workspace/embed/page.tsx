@@ -5,11 +5,14 @@ import UploadSection from "@/components/UploadSection";
 import SettingsSection from "@/components/SettingsSection";
 import DisplaySection from "@/components/DisplaySection";
 import { useLocalSettings } from "@/hooks/useLocalSettings";
+import { API_BASE, uploadAndWait } from "@/lib/jobs";
 
 export default function WorkspacePage() {
   const [selectedFile, setSelectedFile] = useState<File | null>(null);
   const [preview, setPreview] = useState<string>("");
   const [txHash, setTxHash] = useState<string>("");
+  // Chain of txHash (the first successful one when registering on several)
+  const [txChain, setTxChain] = useState<string>("");
   const [imageHash, setImageHash] = useState<string>("");
   const [error, setError] = useState<string>("");
   const [loading, setLoading] = useState<boolean>(false);
@@ -51,21 +54,13 @@ export default function WorkspacePage() {
     formData.append("key", walletKey);
 
     try {
-      const response = await fetch("http://localhost:8000/api/v1/upload", {
-        method: "POST",
-        body: formData,
-      });
-
-      if (!response.ok) {
-        throw new Error("Upload failed. You have already registered this image.");
-      }
-
-      const data = await response.json();
-      const embeddedBase64 = `data:${data.embedded.type};base64,${data.embedded.data}`;
-      const extractedBase64 = `data:${data.extracted.type};base64,${data.extracted.data}`;
-      setEmbeddedImg(embeddedBase64);
-      setExtractedImg(extractedBase64);
+      // The upload is processed as a background job; wait for its result
+      const data = await uploadAndWait(formData);
+      // Result images are served by URL from the backend's blob store
+      setEmbeddedImg(`${API_BASE}${data.embedded.url}`);
+      setExtractedImg(`${API_BASE}${data.extracted.url}`);
       if (data.txHash) setTxHash(data.txHash);
+      if (data.chain) setTxChain(data.chain);
       if (data.imageHash) setImageHash(data.imageHash);
       alert(`File uploaded successfully: ${selectedFile.name}`);
     } catch (err) {
@@ -101,7 +96,7 @@ export default function WorkspacePage() {
         <DisplaySection
           mode="embed"
           preview={preview}
-          selectedChain={selectedChain}
+          selectedChain={txChain || selectedChain}
           embeddedImg={embeddedImg}
           extractedImg={extractedImg}
           txHash={txHash}
@@ -6,7 +6,7 @@ type Props = {
   extractedImg?: string;
   txHash?: string;
   imageHash?: string;
-  link?: string; // Optional, retained for potential use elsewhere
+  link?: string; // Explorer link decoded from the watermark (decode mode)
 };
 
 export default function DisplaySection({ mode, preview, selectedChain, embeddedImg, extractedImg, txHash, imageHash, link }: Props) {
@@ -28,8 +28,7 @@ export default function DisplaySection({ mode, preview, selectedChain, embeddedI
               <p className="font-semibold text-gray-800">Embedded Image:</p>
               <img src={embeddedImg} alt="Embedded" className="max-w-full max-h-[400px] rounded shadow mt-2" />
               <a
-                href={embeddedImg}
-                download="embedded.jpg"
+                href={`${embeddedImg}?download=embedded`}
                 className="mt-2 inline-block bg-indigo-600 text-white px-4 py-2 rounded hover:bg-indigo-700 transition"
               >
                 ⬇️ Download Embedded Image
@@ -41,8 +40,7 @@ export default function DisplaySection({ mode, preview, selectedChain, embeddedI
               <p className="font-semibold text-gray-800">Extracted Watermark:</p>
               <img src={extractedImg} alt="Extracted" className="max-w-full max-h-[400px] rounded shadow mt-2" />
               <a
-                href={extractedImg}
-                download="watermark.jpg"
+                href={`${extractedImg}?download=watermark`}
                 className="mt-2 inline-block bg-indigo-600 text-white px-4 py-2 rounded hover:bg-indigo-700 transition"
               >
                 ⬇️ Download Watermark
@@ -82,6 +80,14 @@ export default function DisplaySection({ mode, preview, selectedChain, embeddedI
             alt="Extracted QR Code"
             className="max-w-full max-h-[400px] rounded shadow mt-2"
           />
+          {link && (
+            <p className="text-sm text-gray-700 mt-2">
+              Transaction:{" "}
+              <a href={link} target="_blank" className="text-indigo-600 hover:underline">
+                {txHash || link}
+              </a>
+            </p>
+          )}
         </div>
       )}
     </div>
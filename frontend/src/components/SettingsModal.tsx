@@ -39,6 +39,7 @@ export default function SettingsModal({
           <option value="ETH">Ethereum (ETH)</option>
           <option value="SUI">Sui (SUI)</option>
           <option value="SOL">Solana (SOL)</option>
+          <option value="ETH,SOL">Ethereum + Solana</option>
         </select>
 
         <label className="block mb-2 text-sm font-medium text-gray-700">
@@ -0,0 +1,39 @@
+export const API_BASE = "http://localhost:8000";
+const POLL_INTERVAL_MS = 1000;
+
+type JobStatus = {
+  jobId: string;
+  status: "queued" | "running" | "done" | "failed";
+  stage: string | null;
+  error: { code: number; detail: string } | null;
+  resultUrl?: string;
+};
+
+// Queue an upload and poll its job until it finishes; resolves with the job's result
+export async function uploadAndWait(formData: FormData) {
+  const response = await fetch(`${API_BASE}/api/v1/upload`, {
+    method: "POST",
+    body: formData,
+  });
+  if (!response.ok) {
+    const body = await response.json().catch(() => null);
+    throw new Error(body?.detail ?? "Upload failed.");
+  }
+  const { statusUrl } = await response.json();
+
+  for (;;) {
+    const statusResponse = await fetch(`${API_BASE}${statusUrl}`);
+    if (!statusResponse.ok) throw new Error("Could not get the upload status.");
+    const job: JobStatus = await statusResponse.json();
+
+    if (job.status === "failed") {
+      throw new Error(job.error?.detail ?? "Upload failed.");
+    }
+    if (job.status === "done" && job.resultUrl) {
+      const resultResponse = await fetch(`${API_BASE}${job.resultUrl}`);
+      if (!resultResponse.ok) throw new Error("Could not get the upload result.");
+      return resultResponse.json();
+    }
+    await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+  }
+}